@@ -0,0 +1,670 @@
+"""
+=== Module Description ===
+This module contains small benchmarks for the tree code. Each benchmark
+builds its own synthetic data in a temporary folder (or in memory), so it can
+be run on any computer:
+
+    python benchmark.py
+"""
+import fnmatch
+import math
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from compact_tree import CompactTree
+from diff import diff_trees
+from group_views import FileTable, GROUP_VIEWS
+from journal import TreeJournal
+from listings import tree_from_find
+from scanner import DirectoryScanner, InodeSet, ScanRules
+from search import SearchIndex
+from snapshot import open_snapshot, save_snapshot
+from topk import TopIndex
+from tree_data import AbstractTree, FileSystemTree
+
+
+def make_sample_folder(root, folders=20, files=50, file_size=100):
+    """Fill the folder <root> with <folders> sub-folders, each containing
+    <files> files of <file_size> bytes.
+
+    @type root: str
+    @type folders: int
+    @type files: int
+    @type file_size: int
+    @rtype: None
+    """
+    for i in range(folders):
+        folder = os.path.join(root, 'folder{}'.format(i))
+        os.mkdir(folder)
+        for j in range(files):
+            with open(os.path.join(folder, 'file{}.txt'.format(j)), 'wb') as f:
+                f.write(b'x' * file_size)
+
+
+def bench_scan(path):
+    """Scan <path> with FileSystemTree and print the time taken and the
+    number of system calls made per entry.
+
+    The figure for the old constructor, which called os.path.isdir,
+    os.path.getsize and os.listdir separately, is printed for comparison.
+
+    @type path: str
+    @rtype: None
+    """
+    scanner = DirectoryScanner()
+    start = time.perf_counter()
+    FileSystemTree(path, scanner)
+    elapsed = time.perf_counter() - start
+
+    stats = scanner.stats
+    files = stats.entries - stats.listings
+    # isdir on every entry, getsize on every file, listdir on every folder.
+    old_syscalls = stats.entries + files + stats.listings
+    print('scan: {:.3f}s, {}'.format(elapsed, stats))
+    print('old constructor: {:.2f} syscalls per entry'.format(
+        old_syscalls / stats.entries))
+
+
+def bench_rules(path, rules):
+    """Scan <path> with and without <rules>, and print the system calls
+    made by each scan.
+
+    @type path: str
+    @type rules: ScanRules
+    @rtype: None
+    """
+    for label, scanner in [('without rules', DirectoryScanner()),
+                           ('with rules', DirectoryScanner(rules=rules))]:
+        start = time.perf_counter()
+        FileSystemTree(path, scanner)
+        elapsed = time.perf_counter() - start
+        print('{}: {:.3f}s, {} syscalls, {}'.format(
+            label, elapsed, scanner.stats.syscalls(), scanner.stats))
+
+
+def bench_listing(path, folders=1000, files=1000):
+    """Load a find listing of <folders> folders of <files> files each, and
+    scan the folder <path>, and print the time taken per entry by each.
+
+    @type path: str
+    @type folders: int
+    @type files: int
+    @rtype: None
+    """
+    listing_path = os.path.join(path, 'listing.txt')
+    with open(listing_path, 'w') as f:
+        f.write('4096 /data\n')
+        for i in range(folders):
+            f.write('4096 /data/folder{}\n'.format(i))
+            for j in range(files):
+                f.write('{} /data/folder{}/file{}.txt\n'.format(j, i, j))
+
+    start = time.perf_counter()
+    tree_from_find(listing_path)
+    elapsed = time.perf_counter() - start
+    entries = folders * (files + 1) + 1
+    print('find listing: {} entries in {:.3f}s, {:.2f} us per entry'.format(
+        entries, elapsed, elapsed / entries * 1e6))
+    os.remove(listing_path)
+
+    scanner = DirectoryScanner()
+    start = time.perf_counter()
+    FileSystemTree(path, scanner)
+    elapsed = time.perf_counter() - start
+    print('live scan: {} entries in {:.3f}s, {:.2f} us per entry'.format(
+        scanner.stats.entries, elapsed,
+        elapsed / scanner.stats.entries * 1e6))
+
+
+class ChainScanner(DirectoryScanner):
+    """A scanner for a synthetic file system: a chain of <depth> nested
+    folders with a single 1-byte file at the bottom.
+
+    Real file systems limit the length of a path, so a chain this deep can
+    only be built in memory.
+    """
+    def __init__(self, depth):
+        """Initialize a new ChainScanner.
+
+        @type self: ChainScanner
+        @type depth: int
+        @rtype: None
+        """
+        DirectoryScanner.__init__(self)
+        self._depth = depth
+
+    def stat_path(self, path):
+        """Return the description of the top folder of the chain.
+
+        @type self: ChainScanner
+        @type path: str
+        @rtype: (str, str, bool, int)
+        """
+        return path, '0', True, 0
+
+    def list_dir(self, path):
+        """Return the single entry of the folder <path> of the chain.
+
+        @type self: ChainScanner
+        @type path: str
+        @rtype: list[(str, str, bool, int)]
+        """
+        level = int(path) + 1
+        if level == self._depth:
+            return [('file', str(level), False, 1)]
+        return [('d', str(level), True, 0)]
+
+
+class WideScanner(DirectoryScanner):
+    """A scanner for a synthetic file system: <folders> folders, each
+    holding <files> files of a few hundred bytes with realistic names.
+    """
+    def __init__(self, folders, files):
+        """Initialize a new WideScanner.
+
+        @type self: WideScanner
+        @type folders: int
+        @type files: int
+        @rtype: None
+        """
+        DirectoryScanner.__init__(self)
+        self._folders = folders
+        self._files = files
+
+    def stat_path(self, path):
+        """Return the description of the top folder.
+
+        @type self: WideScanner
+        @type path: str
+        @rtype: (str, str, bool, int)
+        """
+        return path, '', True, 0
+
+    def list_dir(self, path):
+        """Return the entries of the folder <path>.
+
+        @type self: WideScanner
+        @type path: str
+        @rtype: list[(str, str, bool, int)]
+        """
+        if path == '':
+            return [('folder{:04}'.format(i), str(i), True, 0)
+                    for i in range(self._folders)]
+        return [('file{:05}.txt'.format(j), '', False, 100 + j)
+                for j in range(self._files)]
+
+    def list_dir_stats(self, path):
+        """Return the entries of the folder <path>, and the owner and
+        modification time of each: a few owners, and files modified up to
+        two years ago.
+
+        @type self: WideScanner
+        @type path: str
+        @rtype: (list[(str, str, bool, int)], list[(int, float) | None])
+        """
+        content = self.list_dir(path)
+        if path == '':
+            return content, [None] * len(content)
+        now = time.time()
+        return content, [(1000 + j % 5, now - j * 7000.0)
+                         for j in range(len(content))]
+
+
+def bench_compact(folders=100, files=10000):
+    """Build the same tree of <folders> folders of <files> files as
+    FileSystemTree objects and as a CompactTree, and print the memory used
+    by each.
+
+    @type folders: int
+    @type files: int
+    @rtype: None
+    """
+    nodes = 1 + folders * (files + 1)
+    for label, build in [
+            ('FileSystemTree', lambda: FileSystemTree(
+                'top', WideScanner(folders, files))),
+            ('CompactTree', lambda: CompactTree.from_path(
+                'top', WideScanner(folders, files)))]:
+        tracemalloc.start()
+        start = time.perf_counter()
+        tree = build()
+        elapsed = time.perf_counter() - start
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print('{}: {} nodes in {:.3f}s, {:.1f} MiB, {:.1f} bytes per '
+              'node'.format(label, nodes, elapsed, size / 2 ** 20,
+                            size / nodes))
+        del tree
+
+
+def bench_snapshot(folders=100, files=10000):
+    """Save a CompactTree of <folders> folders of <files> files to a
+    snapshot, and print the size of the file, the time taken to open it,
+    and the time generate_treemap takes on the mapped file and on the
+    CompactTree in memory.
+
+    @type folders: int
+    @type files: int
+    @rtype: None
+    """
+    nodes = 1 + folders * (files + 1)
+    compact = CompactTree.from_path('top', WideScanner(folders, files))
+    rect = (0, 0, 1024, 768)
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'tree.snapshot')
+        start = time.perf_counter()
+        save_snapshot(compact, path)
+        saved = time.perf_counter() - start
+        start = time.perf_counter()
+        snapshot = open_snapshot(path)
+        opened = time.perf_counter() - start
+        start = time.perf_counter()
+        snapshot.root().generate_treemap(rect)
+        mapped = time.perf_counter() - start
+        snapshot.close()
+        start = time.perf_counter()
+        compact.root().generate_treemap(rect)
+        in_memory = time.perf_counter() - start
+        print('snapshot of {} nodes: {:.1f} MiB ({:.1f} bytes per node), '
+              'saved in {:.3f}s, opened in {:.2f}ms; treemap {:.3f}s mapped, '
+              '{:.3f}s in memory'.format(
+                  nodes, os.path.getsize(path) / 2 ** 20,
+                  os.path.getsize(path) / nodes, saved, opened * 1000,
+                  mapped, in_memory))
+
+
+def bench_diff(folders=100, files=10000, changes=10000):
+    """Diff two trees of <folders> folders of <files> files, where
+    <changes> files of the second one grew, as FileSystemTrees and as
+    CompactTrees, and print the time taken by each.
+
+    @type folders: int
+    @type files: int
+    @type changes: int
+    @rtype: None
+    """
+    nodes = 1 + folders * (files + 1)
+    for label, build in [
+            ('FileSystemTree', lambda: FileSystemTree(
+                'top', WideScanner(folders, files))),
+            ('CompactTree', lambda: CompactTree.from_path(
+                'top', WideScanner(folders, files)).root())]:
+        old = build()
+        new = build()
+        leaves = new.leaves()
+        step = max(len(leaves) // changes, 1)
+        for leaf in leaves[::step][:changes]:
+            leaf.resize_leaf(leaf.data_size + 1)
+        del leaves
+        start = time.perf_counter()
+        diff = diff_trees(old, new)
+        elapsed = time.perf_counter() - start
+        print('diff of {} {} nodes: {:.3f}s, {} files grew'.format(
+            nodes, label, elapsed, len(diff.leaves())))
+
+
+def bench_top(folders=100, files=10000, k=10, changes=1000):
+    """Find the <k> largest files of a tree of <folders> folders of <files>
+    files by sorting its leaves and with a TopIndex, then resize <changes>
+    files and ask again, and print the time taken by each.
+
+    @type folders: int
+    @type files: int
+    @type k: int
+    @type changes: int
+    @rtype: None
+    """
+    tree = FileSystemTree('top', WideScanner(folders, files))
+    start = time.perf_counter()
+    expected = sorted(tree.leaves(), key=lambda leaf: leaf.data_size,
+                      reverse=True)[:k]
+    sorting = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = TopIndex(tree)
+    built = time.perf_counter() - start
+    start = time.perf_counter()
+    largest = index.largest_files(k)
+    index.largest_folders(k)
+    query = time.perf_counter() - start
+    assert [leaf.data_size for leaf in largest] == \
+        [leaf.data_size for leaf in expected]
+
+    leaves = tree.leaves()[::max(len(tree.leaves()) // changes, 1)][:changes]
+    start = time.perf_counter()
+    for leaf in leaves:
+        leaf.resize_leaf(leaf.data_size + 1)
+    resized = time.perf_counter() - start
+    start = time.perf_counter()
+    index.largest_files(k)
+    after = time.perf_counter() - start
+    index.close()
+    print('top {} of {} files: {:.3f}s sorting leaves; index built in '
+          '{:.3f}s, queried in {:.2f}ms, {} resizes followed in {:.3f}s, '
+          'queried again in {:.2f}ms'.format(
+              k, folders * files, sorting, built, query * 1000, changes,
+              resized, after * 1000))
+
+
+def bench_search(folders=100, files=10000,
+                 patterns=('file00042.txt', 'file0042*', '*42.txt')):
+    """Find the files of a tree of <folders> folders of <files> files whose
+    name matches each of <patterns>, by walking the tree and with a
+    SearchIndex, and print the time taken by each.
+
+    @type folders: int
+    @type files: int
+    @type patterns: tuple[str]
+    @rtype: None
+    """
+    tree = FileSystemTree('top', WideScanner(folders, files))
+    start = time.perf_counter()
+    index = SearchIndex(tree)
+    built = time.perf_counter() - start
+    for pattern in patterns:
+        start = time.perf_counter()
+        expected = [leaf for leaf in tree.leaves()
+                    if fnmatch.fnmatchcase(leaf.get_root(), pattern)]
+        walked = time.perf_counter() - start
+        start = time.perf_counter()
+        found = index.search(pattern)
+        searched = time.perf_counter() - start
+        assert len(found) == len(expected)
+        print('search {!r} in {} files: {} matches, {:.3f}s walking the tree, '
+              '{:.2f}ms with the index'.format(
+                  pattern, folders * files, len(found), walked,
+                  searched * 1000))
+    index.close()
+    print('search index of {} files built in {:.3f}s'.format(
+        folders * files, built))
+
+
+def bench_groups(folders=100, files=10000):
+    """Scan a tree of <folders> folders of <files> files into a FileTable,
+    build each of its views, then switch between them again, and print the
+    time taken by each.
+
+    @type folders: int
+    @type files: int
+    @rtype: None
+    """
+    start = time.perf_counter()
+    table = FileTable.from_path('top', WideScanner(folders, files))
+    scanned = time.perf_counter() - start
+    print('file table of {} files scanned in {:.3f}s'.format(len(table),
+                                                             scanned))
+    for kind in GROUP_VIEWS:
+        start = time.perf_counter()
+        tree = table.view(kind)
+        built = time.perf_counter() - start
+        print('{} view: {} groups built in {:.3f}s'.format(
+            kind, len(tree.get_subtrees()), built))
+    start = time.perf_counter()
+    for kind in GROUP_VIEWS:
+        table.view(kind)
+    print('switching between the {} views: {:.2f}us'.format(
+        len(GROUP_VIEWS), (time.perf_counter() - start) * 1e6))
+
+
+def bench_batch(folders=1, files=100000, changes=5000):
+    """Apply <changes> resizes and as many deletions to a tree of <folders>
+    folders of <files> files, one at a time and in a TreeBatch, and print
+    the time taken by each.
+
+    Deleting one file at a time searches its folder's subtrees for it, so
+    the batch makes the most difference in big folders.
+
+    @type folders: int
+    @type files: int
+    @type changes: int
+    @rtype: None
+    """
+    def changes_of(tree):
+        leaves = tree.leaves()
+        return leaves[:changes], leaves[-changes:]
+
+    tree = FileSystemTree('top', WideScanner(folders, files))
+    resized, deleted = changes_of(tree)
+    start = time.perf_counter()
+    for leaf in resized:
+        leaf.increase_size()
+    for leaf in deleted:
+        tree.complete_leaf_deletion(leaf)
+    one_at_a_time = time.perf_counter() - start
+
+    tree = FileSystemTree('top', WideScanner(folders, files))
+    resized, deleted = changes_of(tree)
+    start = time.perf_counter()
+    with tree.batch() as batch:
+        for leaf in resized:
+            batch.increase(leaf)
+        for leaf in deleted:
+            batch.delete(leaf)
+    batched = time.perf_counter() - start
+    print('{} changes: {:.3f}s one at a time, {:.3f}s in a batch'.format(
+        2 * changes, one_at_a_time, batched))
+
+
+def bench_journal(folders=1, files=100000, changes=5000, history=1000):
+    """Make <changes> resizes and as many deletions to a tree of <folders>
+    folders of <files> files through a TreeJournal keeping <history> of
+    them, then undo and redo everything it kept, and print the time taken
+    and the memory held by the journal.
+
+    @type folders: int
+    @type files: int
+    @type changes: int
+    @type history: int
+    @rtype: None
+    """
+    tree = FileSystemTree('top', WideScanner(folders, files))
+    leaves = tree.leaves()
+    journal = TreeJournal(tree, history)
+    tracemalloc.start()
+    start = time.perf_counter()
+    for leaf in leaves[:changes]:
+        journal.increase(leaf)
+    for leaf in leaves[-changes:]:
+        journal.delete(leaf)
+    changed = time.perf_counter() - start
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    while journal.undo() is not None:
+        pass
+    undone = time.perf_counter() - start
+    start = time.perf_counter()
+    while journal.redo() is not None:
+        pass
+    redone = time.perf_counter() - start
+    print('{} changes: {:.3f}s; {} undone in {:.3f}s, redone in {:.3f}s; '
+          '{:.1f} KiB of history'.format(2 * changes, changed, len(journal),
+                                         undone, redone, held / 1024))
+
+
+def bench_deep_chain(depth=10000):
+    """Build a FileSystemTree for a chain of <depth> nested folders, run
+    the tree traversals on it, and print the time and peak memory used,
+    next to the same work done by the old recursive implementations.
+
+    @type depth: int
+    @rtype: None
+    """
+    rect = (0, 0, 800, 1000)
+
+    def iterative():
+        tree = FileSystemTree('chain', ChainScanner(depth))
+        tree.generate_treemap(rect)
+        leaf = tree.leaves()[0]
+        tree.compute_size()
+        leaf.get_separator()
+
+    def recursive():
+        tree = _recursive_build(ChainScanner(depth), 'chain', '0', True, 0)
+        _recursive_treemap(tree, rect)
+        leaf = _recursive_leaves(tree)[0]
+        _recursive_compute_size(tree)
+        _recursive_separator(leaf)
+
+    old_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(old_limit, 3 * depth + 100))
+    try:
+        for label, function in [('iterative', iterative),
+                                ('recursive', recursive)]:
+            tracemalloc.start()
+            start = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print('{} chain of {}: {:.3f}s, peak {:.1f} MiB'.format(
+                label, depth, elapsed, peak / 2 ** 20))
+    finally:
+        sys.setrecursionlimit(old_limit)
+
+
+def bench_inode_set(count=1000000):
+    """Add <count> (device, inode) pairs to an InodeSet and to a Python set
+    of tuples, and print the memory used by each.
+
+    @type count: int
+    @rtype: None
+    """
+    for label, make, add in [
+            ('InodeSet', InodeSet, lambda s, i: s.add(2049, i)),
+            ('set of tuples', set, lambda s, i: s.add((2049, i)))]:
+        tracemalloc.start()
+        inodes = make()
+        for ino in range(1000, 1000 + 7 * count, 7):
+            add(inodes, ino)
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print('{}: {:.1f} bytes per inode'.format(label, size / count))
+
+    # Inode numbers that only differ in their high bits, like those of
+    # overlayfs with xino (which keeps the layer there).
+    for label, numbers in [
+            ('sequential', range(1, count + 1)),
+            ('high bits', ((i + 1) << 40 | 5 for i in range(count)))]:
+        inodes = InodeSet()
+        start = time.perf_counter()
+        for ino in numbers:
+            inodes.add(2049, ino)
+        print('InodeSet, {}: {:.2f}s'.format(
+            label, time.perf_counter() - start))
+
+
+##############################################################################
+# The old recursive implementations, kept here for comparison.
+##############################################################################
+
+
+def _recursive_build(scanner, name, path, is_dir, size):
+    """Return the tree for the entry (name, path, is_dir, size), built
+    recursively like the old FileSystemTree constructor.
+
+    @type scanner: DirectoryScanner
+    @type name: str
+    @type path: str
+    @type is_dir: bool
+    @type size: int
+    @rtype: FileSystemTree
+    """
+    tree = FileSystemTree.__new__(FileSystemTree)
+    if not is_dir:
+        AbstractTree.__init__(tree, name, [], size)
+    else:
+        subtrees = [_recursive_build(scanner, *entry)
+                    for entry in scanner.list_dir(path)]
+        AbstractTree.__init__(tree, name, subtrees)
+    return tree
+
+
+def _recursive_treemap(tree, rect):
+    """Return the old recursive AbstractTree.generate_treemap(rect).
+
+    @type tree: AbstractTree
+    @type rect: (int, int, int, int)
+    @rtype: list[((int, int, int, int), (int, int, int))]
+    """
+    x, y, width, height = rect
+    if tree.data_size == 0:
+        return []
+    elif len(tree._subtrees) == 0:
+        return [(rect, tree.colour)]
+    tree_map = []
+    x_tree, y_tree = x, y
+    for subtree in tree._subtrees:
+        portion = subtree.data_size / tree.data_size
+        last = subtree is tree._subtrees[-1]
+        if width > height:
+            w = width - (x_tree - x) if last else math.floor(portion * width)
+            subtree_rect = (x_tree, y_tree, w, height)
+            tree_map += _recursive_treemap(subtree, subtree_rect)
+            x_tree += w
+        else:
+            h = height - (y_tree - y) if last else math.floor(portion * height)
+            subtree_rect = (x_tree, y_tree, width, h)
+            tree_map += _recursive_treemap(subtree, subtree_rect)
+            y_tree += h
+    return tree_map
+
+
+def _recursive_leaves(tree):
+    """Return the old recursive AbstractTree.leaves().
+
+    @type tree: AbstractTree
+    @rtype: list[AbstractTree]
+    """
+    leaves = []
+    for subtree in tree._subtrees:
+        if len(subtree._subtrees) == 0 and subtree.data_size != 0:
+            leaves.append(subtree)
+        else:
+            leaves += _recursive_leaves(subtree)
+    return leaves
+
+
+def _recursive_compute_size(tree):
+    """Return the old recursive AbstractTree.compute_size().
+
+    @type tree: AbstractTree
+    @rtype: int
+    """
+    if len(tree._subtrees) == 0:
+        return tree.data_size
+    return sum(_recursive_compute_size(subtree) for subtree in tree._subtrees)
+
+
+def _recursive_separator(tree):
+    """Return the old recursive FileSystemTree.get_separator().
+
+    @type tree: FileSystemTree
+    @rtype: str
+    """
+    if tree._parent_tree is None:
+        return tree._root
+    return os.path.join(_recursive_separator(tree._parent_tree), tree._root)
+
+
+if __name__ == '__main__':
+    bench_deep_chain()
+    bench_inode_set()
+    bench_compact()
+    bench_snapshot()
+    bench_diff()
+    bench_top()
+    bench_search()
+    bench_groups()
+    bench_batch()
+    bench_journal()
+
+    with tempfile.TemporaryDirectory() as sample:
+        make_sample_folder(sample)
+        bench_scan(sample)
+        bench_rules(sample, ScanRules(['folder1*']))
+        bench_listing(sample)
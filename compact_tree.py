@@ -0,0 +1,840 @@
+"""
+=== Module Description ===
+This module contains CompactTree, which stores a whole tree in a few typed
+arrays instead of one Python object per node.
+
+Every node of an AbstractTree is a Python object with a list of subtrees and
+an int object for its size: well over 100 bytes per file, which adds up to
+gigabytes for tens of millions of files. A CompactTree numbers its nodes
+instead, and keeps for each node its parent, first child, next sibling and
+last child (as 32-bit indices), its data size and the offset of its name in
+one shared byte string: about 28 bytes per node plus the name itself. Like
+for AbstractTree, colours are computed from the names when they are drawn.
+
+The visualiser still works with AbstractTree objects, so the nodes are
+exposed as CompactNode objects: lightweight views of one node of the arrays,
+which implement the AbstractTree methods directly on the arrays. A view is
+only created for the nodes that are actually handed out (e.g. the selected
+leaf), and the same node always gives the same view while it is in use.
+"""
+import math
+import os
+import weakref
+from array import array
+from itertools import accumulate, islice
+
+from scanner import DirectoryScanner
+from tree_data import AbstractTree, colour_for, _LeafIndex
+
+
+# The parent index of the root node, and of a node that was deleted.
+NO_PARENT = -1
+DELETED = -2
+
+
+class CompactTree:
+    """A tree whose nodes are stored in typed arrays.
+
+    The nodes are numbered from 0 (the root) in the order they are added;
+    a node is always added after its parent.
+
+    === Public Attributes ===
+    @type separator: str
+        The string get_separator puts between the names of the nodes.
+
+    === Private Attributes ===
+    @type _parent: array
+        The index of the parent of each node, NO_PARENT for the root, or
+        DELETED once the node was deleted.
+    @type _first_child: array
+        The index of the first child of each node, or -1.
+    @type _last_child: array
+        The index of the last child of each node, or -1.
+    @type _next_sibling: array
+        The index of the next child of the same parent, or -1.
+    @type _size: array
+        The data_size of each node.
+    @type _name_offset: array
+        The name of node i is _names[_name_offset[i]:_name_offset[i + 1]],
+        encoded in UTF-8.
+    @type _names: bytearray
+        The names of every node, one after the other.
+    @type _nodes: weakref.WeakValueDictionary
+        The CompactNode views currently in use, by index.
+    @type _leaf_cache: (int, _LeafIndex) | None
+        The node and treemap (with the index of the leaf drawn in each
+        rectangle) last laid out, until the tree changes.
+    """
+    def __init__(self, separator=os.sep):
+        """Initialize a new CompactTree with no nodes.
+
+        @type self: CompactTree
+        @type separator: str
+        @rtype: None
+        """
+        self.separator = separator
+        self._parent = array('i')
+        self._first_child = array('i')
+        self._last_child = array('i')
+        self._next_sibling = array('i')
+        self._size = array('q')
+        self._name_offset = array('I', [0])
+        self._names = bytearray()
+        self._nodes = weakref.WeakValueDictionary()
+        self._leaf_cache = None
+
+    @classmethod
+    def from_path(cls, path, scanner=None):
+        """Return a CompactTree of the file or folder <path>, built like a
+        FileSystemTree would be but without creating any tree objects.
+
+        Precondition: <path> is a valid path for this computer.
+
+        @type path: str
+        @type scanner: DirectoryScanner | None
+        @rtype: CompactTree
+        """
+        if scanner is None:
+            scanner = DirectoryScanner()
+        name, path, is_dir, size = scanner.stat_path(path)
+        tree = cls()
+        root = tree.add_node(NO_PARENT, name, size)
+        if is_dir:
+            stack = [(root, path)]
+            while stack:
+                index, folder_path = stack.pop()
+                for name, subitem_path, is_dir, size in \
+                        scanner.list_dir(folder_path):
+                    subitem = tree.add_node(index, name, size)
+                    if is_dir:
+                        stack.append((subitem, subitem_path))
+            tree.compute_folder_sizes()
+        return tree
+
+    @classmethod
+    def from_tree(cls, tree, separator=os.sep):
+        """Return a CompactTree with the same nodes as the AbstractTree
+        <tree>. The names of the nodes are converted to strings.
+
+        @type tree: AbstractTree
+        @type separator: str
+        @rtype: CompactTree
+
+        >>> t = AbstractTree('x', [AbstractTree('a', [], 30),
+        ...                        AbstractTree('b', [], 10)])
+        >>> compact = CompactTree.from_tree(t, '/')
+        >>> compact.root().data_size
+        40
+        >>> compact.root().leaves()[1].get_separator()
+        'x/b'
+        """
+        compact = cls(separator)
+        stack = [(NO_PARENT, tree)]
+        while stack:
+            parent, subtree = stack.pop()
+            index = compact.add_node(parent, str(subtree._root),
+                                     subtree.data_size)
+            stack.extend((index, child)
+                         for child in reversed(subtree._subtrees))
+        return compact
+
+    def __len__(self):
+        """Return the number of nodes added to this tree, including deleted
+        ones.
+
+        @type self: CompactTree
+        @rtype: int
+        """
+        return len(self._parent)
+
+    def add_node(self, parent, name, size):
+        """Add a node named <name> of <size> as the last child of the node
+        <parent> (or as the root, if <parent> is NO_PARENT), and return its
+        index.
+
+        The size of <parent> and its ancestors is not changed; see
+        compute_folder_sizes.
+
+        @type self: CompactTree
+        @type parent: int
+        @type name: str
+        @type size: int
+        @rtype: int
+        """
+        self._leaf_cache = None
+        index = len(self._parent)
+        self._parent.append(parent)
+        self._first_child.append(-1)
+        self._last_child.append(-1)
+        self._next_sibling.append(-1)
+        self._size.append(size)
+        self._names += name.encode('utf-8', 'surrogateescape')
+        self._name_offset.append(len(self._names))
+        if parent >= 0:
+            last = self._last_child[parent]
+            if last == -1:
+                self._first_child[parent] = index
+            else:
+                self._next_sibling[last] = index
+            self._last_child[parent] = index
+        return index
+
+    def add_nodes(self, parent, names, sizes):
+        """Add nodes named <names>, of <sizes>, as the last children of the
+        node <parent>, in order, and return the index of the first one; the
+        others follow it.
+
+        This does the same as calling add_node for each of them, but extends
+        each array once rather than once per node.
+
+        @type self: CompactTree
+        @type parent: int
+        @type names: list[str]
+        @type sizes: list[int] | array
+        @rtype: int
+
+        >>> compact = CompactTree('/')
+        >>> root = compact.add_node(NO_PARENT, 'x', 0)
+        >>> compact.add_nodes(root, ['a', 'b'], [30, 10])
+        1
+        >>> compact.compute_folder_sizes()
+        >>> [leaf.get_separator() for leaf in compact.root().leaves()]
+        ['x/a', 'x/b']
+        """
+        first = len(self._parent)
+        count = len(names)
+        if count == 0:
+            return first
+        self._leaf_cache = None
+        encoded = [name.encode('utf-8', 'surrogateescape') for name in names]
+        self._parent.extend([parent] * count)
+        self._first_child.extend([-1] * count)
+        self._last_child.extend([-1] * count)
+        self._next_sibling.extend(range(first + 1, first + count))
+        self._next_sibling.append(-1)
+        self._size.extend(sizes)
+        # The offset where the first name starts is already there.
+        self._name_offset.extend(islice(
+            accumulate(map(len, encoded), initial=len(self._names)), 1, None))
+        self._names += b''.join(encoded)
+        last = self._last_child[parent]
+        if last == -1:
+            self._first_child[parent] = first
+        else:
+            self._next_sibling[last] = first
+        self._last_child[parent] = first + count - 1
+        return first
+
+    def compute_folder_sizes(self):
+        """Add the size of every node to the size of its parent, so that the
+        size of every node with children is the total size of the nodes with
+        no children under it.
+
+        Precondition: the nodes with children have a size of 0.
+
+        @type self: CompactTree
+        @rtype: None
+        """
+        self._leaf_cache = None
+        parent = self._parent
+        size = self._size
+        # Children always come after their parent, so going backwards adds
+        # each node to its parent once the node itself is complete.
+        for index in range(len(parent) - 1, 0, -1):
+            if parent[index] >= 0:
+                size[parent[index]] += size[index]
+
+    def root(self):
+        """Return the view of the root of this tree.
+
+        Precondition: this tree has at least one node.
+
+        @type self: CompactTree
+        @rtype: CompactNode
+        """
+        return self.node(0)
+
+    def node(self, index):
+        """Return the view of the node <index>.
+
+        @type self: CompactTree
+        @type index: int
+        @rtype: CompactNode
+        """
+        node = self._nodes.get(index)
+        if node is None:
+            node = CompactNode(self, index)
+            self._nodes[index] = node
+        return node
+
+    def name(self, index):
+        """Return the name of the node <index>.
+
+        @type self: CompactTree
+        @type index: int
+        @rtype: str
+        """
+        return str(self._names[self._name_offset[index]:
+                               self._name_offset[index + 1]],
+                   'utf-8', 'surrogateescape')
+
+    def children(self, index):
+        """Return the indices of the children of the node <index>, in order.
+
+        @type self: CompactTree
+        @type index: int
+        @rtype: list[int]
+        """
+        children = []
+        child = self._first_child[index]
+        while child != -1:
+            children.append(child)
+            child = self._next_sibling[child]
+        return children
+
+    def layout(self, index, rect):
+        """Yield an (index, rect) pair for the node <index> and every node
+        under it with a non-zero size, in the order the treemap algorithm
+        visits them, exactly like AbstractTree._layout.
+
+        @type self: CompactTree
+        @type index: int
+        @type rect: (int, int, int, int)
+        @rtype: iterator[(int, (int, int, int, int))]
+        """
+        size = self._size
+        next_sibling = self._next_sibling
+        stack = [(index, rect)]
+        while stack:
+            index, rect = stack.pop()
+            total = size[index]
+            if total == 0:
+                continue
+            yield index, rect
+
+            x, y, width, height = rect
+            x_tree = x
+            y_tree = y
+            subtree_rects = []
+            child = self._first_child[index]
+            while child != -1:
+                last = next_sibling[child] == -1
+                portion = size[child] / total
+                if width > height:
+                    if last:
+                        subtree_width = width - (x_tree - x)
+                    else:
+                        subtree_width = math.floor(portion * width)
+                    subtree_rects.append(
+                        (child, (x_tree, y_tree, subtree_width, height)))
+                    x_tree += subtree_width
+                else:
+                    if last:
+                        subtree_height = height - (y_tree - y)
+                    else:
+                        subtree_height = math.floor(portion * height)
+                    subtree_rects.append(
+                        (child, (x_tree, y_tree, width, subtree_height)))
+                    y_tree += subtree_height
+                child = next_sibling[child]
+
+            subtree_rects.reverse()
+            stack.extend(subtree_rects)
+
+    def leaf_index(self, index, rect, colour_mode):
+        """Return the treemap of the node <index> in <rect>, coloured in
+        <colour_mode>, with the index of the leaf drawn in each rectangle.
+
+        The result is kept until the tree changes, so the visualiser can
+        redraw it and find the leaf clicked without laying out the arrays
+        again.
+
+        @type self: CompactTree
+        @type index: int
+        @type rect: (int, int, int, int)
+        @type colour_mode: str
+        @rtype: _LeafIndex
+        """
+        cache = self._leaf_cache
+        if cache is not None and cache[0] == index and \
+                cache[1].colour_mode == colour_mode and cache[1].rect == rect:
+            return cache[1]
+        first_child = self._first_child
+        treemap = []
+        leaves = []
+        for node, node_rect in self.layout(index, rect):
+            if first_child[node] == -1:
+                treemap.append((node_rect,
+                                colour_for(self.name(node), colour_mode)))
+                leaves.append(node)
+        leaf_index = _LeafIndex(rect, colour_mode, treemap, leaves)
+        self._leaf_cache = (index, leaf_index)
+        return leaf_index
+
+    def leaves(self, index):
+        """Return the indices of the nodes with no children and a non-zero
+        size under the node <index>, in order, like AbstractTree.leaves.
+
+        @type self: CompactTree
+        @type index: int
+        @rtype: list[int]
+        """
+        first_child = self._first_child
+        next_sibling = self._next_sibling
+        leaves = []
+        if first_child[index] == -1:
+            return leaves
+        stack = [first_child[index]]
+        while stack:
+            node = stack.pop()
+            if next_sibling[node] != -1:
+                stack.append(next_sibling[node])
+            if first_child[node] == -1:
+                if self._size[node] != 0:
+                    leaves.append(node)
+            else:
+                stack.append(first_child[node])
+        return leaves
+
+    def add_size(self, index, delta):
+        """Add <delta> to the size of the node <index> and of its ancestors.
+
+        @type self: CompactTree
+        @type index: int
+        @type delta: int
+        @rtype: None
+        """
+        self._leaf_cache = None
+        while index >= 0:
+            self._size[index] += delta
+            index = self._parent[index]
+
+    def detach(self, index):
+        """Remove the node <index> from the children of its parent, and
+        return the position it had among them. The node and the nodes under
+        it are kept, but no longer have a parent. Sizes are not changed.
+
+        @type self: CompactTree
+        @type index: int
+        @rtype: int
+        """
+        self._leaf_cache = None
+        parent = self._parent[index]
+        position = 0
+        if parent >= 0:
+            previous = -1
+            child = self._first_child[parent]
+            while child != index:
+                previous = child
+                child = self._next_sibling[child]
+                position += 1
+            following = self._next_sibling[index]
+            if previous == -1:
+                self._first_child[parent] = following
+            else:
+                self._next_sibling[previous] = following
+            if self._last_child[parent] == index:
+                self._last_child[parent] = previous
+            self._next_sibling[index] = -1
+        self._parent[index] = NO_PARENT
+        return position
+
+    def link(self, index, parent, position=None):
+        """Make the node <index>, which has no parent, a child of the node
+        <parent>: the last one, or the one at <position>. Sizes are not
+        changed.
+
+        @type self: CompactTree
+        @type index: int
+        @type parent: int
+        @type position: int | None
+        @rtype: None
+        """
+        self._leaf_cache = None
+        self._parent[index] = parent
+        previous = -1
+        following = self._first_child[parent]
+        if position is None:
+            previous = self._last_child[parent]
+            following = -1
+        else:
+            for _ in range(position):
+                previous = following
+                following = self._next_sibling[following]
+        self._next_sibling[index] = following
+        if previous == -1:
+            self._first_child[parent] = index
+        else:
+            self._next_sibling[previous] = index
+        if following == -1:
+            self._last_child[parent] = index
+
+    def unlink(self, index):
+        """Remove the node <index> from the children of its parent, and mark
+        it as deleted. Sizes are not changed.
+
+        @type self: CompactTree
+        @type index: int
+        @rtype: None
+        """
+        self.detach(index)
+        self._parent[index] = DELETED
+
+    def contains(self, ancestor, index):
+        """Return True if the node <index> is the node <ancestor> or is
+        under it.
+
+        @type self: CompactTree
+        @type ancestor: int
+        @type index: int
+        @rtype: bool
+        """
+        while index >= 0:
+            if index == ancestor:
+                return True
+            index = self._parent[index]
+        return False
+
+
+class CompactNode(AbstractTree):
+    """A view of one node of a CompactTree, with the AbstractTree interface.
+
+    The attributes of AbstractTree are properties reading (and, for
+    data_size, writing) the arrays of the CompactTree.
+
+    === Private Attributes ===
+    @type _store: CompactTree
+        The tree this node belongs to.
+    @type _index: int
+        The index of this node in <_store>.
+    """
+    __slots__ = ('_store', '_index', '__weakref__')
+
+    def __init__(self, store, index):
+        """Initialize a new view of the node <index> of <store>.
+
+        Use CompactTree.node rather than creating views directly, so that
+        every node has a single view.
+
+        @type self: CompactNode
+        @type store: CompactTree
+        @type index: int
+        @rtype: None
+        """
+        self._store = store
+        self._index = index
+        self._lazy = None
+
+    @property
+    def _root(self):
+        """The name of this node, or None if it was deleted.
+
+        @type self: CompactNode
+        @rtype: str | None
+        """
+        if self._store._parent[self._index] == DELETED:
+            return None
+        return self._store.name(self._index)
+
+    @property
+    def data_size(self):
+        """The data_size of this node.
+
+        @type self: CompactNode
+        @rtype: int
+        """
+        return self._store._size[self._index]
+
+    @data_size.setter
+    def data_size(self, value):
+        """Set the data_size of this node, without changing its ancestors.
+
+        @type self: CompactNode
+        @type value: int
+        @rtype: None
+        """
+        self._store._leaf_cache = None
+        self._store._size[self._index] = value
+
+    @property
+    def colour(self):
+        """The colour of this node, as an (r, g, b) tuple.
+
+        @type self: CompactNode
+        @rtype: (int, int, int)
+        """
+        return colour_for(self._store.name(self._index), self.colour_mode)
+
+    @property
+    def _subtrees(self):
+        """The views of the children of this node. Changing the list does not
+        change the tree.
+
+        @type self: CompactNode
+        @rtype: list[CompactNode]
+        """
+        store = self._store
+        return [store.node(child) for child in store.children(self._index)]
+
+    @property
+    def _parent_tree(self):
+        """The view of the parent of this node, or None.
+
+        @type self: CompactNode
+        @rtype: CompactNode | None
+        """
+        parent = self._store._parent[self._index]
+        if parent < 0:
+            return None
+        return self._store.node(parent)
+
+    def generate_treemap(self, rect):
+        """Run the treemap algorithm on this tree and return the rectangles.
+
+        @type self: CompactNode
+        @type rect: (int, int, int, int)
+        @rtype: list[((int, int, int, int), (int, int, int))]
+
+        >>> compact = CompactTree.from_tree(AbstractTree(
+        ...     'x', [AbstractTree('a', [], 30), AbstractTree('b', [], 10)]))
+        >>> [r for r, _ in compact.root().generate_treemap((0, 0, 80, 10))]
+        [(0, 0, 60, 10), (60, 0, 20, 10)]
+        """
+        return list(self._store.leaf_index(self._index, rect,
+                                           self.colour_mode).treemap)
+
+    def get_leaf(self, rect, tree_rect):
+        """Return the view of the leaf drawn in <tree_rect> in the treemap of
+        this tree in <rect>, or None.
+
+        The treemap cached by the CompactTree holds the indices of the
+        leaves, so a view is only created for the leaf found.
+
+        @type self: CompactNode
+        @type rect: (int, int, int, int)
+        @type tree_rect: (int, int, int, int)
+        @rtype: CompactNode | None
+        """
+        store = self._store
+        index = store.leaf_index(self._index, rect,
+                                 self.colour_mode).leaf_at(tree_rect)
+        return None if index is None else store.node(index)
+
+    def convert_to_rect(self, rect, leaf):
+        """Return the element of the treemap of this tree in <rect> for the
+        leaf <leaf>, or None.
+
+        @type self: CompactNode
+        @type rect: (int, int, int, int)
+        @type leaf: CompactNode
+        @rtype: ((int, int, int, int), (int, int, int)) | None
+        """
+        store = self._store
+        if not isinstance(leaf, CompactNode) or leaf._store is not store:
+            return None
+        return store.leaf_index(self._index, rect,
+                                self.colour_mode).rect_of(leaf._index)
+
+    def rects_of(self, rect, trees):
+        """Return the rectangles of the subtrees <trees> in the treemap of
+        this tree, in the order the treemap algorithm visits them.
+
+        @type self: CompactNode
+        @type rect: (int, int, int, int)
+        @type trees: set[CompactNode]
+        @rtype: list[(int, int, int, int)]
+        """
+        indices = {tree._index for tree in trees
+                   if isinstance(tree, CompactNode) and
+                   tree._store is self._store}
+        return [tree_rect for index, tree_rect
+                in self._store.layout(self._index, rect)
+                if index in indices]
+
+    def leaves(self):
+        """Return the views of the leaves under this node that have a
+        non-zero data_size.
+
+        @type self: CompactNode
+        @rtype: list[CompactNode]
+        """
+        store = self._store
+        return [store.node(index) for index in store.leaves(self._index)]
+
+    def compute_size(self):
+        """Return the total data_size of the leaves under this node.
+
+        @type self: CompactNode
+        @rtype: int
+        """
+        store = self._store
+        if store._first_child[self._index] == -1:
+            return self.data_size
+        return sum(store._size[index] for index in store.leaves(self._index))
+
+    def get_separator(self):
+        """Return the names from the root of the tree to this node, joined
+        by the separator of the CompactTree.
+
+        @type self: CompactNode
+        @rtype: str
+        """
+        store = self._store
+        names = []
+        index = self._index
+        while index >= 0:
+            names.append(store.name(index))
+            index = store._parent[index]
+        names.reverse()
+        return store.separator.join(names)
+
+    def delete_leaf(self, leaf):
+        """Delete the leaf <leaf> from this tree.
+
+        Return True if <leaf> is deleted, or False (and do nothing else) if
+        it is not in this tree. Sizes are not changed.
+
+        <leaf> may also be a folder, which is deleted with everything in it:
+        the nodes under it stay in the arrays, but can no longer be reached
+        from the root.
+
+        @type self: CompactNode
+        @type leaf: CompactNode
+        @rtype: bool
+        """
+        store = self._store
+        if not isinstance(leaf, CompactNode) or leaf._store is not store or \
+                not store.contains(self._index, leaf._index):
+            return False
+        parent = store._parent[leaf._index]
+        store.unlink(leaf._index)
+        if self._observers:
+            followed = leaf if parent < 0 else store.node(parent)
+            followed._notify('tree_removed', leaf)
+        return True
+
+    def complete_leaf_deletion(self, leaf):
+        """Delete the leaf (or folder) <leaf> from this tree, and subtract
+        its data_size from its ancestors.
+
+        @type self: CompactNode
+        @type leaf: CompactNode
+        @rtype: None
+
+        >>> compact = CompactTree.from_tree(AbstractTree(
+        ...     'x', [AbstractTree('a', [], 30), AbstractTree('b', [], 10),
+        ...           AbstractTree('c', [AbstractTree('d', [], 5)])]))
+        >>> root = compact.root()
+        >>> root.complete_leaf_deletion(root.leaves()[0])
+        >>> root.data_size, [leaf.get_root() for leaf in root.leaves()]
+        (15, ['b', 'd'])
+        >>> root.complete_leaf_deletion(root.get_subtrees()[1])
+        >>> root.data_size, [leaf.get_root() for leaf in root.leaves()]
+        (10, ['b'])
+        """
+        if not isinstance(leaf, CompactNode):
+            return
+        store = self._store
+        parent = store._parent[leaf._index]
+        if self.delete_leaf(leaf):
+            if parent >= 0:
+                store.node(parent)._add_to_size(-leaf.data_size)
+            if leaf is self:
+                # <self> is now empty, so its data_size is 0.
+                self.data_size = 0
+
+    def _apply_batch(self, operations):
+        """Apply the queued TreeBatch <operations> to this tree, and return
+        the views of the nodes whose data_size changed, deepest first, and
+        of the nodes deleted.
+
+        Each change only walks up the arrays, so they are simply applied in
+        order.
+
+        @type self: CompactNode
+        @type operations: list[(str, CompactNode, int | None)]
+        @rtype: (list[CompactNode], list[CompactNode])
+        """
+        store = self._store
+        parents = store._parent
+        depths = {}
+        removed = []
+
+        def touch(index):
+            # Record <index> and its ancestors, with their depth.
+            chain = []
+            while index >= 0 and index not in depths:
+                chain.append(index)
+                index = parents[index]
+            depth = depths.get(index, -1)
+            for index in reversed(chain):
+                depth += 1
+                depths[index] = depth
+
+        for action, tree, size in operations:
+            if not isinstance(tree, CompactNode) or \
+                    tree._store is not store or \
+                    not store.contains(self._index, tree._index):
+                continue
+            if action == 'resize':
+                if size != tree.data_size:
+                    tree.resize_leaf(size)
+                    touch(tree._index)
+            else:
+                parent = parents[tree._index]
+                self.complete_leaf_deletion(tree)
+                if parents[tree._index] == DELETED:
+                    removed.append(tree)
+                    touch(parent)
+        changed = [store.node(index)
+                   for index in sorted(depths, key=depths.get, reverse=True)
+                   if store.contains(0, index)]
+        return changed, removed
+
+    def _add_subtree(self, subtree, position=None, restore=False):
+        """Make the node <subtree>, which has no parent, the last child of
+        this node (or the one at <position>), and add its data_size to this
+        node and its ancestors. Nodes keep no paths, so <restore> makes no
+        difference.
+
+        Precondition: <subtree> is a node of the same CompactTree.
+
+        @type self: CompactNode
+        @type subtree: CompactNode
+        @type position: int | None
+        @type restore: bool
+        @rtype: None
+        """
+        self._store.link(subtree._index, self._index, position)
+        if self._observers:
+            subtree._notify('tree_added')
+        self._add_to_size(subtree.data_size)
+
+    def _remove_from_parent(self, position=None):
+        """Remove this node from the children of its parent, subtract its
+        data_size from its ancestors, and return the position it had among
+        the children. <position> is not used: the children are linked, so
+        the node before this one has to be found anyway.
+
+        @type self: CompactNode
+        @type position: int | None
+        @rtype: int
+        """
+        store = self._store
+        parent = store._parent[self._index]
+        position = store.detach(self._index)
+        if self._observers:
+            store.node(parent)._notify('tree_removed', self)
+        store.node(parent)._add_to_size(-self.data_size)
+        return position
+
+    def _add_to_size(self, delta):
+        """Add <delta> to the data_size of this node and its ancestors.
+
+        @type self: CompactNode
+        @type delta: int
+        @rtype: None
+        """
+        self._store.add_size(self._index, delta)
+        if self._observers:
+            self._notify('tree_resized')
@@ -0,0 +1,204 @@
+"""
+=== Module Description ===
+This module compares two scans of the same file system, e.g. yesterday's and
+today's, and builds a tree of what grew (or shrank) between them.
+
+Both trees are walked together, one folder at a time. The entries of the
+two versions of a folder are sorted by name and merged like a sorted merge
+join, so each entry is matched with its old version in a single pass
+instead of being searched for. Every node of both trees is visited once, so
+the time taken grows linearly with the number of files.
+
+The result is a DiffTree: a FileSystemTree holding only the files that
+grew, with their growth as data_size, and the folders containing them. It
+can be passed to run_visualisation directly. The trees compared can be
+FileSystemTrees or CompactTrees, including snapshots (see snapshot.py); the
+nodes of a CompactTree are compared without creating a view for each one.
+"""
+from operator import itemgetter
+
+from compact_tree import CompactNode
+from tree_data import AbstractTree, FileSystemTree, _NO_SUBTREES
+
+
+# The changes diff_trees can show.
+DIFF_MODES = ('grown', 'shrunk')
+
+
+class DiffTree(FileSystemTree):
+    """A tree of the files and folders whose size changed between two
+    scans. The data_size of a node is how much it grew (or, for a diff of
+    what shrank, how much it shrank).
+
+    === Public Attributes ===
+    @type old_size: int
+        The size of the file or folder in the old scan, or 0 if it was not
+        there.
+    @type new_size: int
+        The size of the file or folder in the new scan, or 0 if it is no
+        longer there.
+    """
+    __slots__ = ('old_size', 'new_size')
+
+
+def diff_trees(old, new, mode='grown'):
+    """Return the DiffTree of the files and folders that grew from the tree
+    <old> to the tree <new>, or, if <mode> is 'shrunk', that shrank.
+
+    Files are matched by their path. A file that was added counts as grown
+    by its whole size, and a file that was removed as shrunk by its whole
+    size.
+
+    @type old: AbstractTree
+    @type new: AbstractTree
+    @type mode: str
+    @rtype: DiffTree
+
+    >>> old = FileSystemTree.__new__(FileSystemTree)
+    >>> AbstractTree.__init__(old, 'top', [AbstractTree('a', [], 10),
+    ...                                    AbstractTree('b', [], 20)])
+    >>> new = FileSystemTree.__new__(FileSystemTree)
+    >>> AbstractTree.__init__(new, 'top', [AbstractTree('b', [], 25),
+    ...                                    AbstractTree('c', [], 5),
+    ...                                    AbstractTree('a', [], 4)])
+    >>> grown = diff_trees(old, new)
+    >>> [(t.get_root(), t.data_size) for t in grown.get_subtrees()]
+    [('b', 5), ('c', 5)]
+    >>> grown.data_size, grown.old_size, grown.new_size
+    (10, 30, 34)
+    >>> [(t.get_root(), t.data_size) for t in diff_trees(old, new, 'shrunk')
+    ...  .get_subtrees()]
+    [('a', 6)]
+    """
+    if mode not in DIFF_MODES:
+        raise ValueError('unknown diff mode: {!r}'.format(mode))
+    sign = 1 if mode == 'grown' else -1
+    old_entries = _entries_of(old)
+    new_entries = _entries_of(new)
+
+    root = DiffTree.__new__(DiffTree)
+    AbstractTree.__init__(root, new._root, [], 0)
+    root.old_size = old.data_size
+    root.new_size = new.data_size
+    # Every folder of the diff, each one after the folder containing it.
+    folders = [root]
+    stack = [(root, _handle(old), _handle(new))]
+    while stack:
+        folder, old_handle, new_handle = stack.pop()
+        olds = [] if old_handle is None else old_entries(old_handle)
+        news = [] if new_handle is None else new_entries(new_handle)
+        for old_entry, new_entry in _merge(olds, news):
+            old_size = 0 if old_entry is None else old_entry[1]
+            new_size = 0 if new_entry is None else new_entry[1]
+            name = (old_entry if new_entry is None else new_entry)[0]
+            growth = sign * (new_size - old_size)
+            is_folder = (old_entry is not None and old_entry[3]) or \
+                (new_entry is not None and new_entry[3])
+            if is_folder:
+                subitem = folder._add_scanned(name, 0)
+                folders.append(subitem)
+                stack.append((subitem,
+                              None if old_entry is None else old_entry[2],
+                              None if new_entry is None else new_entry[2]))
+            elif growth > 0:
+                subitem = folder._add_scanned(name, growth)
+            else:
+                continue
+            subitem.old_size = old_size
+            subitem.new_size = new_size
+
+    # Going backwards computes every sub-folder before the folder that
+    # contains it, so the folders where nothing changed can be dropped.
+    for folder in reversed(folders):
+        subtrees = [subtree for subtree in folder._subtrees
+                    if subtree.data_size > 0]
+        folder._subtrees = subtrees if subtrees else _NO_SUBTREES
+        folder.data_size = sum(subtree.data_size for subtree in subtrees)
+    return root
+
+
+def _merge(olds, news):
+    """Yield the (old, new) pairs of entries of <olds> and <news> with the
+    same name, with None for the entries that are only in one of them.
+
+    Both lists are sorted by name first. A file and a folder with the same
+    name are not paired, since one replaced the other.
+
+    @type olds: list[(str, int, object, bool)]
+    @type news: list[(str, int, object, bool)]
+    @rtype: iterator[((str, int, object, bool) | None,
+                      (str, int, object, bool) | None)]
+
+    >>> entries = lambda *names: [(n, 0, None, n == 'dir') for n in names]
+    >>> [(o and o[0], n and n[0]) for o, n in _merge(entries('b', 'a', 'dir'),
+    ...                                             entries('c', 'a'))]
+    [('a', 'a'), ('b', None), (None, 'c'), ('dir', None)]
+    """
+    olds.sort(key=itemgetter(0))
+    news.sort(key=itemgetter(0))
+    i = 0
+    j = 0
+    while i < len(olds) and j < len(news):
+        old_name = olds[i][0]
+        new_name = news[j][0]
+        if old_name == new_name:
+            if olds[i][3] == news[j][3]:
+                yield olds[i], news[j]
+            else:
+                yield olds[i], None
+                yield None, news[j]
+            i += 1
+            j += 1
+        elif old_name < new_name:
+            yield olds[i], None
+            i += 1
+        else:
+            yield None, news[j]
+            j += 1
+    for entry in olds[i:]:
+        yield entry, None
+    for entry in news[j:]:
+        yield None, entry
+
+
+def _handle(tree):
+    """Return what _entries_of(tree) takes to list the entries of <tree>.
+
+    @type tree: AbstractTree
+    @rtype: object
+    """
+    return tree._index if isinstance(tree, CompactNode) else tree
+
+
+def _entries_of(tree):
+    """Return a function listing the entries of a folder of the tree
+    <tree>, as (name, size, handle, is_folder) tuples, where handle is what
+    the function takes to list the entries of that entry.
+
+    For a CompactTree, the handles are node indices, so that no view is
+    created for the nodes.
+
+    @type tree: AbstractTree
+    @rtype: object -> list[(str, int, object, bool)]
+    """
+    if isinstance(tree, CompactNode):
+        store = tree._store
+        first_child = store._first_child
+        next_sibling = store._next_sibling
+        size = store._size
+        name = store.name
+
+        def compact_entries(index):
+            entries = []
+            child = first_child[index]
+            while child != -1:
+                entries.append((name(child), size[child], child,
+                                first_child[child] != -1))
+                child = next_sibling[child]
+            return entries
+        return compact_entries
+
+    def tree_entries(folder):
+        return [(subtree._root, subtree.data_size, subtree,
+                 bool(subtree._subtrees)) for subtree in folder._subtrees]
+    return tree_entries
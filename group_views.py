@@ -0,0 +1,322 @@
+"""
+=== Module Description ===
+This module builds other hierarchies than the folders from a single scan:
+the files grouped by extension, by owner and then folder, or by how long
+ago they were modified.
+
+The scan is kept as a FileTable: one column (a typed array, or a list for
+the names) per piece of metadata, with one row per file. The owner and
+modification time of each file come from the stat the scanner makes for its
+size anyway (see DirectoryScanner.list_dir_stats), so reading them costs no
+extra system call.
+
+A view is built with one group-by pass over the columns: the rows are
+sorted once by the key of the view (e.g. the extension of each file, or its
+owner and folder), and the runs of equal keys are the groups. The sort and
+the runs are done by sorted and itertools.groupby, not by filling a dict of
+groups one file at a time. The files of each group are then added to the
+tree, and their sizes added up, in one go (see CompactTree.add_nodes).
+
+Each view is a CompactTree, so it can be passed to run_visualisation like
+any other tree. It is built the first time it is asked for, and kept:
+switching between views never scans again.
+
+    table = FileTable.from_path(path)
+    run_visualisation(table.view('extension'))
+"""
+import bisect
+import os
+import time
+from array import array
+from itertools import groupby
+
+from compact_tree import CompactTree, NO_PARENT
+from scanner import DirectoryScanner
+
+try:
+    import pwd
+except ImportError:
+    # Not available on Windows, where owners are shown by number.
+    pwd = None
+
+
+# The views a FileTable can build: the files grouped by folder, by
+# extension, by owner and then folder, or by age.
+GROUP_VIEWS = ('folder', 'extension', 'owner', 'age')
+
+# The groups of the 'age' view, from the most recently modified: the name
+# of each group, and the oldest a file in it can be, in seconds before the
+# scan.
+AGE_BUCKETS = (('last day', 24 * 3600),
+               ('last week', 7 * 24 * 3600),
+               ('last month', 30 * 24 * 3600),
+               ('last year', 365 * 24 * 3600),
+               ('older', None))
+
+
+class FileTable:
+    """The files found by a scan, with their metadata stored by column.
+
+    === Public Attributes ===
+    @type scanned_at: float
+        When the scan ended, as returned by time.time(). The ages of the
+        'age' view are counted from it.
+
+    === Private Attributes ===
+    @type _root: str
+        The name of the file or folder that was scanned.
+    @type _separator: str
+        The separator of the paths of the views.
+    @type _folder_names: list[str]
+        The path of each folder, relative to the one scanned (which is
+        os.curdir).
+    @type _names: list[str]
+        The name of each file.
+    @type _folders: array
+        The index in <_folder_names> of the folder of each file.
+    @type _sizes: array
+        The size of each file.
+    @type _owners: array
+        The owner of each file, as a user id.
+    @type _mtimes: array
+        The modification time of each file.
+    @type _views: dict[str, CompactNode]
+        The views built so far.
+    """
+    def __init__(self, root, separator=os.sep):
+        """Initialize a new FileTable with no files, for a scan of the file
+        or folder named <root>.
+
+        @type self: FileTable
+        @type root: str
+        @type separator: str
+        @rtype: None
+        """
+        self.scanned_at = time.time()
+        self._root = root
+        self._separator = separator
+        self._folder_names = []
+        self._names = []
+        self._folders = array('i')
+        self._sizes = array('q')
+        self._owners = array('I')
+        self._mtimes = array('d')
+        self._views = {}
+
+    @classmethod
+    def from_path(cls, path, scanner=None):
+        """Return the FileTable of the files in the file or folder <path>.
+
+        Precondition: <path> is a valid path for this computer.
+
+        @type path: str
+        @type scanner: DirectoryScanner | None
+        @rtype: FileTable
+        """
+        if scanner is None:
+            scanner = DirectoryScanner()
+        name, path, is_dir, size = scanner.stat_path(path)
+        table = cls(name)
+        if not is_dir:
+            st = os.stat(path)
+            table.add_files(os.curdir, [(name, path, False, size)],
+                            [(st.st_uid, st.st_mtime)])
+        else:
+            stack = [(path, os.curdir)]
+            while stack:
+                folder_path, folder_name = stack.pop()
+                content, stats = scanner.list_dir_stats(folder_path)
+                table.add_files(folder_name, content, stats)
+                for name, subitem_path, is_dir, _ in content:
+                    if is_dir:
+                        stack.append((subitem_path,
+                                      os.path.join(folder_name, name)
+                                      if folder_name != os.curdir else name))
+        table.scanned_at = time.time()
+        return table
+
+    def __len__(self):
+        """Return the number of files in this table.
+
+        @type self: FileTable
+        @rtype: int
+        """
+        return len(self._names)
+
+    def add_files(self, folder_name, content, stats):
+        """Add the files of the listing <content> of the folder
+        <folder_name>, whose (owner, modification time) are <stats>, as
+        returned by DirectoryScanner.list_dir_stats. The folders of
+        <content> are left out.
+
+        The views already built are not changed.
+
+        @type self: FileTable
+        @type folder_name: str
+        @type content: list[(str, str, bool, int)]
+        @type stats: list[(int, float) | None]
+        @rtype: None
+        """
+        files = [(entry, st) for entry, st in zip(content, stats)
+                 if st is not None]
+        folder = len(self._folder_names)
+        self._folder_names.append(folder_name)
+        self._names.extend(entry[0] for entry, _ in files)
+        self._folders.extend([folder] * len(files))
+        self._sizes.extend(entry[3] for entry, _ in files)
+        self._owners.extend(st[0] for _, st in files)
+        self._mtimes.extend(st[1] for _, st in files)
+
+    def view(self, kind):
+        """Return the root of the tree of the files grouped by <kind>, one
+        of GROUP_VIEWS:
+
+        - 'folder': folder -> file, with each folder named by its path;
+        - 'extension': extension -> file;
+        - 'owner': owner -> folder -> file;
+        - 'age': age (see AGE_BUCKETS) -> file.
+
+        The view is built the first time it is asked for. Changes made to
+        one view (e.g. deleting a file in the visualiser) do not change the
+        others.
+
+        @type self: FileTable
+        @type kind: str
+        @rtype: CompactNode
+
+        >>> table = FileTable('top', '/')
+        >>> table.add_files('.', [('a.py', '', False, 10),
+        ...                       ('sub', '', True, 0),
+        ...                       ('B.PY', '', False, 5)],
+        ...                 [(0, table.scanned_at), None, (0, 0.0)])
+        >>> table.add_files('sub', [('c.txt', '', False, 7)],
+        ...                 [(0, table.scanned_at)])
+        >>> root = table.view('extension')
+        >>> [(t.get_root(), t.data_size) for t in root.get_subtrees()]
+        [('.py', 15), ('.txt', 7)]
+        >>> root.get_subtrees()[0].get_subtrees()[1].get_separator()
+        'top/.py/B.PY'
+        >>> [(t.get_root(), t.data_size)
+        ...  for t in table.view('age').get_subtrees()]
+        [('last day', 17), ('older', 5)]
+        """
+        root = self._views.get(kind)
+        if root is None:
+            if kind == 'folder':
+                levels = [(self._folders, self._folder_names.__getitem__)]
+            elif kind == 'extension':
+                levels = [(_extensions(self._names), _extension_label)]
+            elif kind == 'owner':
+                levels = [(self._owners, _owner_label),
+                          (self._folders, self._folder_names.__getitem__)]
+            elif kind == 'age':
+                limits = [limit for _, limit in AGE_BUCKETS[:-1]]
+                scanned_at = self.scanned_at
+                levels = [([bisect.bisect_left(limits, scanned_at - mtime)
+                            for mtime in self._mtimes],
+                           lambda bucket: AGE_BUCKETS[bucket][0])]
+            else:
+                raise ValueError('unknown group view: {!r}'.format(kind))
+            root = self._group(levels)
+            self._views[kind] = root
+        return root
+
+    def kind_of(self, tree):
+        """Return the kind of view whose root is <tree>, or None if <tree>
+        is not a view built by this table.
+
+        @type self: FileTable
+        @type tree: AbstractTree
+        @rtype: str | None
+        """
+        for kind, root in self._views.items():
+            if root is tree:
+                return kind
+        return None
+
+    def _group(self, levels):
+        """Return the root of a tree of the files grouped by each of
+        <levels> in turn.
+
+        Each level is a column holding the key of each file for that level,
+        and a function giving the name of the group of a key. The groups
+        are in the order of their keys.
+
+        @type self: FileTable
+        @type levels: list[(list | array, object -> str)]
+        @rtype: CompactNode
+        """
+        if len(levels) == 1:
+            keys = levels[0][0]
+        else:
+            keys = list(zip(*[column for column, _ in levels]))
+        # The one sort of the group-by: every group of every level is then
+        # a run of consecutive rows.
+        order = sorted(range(len(self._names)), key=keys.__getitem__)
+
+        tree = CompactTree(self._separator)
+        root = tree.add_node(NO_PARENT, self._root, 0)
+        names = self._names
+        sizes = self._sizes
+        stack = [(root, 0, order)]
+        while stack:
+            parent, depth, rows = stack.pop()
+            if depth == len(levels):
+                leaf_sizes = [sizes[row] for row in rows]
+                tree.add_nodes(parent, [names[row] for row in rows],
+                               leaf_sizes)
+                tree.add_size(parent, sum(leaf_sizes))
+                continue
+            column, label = levels[depth]
+            groups = [(tree.add_node(parent, label(key), 0), depth + 1,
+                       list(group))
+                      for key, group in groupby(rows, column.__getitem__)]
+            # Popped in order, so the nodes are added in the same order as
+            # their keys.
+            groups.reverse()
+            stack.extend(groups)
+        return tree.root()
+
+
+def _extensions(names):
+    """Return the extension of each file of <names>, in lower case.
+
+    This is os.path.splitext(name)[1].lower(), as used by colour_for, with
+    the string methods it is made of called directly: a name has an
+    extension if it has a dot after its leading dots.
+
+    @type names: list[str]
+    @rtype: list[str]
+
+    >>> _extensions(['a.TXT', 'b.tar.gz', '.bashrc', '..a.b', 'Makefile'])
+    ['.txt', '.gz', '', '.b', '']
+    """
+    return [name[name.rfind('.'):].lower() if '.' in name.lstrip('.')
+            else '' for name in names]
+
+
+def _extension_label(extension):
+    """Return the name of the group of the files with <extension>.
+
+    @type extension: str
+    @rtype: str
+
+    >>> _extension_label('.py'), _extension_label('')
+    ('.py', 'no extension')
+    """
+    return extension if extension else 'no extension'
+
+
+def _owner_label(uid):
+    """Return the name of the group of the files owned by the user <uid>:
+    the name of the user, or its number if it has none.
+
+    @type uid: int
+    @rtype: str
+    """
+    if pwd is not None:
+        try:
+            return pwd.getpwuid(uid).pw_name
+        except KeyError:
+            pass
+    return 'uid {}'.format(uid)
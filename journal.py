@@ -0,0 +1,228 @@
+"""
+=== Module Description ===
+This module records the deletions and resizes made to a tree, so that they
+can be undone and redone.
+
+The journal does not copy the tree. Each change is kept as its inverse: a
+deleted tree is only detached from its parent, and is recorded with that
+parent and the position it had among its subtrees; a resize is recorded as
+the difference in size. Undoing or redoing a change then only walks up the
+ancestors of the tree it was made to, like the change itself did.
+
+Only the last <history> changes are kept, so the memory used is bounded
+whatever the number of changes made. A tree deleted by a change that is
+dropped from the history can no longer be brought back, and is freed.
+"""
+import math
+from collections import deque
+
+
+# The number of changes kept by default.
+DEFAULT_HISTORY = 100
+
+
+class TreeJournal:
+    """Deletions and resizes made to a tree, which can be undone and redone.
+
+    === Private Attributes ===
+    @type _tree: AbstractTree
+        The tree the changes are made to.
+    @type _undo: deque[tuple]
+        The changes that can be undone, the most recent last:
+        ('delete', tree, parent, position) or ('resize', leaf, delta).
+    @type _redo: list[tuple]
+        The changes that were undone and can be redone, the most recently
+        undone last. Making a new change clears it.
+    """
+    def __init__(self, tree, history=DEFAULT_HISTORY):
+        """Initialize a new, empty TreeJournal of changes to <tree>, which
+        keeps the last <history> of them.
+
+        @type self: TreeJournal
+        @type tree: AbstractTree
+        @type history: int
+        @rtype: None
+
+        >>> TreeJournal(None, 0)
+        Traceback (most recent call last):
+        ...
+        ValueError: history must be at least 1: 0
+        """
+        if history < 1:
+            raise ValueError('history must be at least 1: {}'.format(history))
+        self._tree = tree
+        self._undo = deque(maxlen=history)
+        self._redo = []
+
+    def __len__(self):
+        """Return the number of changes that can be undone.
+
+        @type self: TreeJournal
+        @rtype: int
+        """
+        return len(self._undo)
+
+    def can_undo(self):
+        """Return True if there is a change to undo.
+
+        @type self: TreeJournal
+        @rtype: bool
+        """
+        return len(self._undo) > 0
+
+    def can_redo(self):
+        """Return True if there is an undone change to redo.
+
+        @type self: TreeJournal
+        @rtype: bool
+        """
+        return len(self._redo) > 0
+
+    def delete(self, tree):
+        """Delete the leaf or folder <tree>, and subtract its data_size from
+        its ancestors, like complete_leaf_deletion. Return True if it was
+        deleted, or False (and do nothing else) if <tree> is not in the tree
+        or is the tree itself.
+
+        @type self: TreeJournal
+        @type tree: AbstractTree
+        @rtype: bool
+
+        >>> from tree_data import AbstractTree
+        >>> a = AbstractTree('a', [], 10)
+        >>> big = AbstractTree('big', [a, AbstractTree('b', [], 5)])
+        >>> journal = TreeJournal(big)
+        >>> journal.delete(a), big.data_size
+        (True, 5)
+        >>> journal.delete(a), journal.delete(big)
+        (False, False)
+        """
+        if tree is self._tree or not self._tree._holds(tree):
+            return False
+        parent = tree.get_parent_tree()
+        position = tree._remove_from_parent()
+        self._record(('delete', tree, parent, position))
+        return True
+
+    def resize(self, leaf, new_size):
+        """Set the data_size of <leaf> to <new_size>, like resize_leaf.
+
+        Pre-condition: <leaf> is a leaf of the tree.
+
+        @type self: TreeJournal
+        @type leaf: AbstractTree
+        @type new_size: int
+        @rtype: None
+        """
+        delta = new_size - leaf.data_size
+        leaf.resize_leaf(new_size)
+        self._record(('resize', leaf, delta))
+
+    def increase(self, leaf):
+        """Increase the data_size of <leaf> by 1%, like increase_size.
+
+        @type self: TreeJournal
+        @type leaf: AbstractTree
+        @rtype: None
+        """
+        self.resize(leaf, leaf.data_size + math.ceil(leaf.data_size * 0.01))
+
+    def decrease(self, leaf):
+        """Decrease the data_size of <leaf> by 1%, like decrease_size.
+
+        @type self: TreeJournal
+        @type leaf: AbstractTree
+        @rtype: None
+        """
+        decrease = math.ceil(leaf.data_size * 0.01)
+        self.resize(leaf, max(leaf.data_size - decrease, 1))
+
+    def undo(self):
+        """Undo the most recent change that has not been undone. Return the
+        tree it was made to, or None if there is nothing to undo.
+
+        @type self: TreeJournal
+        @rtype: AbstractTree | None
+
+        >>> from tree_data import AbstractTree
+        >>> a = AbstractTree('a', [], 10)
+        >>> b = AbstractTree('b', [], 5)
+        >>> big = AbstractTree('big', [a, b])
+        >>> journal = TreeJournal(big)
+        >>> journal.delete(a)
+        True
+        >>> journal.resize(b, 50)
+        >>> big.data_size
+        50
+        >>> journal.undo() is b, big.data_size
+        (True, 5)
+        >>> journal.undo() is a, big.data_size
+        (True, 15)
+        >>> [tree.get_root() for tree in big.get_subtrees()]
+        ['a', 'b']
+        >>> journal.undo() is None
+        True
+        """
+        if not self._undo:
+            return None
+        change = self._undo.pop()
+        if change[0] == 'delete':
+            _, tree, parent, position = change
+            # Back where it was, so the paths under it are still right.
+            parent._add_subtree(tree, position, restore=True)
+        else:
+            _, tree, delta = change
+            tree._add_to_size(-delta)
+        self._redo.append(change)
+        return tree
+
+    def redo(self):
+        """Make again the most recently undone change. Return the tree it
+        was made to, or None if there is nothing to redo.
+
+        @type self: TreeJournal
+        @rtype: AbstractTree | None
+
+        >>> from tree_data import AbstractTree
+        >>> a = AbstractTree('a', [], 10)
+        >>> big = AbstractTree('big', [a, AbstractTree('b', [], 5)])
+        >>> journal = TreeJournal(big)
+        >>> journal.delete(a)
+        True
+        >>> journal.undo() is a, journal.redo() is a, big.data_size
+        (True, True, 5)
+        >>> journal.redo() is None
+        True
+        """
+        if not self._redo:
+            return None
+        change = self._redo.pop()
+        if change[0] == 'delete':
+            _, tree, _, position = change
+            tree._remove_from_parent(position)
+        else:
+            _, tree, delta = change
+            tree._add_to_size(delta)
+        self._undo.append(change)
+        return tree
+
+    def clear(self):
+        """Forget every change, for example because the tree was changed
+        some other way and they may no longer apply.
+
+        @type self: TreeJournal
+        @rtype: None
+        """
+        self._undo.clear()
+        self._redo = []
+
+    def _record(self, change):
+        """Add the new <change> to the history, and forget the undone
+        changes, which can no longer be redone.
+
+        @type self: TreeJournal
+        @type change: tuple
+        @rtype: None
+        """
+        self._undo.append(change)
+        self._redo = []
@@ -0,0 +1,337 @@
+"""
+=== Module Description ===
+This module builds FileSystemTrees from listings of a file system that were
+saved earlier, instead of scanning the file system itself:
+
+- the output of find -printf '%s %p\n': one "<size> <path>" line per entry;
+- a JSON export of ncdu (ncdu -o);
+- a CSV file with one "<path>,<size>" row per entry (an optional header row
+  is skipped).
+
+Each listing is read in a single pass through a memory map, so the listing
+itself never has to fit in memory; only the tree being built does. Lines are
+parsed as bytes, and the folder a line belongs to is found with one dict
+lookup (none at all for the common case of a line in the same folder as the
+previous one).
+"""
+import csv
+import json
+import mmap
+import os
+import re
+from contextlib import contextmanager
+
+from scanner import InodeSet
+from tree_data import AbstractTree, FileSystemTree, _compute_folder_sizes
+
+
+# The formats load_listing can read, and the file extensions guessed as each.
+LISTING_FORMATS = ('find', 'ncdu', 'csv')
+_EXTENSIONS = {'.json': 'ncdu', '.csv': 'csv'}
+
+# The tokens of an ncdu export: the brackets of the arrays that hold a
+# folder, and the flat objects that describe each entry. Anything else (the
+# commas, and the version numbers at the start) is skipped.
+_NCDU_TOKEN = re.compile(rb'[\[\]]|\{(?:[^"{}]|"(?:[^"\\]|\\.)*")*\}')
+
+
+def load_listing(path, listing_format=None, size_mode='apparent'):
+    """Return the tree described by the listing saved in the file <path>.
+
+    <listing_format> is one of LISTING_FORMATS; if it is None, it is guessed
+    from the extension of <path>. <size_mode> is only used by ncdu exports,
+    which hold both the apparent and the allocated size of each file.
+
+    @type path: str
+    @type listing_format: str | None
+    @type size_mode: str
+    @rtype: FileSystemTree
+    """
+    if listing_format is None:
+        extension = os.path.splitext(path)[1].lower()
+        listing_format = _EXTENSIONS.get(extension, 'find')
+    if listing_format == 'find':
+        return tree_from_find(path)
+    elif listing_format == 'ncdu':
+        return tree_from_ncdu(path, size_mode)
+    elif listing_format == 'csv':
+        return tree_from_csv(path)
+    raise ValueError('unknown listing format: {!r}'.format(listing_format))
+
+
+def tree_from_find(path):
+    """Return the tree described by the output of find -printf '%s %p\\n'
+    saved in the file <path>.
+
+    find also prints the size of each folder itself; it is ignored once the
+    folder turns out to have entries, but an empty folder is shown with that
+    size.
+
+    @type path: str
+    @rtype: FileSystemTree
+    """
+    builder = ListingBuilder()
+    for line in _lines(path):
+        size, _, entry_path = line.rstrip(b'\r\n').partition(b' ')
+        if entry_path:
+            builder.add(entry_path, int(size))
+    return builder.tree()
+
+
+def tree_from_csv(path):
+    """Return the tree described by the "<path>,<size>" rows of the CSV file
+    <path>. A first row whose size is not a number is taken as a header and
+    skipped.
+
+    @type path: str
+    @rtype: FileSystemTree
+    """
+    builder = ListingBuilder()
+    rows = csv.reader(line.decode('utf-8', 'surrogateescape')
+                      for line in _lines(path))
+    for row in rows:
+        if len(row) < 2:
+            continue
+        try:
+            size = int(row[1])
+        except ValueError:
+            if rows.line_num == 1:
+                continue
+            raise
+        builder.add(row[0].encode('utf-8', 'surrogateescape'), size)
+    return builder.tree()
+
+
+def tree_from_ncdu(path, size_mode='apparent'):
+    """Return the tree described by the ncdu JSON export saved in the file
+    <path>.
+
+    In the 'apparent' size mode, the size of a file is its "asize";
+    in the 'allocated' size mode, it is its "dsize", and a file with several
+    hard links is only counted the first time it is seen, like ncdu does.
+
+    @type path: str
+    @type size_mode: str
+    @rtype: FileSystemTree
+    """
+    size_key = 'dsize' if size_mode == 'allocated' else 'asize'
+    inodes = InodeSet()
+    tree = None
+    folders = []
+    # The folders the current token is in, with their device numbers.
+    stack = []
+    # Set by '[': the next object describes a folder rather than a file.
+    opening = False
+    depth = 0
+
+    with _mapped(path) as data:
+        for match in _NCDU_TOKEN.finditer(data):
+            token = match.group()
+            if token == b'[':
+                depth += 1
+                # The outermost array holds the version and metadata.
+                opening = depth > 1
+                continue
+            elif token == b']':
+                depth -= 1
+                if depth > 0 and stack:
+                    stack.pop()
+                continue
+            elif depth < 2:
+                continue
+
+            info = json.loads(token)
+            name = info['name']
+            if opening:
+                opening = False
+                if stack:
+                    folder = stack[-1][0]._add_scanned(name, 0)
+                    dev = info.get('dev', stack[-1][1])
+                else:
+                    folder = FileSystemTree.__new__(FileSystemTree)
+                    AbstractTree.__init__(folder, name, [], 0)
+                    tree = folder
+                    dev = info.get('dev', 0)
+                folders.append(folder)
+                stack.append((folder, dev))
+                continue
+
+            size = info.get(size_key, 0)
+            if info.get('hlnkc') and size_mode == 'allocated':
+                dev = info.get('dev', stack[-1][1])
+                if not inodes.add(dev, info['ino']):
+                    size = 0
+            stack[-1][0]._add_scanned(name, size)
+
+    if tree is None:
+        raise ValueError('{} is not an ncdu export'.format(path))
+    _compute_folder_sizes(folders)
+    return tree
+
+
+class ListingBuilder:
+    """Builds a FileSystemTree from (path, size) pairs, in any order.
+
+    A path that is only seen as the folder of other paths is added as a
+    folder; a path that is listed with a size and later turns out to have
+    entries becomes a folder too, and its own size is dropped, however far
+    apart in the listing they are.
+
+    === Private Attributes ===
+    @type _top: FileSystemTree
+        The folder holding the first component of every path.
+    @type _folders: dict[bytes, FileSystemTree]
+        Every folder by path.
+    @type _entries: dict[bytes, FileSystemTree]
+        The entries added to the folder <_last> that have no entries yet, by
+        path. They are kept so that a folder can be listed just before its
+        entries, as find does (or just before the other entries of its own
+        folder, as in a sorted listing). Only the entries of one folder are
+        kept, so the memory used does not grow with the number of files.
+    @type _files: dict[bytes, dict[str, FileSystemTree]]
+        The entries with no entries of their own, by name, of the folders
+        that a folder listed with a size got its first entry in after
+        <_entries> had moved on (by path). Such a folder is only indexed
+        when that happens, and then kept up to date, so a listing in find's
+        order needs none of them.
+    @type _order: list[FileSystemTree]
+        Every folder, each one after the folder containing it.
+    @type _last: (bytes, FileSystemTree, dict[str, FileSystemTree] | None)
+        The path and tree of the last folder an entry was added to, and its
+        index in <_files>, if it has one.
+    @type _absolute: bool
+        True if the paths start with '/'.
+    """
+    def __init__(self):
+        """Initialize a new, empty ListingBuilder.
+
+        @type self: ListingBuilder
+        @rtype: None
+        """
+        self._top = FileSystemTree.__new__(FileSystemTree)
+        AbstractTree.__init__(self._top, '.', [], 0)
+        self._folders = {b'': self._top}
+        self._entries = {}
+        self._files = {}
+        self._order = [self._top]
+        self._last = (b'', self._top, None)
+        self._absolute = False
+
+    def add(self, path, size):
+        """Add the entry <path> of <size> bytes.
+
+        The components of <path> are separated by '/'.
+
+        @type self: ListingBuilder
+        @type path: bytes
+        @type size: int
+        @rtype: None
+        """
+        if path.startswith(b'/'):
+            self._absolute = True
+        path = path.rstrip(b'/')
+        if not path or path in self._folders:
+            # The top folder itself, or a folder whose entries were listed
+            # first.
+            return
+        parent_path, _, name = path.rpartition(b'/')
+        if parent_path == self._last[0]:
+            _, parent, files = self._last
+        else:
+            parent = self._folder(parent_path)
+            files = self._files.get(parent_path)
+            self._last = (parent_path, parent, files)
+            self._entries = {}
+        name = os.fsdecode(name)
+        subtree = parent._add_scanned(name, size)
+        self._entries[path] = subtree
+        if files is not None:
+            files[name] = subtree
+
+    def tree(self):
+        """Return the tree built so far, and compute its folder sizes.
+
+        If every path starts with the same folders, the tree starts at the
+        deepest of them, named by its whole path.
+
+        @type self: ListingBuilder
+        @rtype: FileSystemTree
+        """
+        _compute_folder_sizes(self._order)
+        tree = self._top
+        names = []
+        while len(tree._subtrees) == 1 and tree._subtrees[0]._subtrees:
+            tree = tree._subtrees[0]
+            names.append(tree._root)
+        prefix = '/' if self._absolute else ''
+        if names:
+            tree._root = prefix + '/'.join(names)
+        elif self._absolute:
+            tree._root = '/'
+        tree._parent_tree = None
+        return tree
+
+    def _folder(self, path):
+        """Return the folder tree for <path>, adding it and any of its
+        ancestors that are missing.
+
+        @type self: ListingBuilder
+        @type path: bytes
+        @rtype: FileSystemTree
+        """
+        missing = []
+        while path not in self._folders:
+            missing.append(path)
+            path = path.rpartition(b'/')[0]
+        folder = self._folders[path]
+        for path in reversed(missing):
+            folder_path, _, name = path.rpartition(b'/')
+            name = os.fsdecode(name)
+            subtree = self._entries.pop(path, None)
+            if subtree is None and folder._subtrees:
+                files = self._files.get(folder_path)
+                if files is None:
+                    files = self._files[folder_path] = {
+                        subtree._root: subtree
+                        for subtree in folder._subtrees
+                        if not subtree._subtrees}
+                subtree = files.pop(name, None)
+            if subtree is None:
+                subtree = folder._add_scanned(name, 0)
+            else:
+                # Listed with the size of the folder itself.
+                subtree.data_size = 0
+            self._folders[path] = subtree
+            self._order.append(subtree)
+            folder = subtree
+        return folder
+
+
+def _lines(path):
+    """Yield each line of the file <path>, as bytes, reading it through a
+    memory map.
+
+    @type path: str
+    @rtype: iterator[bytes]
+    """
+    with _mapped(path) as data:
+        if data:
+            yield from iter(data.readline, b'')
+
+
+@contextmanager
+def _mapped(path):
+    """Return a context manager giving a read-only memory map of the file
+    <path>.
+
+    An empty file cannot be mapped, so it gives b'' instead.
+
+    @type path: str
+    @rtype: contextmanager
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
@@ -0,0 +1,178 @@
+"""
+=== Module Description ===
+This module scans several folders (e.g. the mount points of a computer) at
+the same time, each in its own process, and merges them into one tree.
+
+Each worker process reads its folder with a DirectoryScanner and sends back
+a compact encoding of the tree instead of the tree itself: the names of the
+entries in preorder, joined into one string, and two arrays holding the size
+and the number of children of each entry. Pickling that is much cheaper than
+pickling millions of tree objects, and it does not recurse, so folders of any
+depth can be sent. The main process only has to turn the encoding back into
+FileSystemTree objects, which it does in a single loop.
+
+The trees are merged under a synthetic RootsTree root, with one subtree for
+each folder, named by its path.
+"""
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from scanner import DirectoryScanner, InodeSet, ScanStats
+from tree_data import AbstractTree, FileSystemTree, _compute_folder_sizes
+
+
+# The character used to join the names of the entries; it is the only one
+# that cannot appear in a file name.
+_NAME_SEPARATOR = '\0'
+
+
+class RootsTree(AbstractTree):
+    """The synthetic tree the folders scanned by scan_roots are merged
+    under.
+
+    Its subtrees show their own paths (see FileSystemTree.get_separator),
+    so it only has its name to show.
+    """
+    __slots__ = ()
+
+    def get_separator(self):
+        """Return the string used to separate nodes in the string
+        representation of a path from the tree root to a leaf: for this
+        tree, just its name.
+
+        @type self: RootsTree
+        @rtype: str
+        """
+        return str(self._root)
+
+
+def scan_roots(paths, processes=None, size_mode='apparent', rules=None,
+               name='roots'):
+    """Return a tree named <name> whose subtrees are the FileSystemTrees of
+    the files or folders <paths>, and the combined ScanStats of the scans.
+
+    Each path is scanned in a separate process, using at most <processes>
+    processes at once (by default, one per CPU). <size_mode> and <rules>
+    are used like by DirectoryScanner. In the 'allocated' size mode, a file
+    with hard links in several of <paths> is still counted once.
+
+    Precondition: every path in <paths> is a valid path for this computer.
+
+    @type paths: list[str]
+    @type processes: int | None
+    @type size_mode: str
+    @type rules: ScanRules | None
+    @type name: str
+    @rtype: (RootsTree, ScanStats)
+    """
+    stats = ScanStats()
+    inodes = InodeSet()
+    subtrees = []
+    with ProcessPoolExecutor(processes) as pool:
+        futures = [pool.submit(encode_scan, path, size_mode, rules)
+                   for path in paths]
+        # The results are decoded in order, so the tree is the same
+        # whichever process finishes first.
+        for path, future in zip(paths, futures):
+            encoded, root_stats, links = future.result()
+            sizes = encoded[1]
+            for index, dev, ino in links:
+                if not inodes.add(dev, ino):
+                    # Also linked from a root decoded earlier.
+                    sizes[index] = 0
+                    root_stats.hardlinks += 1
+            subtree = decode_tree(encoded)
+            subtree._root = path
+            subtrees.append(subtree)
+            stats.merge(root_stats)
+    return RootsTree(name, subtrees), stats
+
+
+def encode_scan(path, size_mode='apparent', rules=None):
+    """Scan the file or folder <path>, and return the encoding of its tree
+    (see decode_tree), the ScanStats of the scan, and the files with several
+    hard links that were counted, as (index, device, inode) tuples where
+    index is the position of the file in the encoding.
+
+    This runs in the worker processes.
+
+    Precondition: <path> is a valid path for this computer.
+
+    @type path: str
+    @type size_mode: str
+    @type rules: ScanRules | None
+    @rtype: ((str, array, array), ScanStats, list[(int, int, int)])
+    """
+    scanner = DirectoryScanner(size_mode, rules)
+    names = []
+    sizes = array('q')
+    counts = array('L')
+    links = []
+
+    # Each entry is pushed with its (device, inode) pair if it is a file
+    # with several hard links, since its index is only known once popped.
+    stack = [(scanner.stat_path(path), None)]
+    while stack:
+        (name, subitem_path, is_dir, size), link = stack.pop()
+        if link is not None:
+            links.append((len(names),) + link)
+        names.append(name)
+        sizes.append(size)
+        if not is_dir:
+            counts.append(0)
+            continue
+        content, folder_links = scanner._list_dir(subitem_path)
+        counts.append(len(content))
+        entries = [(entry, None) for entry in content]
+        for index, dev, ino in folder_links:
+            entries[index] = (content[index], (dev, ino))
+        stack.extend(reversed(entries))
+    encoded = (_NAME_SEPARATOR.join(names), sizes, counts)
+    return encoded, scanner.stats, links
+
+
+def decode_tree(encoded):
+    """Return the FileSystemTree encoded by <encoded>.
+
+    <encoded> is a tuple (names, sizes, counts) describing every entry of
+    the tree in preorder: <names> joins the names of the entries with
+    _NAME_SEPARATOR, and <sizes> and <counts> hold the size of each entry
+    (0 for a folder) and the number of entries directly inside it.
+
+    @type encoded: (str, array, array)
+    @rtype: FileSystemTree
+
+    >>> tree = decode_tree(('top\\0a.txt\\0sub\\0b.txt',
+    ...                     array('q', [0, 10, 0, 5]),
+    ...                     array('L', [2, 0, 1, 0])))
+    >>> tree.data_size
+    15
+    >>> [subtree.get_root() for subtree in tree.get_subtrees()]
+    ['a.txt', 'sub']
+    >>> tree.get_subtrees()[1].data_size
+    5
+    """
+    names, sizes, counts = encoded
+    names = names.split(_NAME_SEPARATOR)
+    tree = FileSystemTree.__new__(FileSystemTree)
+    AbstractTree.__init__(tree, names[0], [], sizes[0])
+
+    # Every folder with entries, each one after its parent folder.
+    folders = []
+    # The folders still missing some of their entries, and how many.
+    stack = []
+    if counts[0] > 0:
+        folders.append(tree)
+        stack.append([tree, counts[0]])
+    for index in range(1, len(names)):
+        missing = stack[-1]
+        subitem = missing[0]._add_scanned(names[index], sizes[index])
+        missing[1] -= 1
+        if missing[1] == 0:
+            stack.pop()
+        if counts[index] > 0:
+            # Its entries come next in preorder.
+            folders.append(subitem)
+            stack.append([subitem, counts[index]])
+    _compute_folder_sizes(folders)
+    return tree
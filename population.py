@@ -55,6 +55,8 @@ class PopulationTree(AbstractTree):
 
     See https://datahelpdesk.worldbank.org/ for details about this API.
     """
+    __slots__ = ()
+
     def __init__(self, world, root=None, subtrees=None, data_size=0):
         """Initialize a new PopulationTree.
 
@@ -86,11 +88,7 @@ class PopulationTree(AbstractTree):
         @type self: PopulationTree
         @rtype: str
         """
-        if self._parent_tree is None:
-            return self._root
-        else:
-            parent_path = self._parent_tree.get_separator()
-            return parent_path + ' >>> ' + self._root
+        return self._build_path(' >>> '.join)
 
 
 def _load_data():
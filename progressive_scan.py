@@ -0,0 +1,204 @@
+"""
+=== Module Description ===
+This module contains ProgressiveScan, which builds a FileSystemTree in the
+background so that the visualiser can show the tree while it is still being
+scanned.
+
+A background thread reads the folders, breadth first, and queues each
+listing. The tree itself is only changed by update(), which the visualiser
+calls between frames with a time budget: it adds the queued listings to the
+tree and pushes the new file sizes up to the root. Since only one thread
+changes the tree, the visualiser never sees it half updated.
+
+A folder that cannot be read (e.g. one deleted during the scan, or one the
+user may not read) is left empty and recorded in skipped; the rest of the
+scan goes on.
+"""
+import queue
+import threading
+import time
+from collections import deque
+
+from scanner import DirectoryScanner
+from tree_data import AbstractTree, FileSystemTree
+
+
+class ProgressiveScan:
+    """A FileSystemTree that is filled in while it is displayed.
+
+    === Public Attributes ===
+    @type tree: FileSystemTree
+        The tree being built. Until the scan is done, it only contains the
+        folders read so far.
+    @type skipped: list[(str, OSError)]
+        The folders that could not be read, with the error each one gave.
+        They are left empty in <tree>.
+
+    === Private Attributes ===
+    @type _scanner: DirectoryScanner
+        Reads the file system.
+    @type _listings: queue.Queue
+        The (path, listing) pairs read by the thread and not yet added to
+        <tree>. None is queued once the thread is finished.
+    @type _waiting: dict[str, FileSystemTree]
+        The folder trees whose listing has not been added yet, by path.
+    @type _remaining: dict[FileSystemTree, int]
+        For each unfinished folder, the number of its sub-folders that are
+        unfinished, plus 1 if its own listing has not been added yet.
+    @type _thread: threading.Thread | None
+        The thread reading the file system, or None if it has finished.
+    @type _error: Exception | None
+        The error that stopped the thread, if any. Errors reading a folder
+        do not stop it; see <skipped>.
+    """
+    def __init__(self, path, scanner=None):
+        """Initialize a new ProgressiveScan of <path>, and start scanning.
+
+        Precondition: <path> is a valid path for this computer.
+
+        @type self: ProgressiveScan
+        @type path: str
+        @type scanner: DirectoryScanner | None
+        @rtype: None
+        """
+        if scanner is None:
+            scanner = DirectoryScanner()
+        self.skipped = []
+        self._scanner = scanner
+        self._listings = queue.Queue()
+        self._waiting = {}
+        self._remaining = {}
+        self._thread = None
+        self._error = None
+
+        name, path, is_dir, size = scanner.stat_path(path)
+        self.tree = FileSystemTree.__new__(FileSystemTree)
+        AbstractTree.__init__(self.tree, name, [], size)
+        if is_dir:
+            self._waiting[path] = self.tree
+            self._remaining[self.tree] = 1
+            self._thread = threading.Thread(target=self._read, args=(path,),
+                                            daemon=True)
+            self._thread.start()
+
+    def is_done(self):
+        """Return True if the whole tree has been built.
+
+        @type self: ProgressiveScan
+        @rtype: bool
+        """
+        return not self._remaining
+
+    def unfinished(self):
+        """Return the folder trees that are not completely scanned yet.
+
+        @type self: ProgressiveScan
+        @rtype: set[FileSystemTree]
+        """
+        return set(self._remaining)
+
+    def update(self, budget):
+        """Add the listings read so far to the tree, spending at most about
+        <budget> seconds (but always adding at least one, if there is one).
+
+        Return True if the tree changed.
+
+        @type self: ProgressiveScan
+        @type budget: float
+        @rtype: bool
+        """
+        deadline = time.perf_counter() + budget
+        changed = False
+        while True:
+            try:
+                item = self._listings.get_nowait()
+            except queue.Empty:
+                return changed
+            if item is None:
+                self._thread = None
+                if self._error is not None:
+                    raise self._error
+                return changed
+            self._add_listing(*item)
+            changed = True
+            if time.perf_counter() >= deadline:
+                return changed
+
+    def wait(self):
+        """Block until the whole tree has been built.
+
+        @type self: ProgressiveScan
+        @rtype: None
+        """
+        while not self.is_done():
+            self.update(1.0)
+            if not self.is_done():
+                time.sleep(0.01)
+
+    def _read(self, path):
+        """Read every folder under <path>, breadth first, and queue the
+        listings. This runs on the background thread.
+
+        @type self: ProgressiveScan
+        @type path: str
+        @rtype: None
+        """
+        folders = deque([path])
+        try:
+            while folders:
+                folder_path = folders.popleft()
+                try:
+                    listing = self._scanner.list_dir(folder_path)
+                except OSError as error:
+                    # Added as an empty folder, so that it still finishes.
+                    self.skipped.append((folder_path, error))
+                    listing = []
+                self._listings.put((folder_path, listing))
+                for _, subitem_path, is_dir, _ in listing:
+                    if is_dir:
+                        folders.append(subitem_path)
+        except Exception as error:
+            self._error = error
+        finally:
+            self._listings.put(None)
+
+    def _add_listing(self, path, listing):
+        """Add the entries of the folder <path> to the tree.
+
+        @type self: ProgressiveScan
+        @type path: str
+        @type listing: list[(str, str, bool, int)]
+        @rtype: None
+        """
+        folder = self._waiting.pop(path)
+        folders = 0
+        size = 0
+        for name, subitem_path, is_dir, subitem_size in listing:
+            subitem = folder._add_scanned(name, subitem_size)
+            if is_dir:
+                self._waiting[subitem_path] = subitem
+                self._remaining[subitem] = 1
+                folders += 1
+            else:
+                size += subitem_size
+
+        # The sizes are pushed up once per folder rather than once per file.
+        folder._add_to_size(size)
+        self._remaining[folder] += folders
+        self._finish(folder)
+
+    def _finish(self, folder):
+        """Record that the listing of <folder> was added, and mark it and
+        any of its ancestors whose last unfinished part it was as finished.
+
+        @type self: ProgressiveScan
+        @type folder: FileSystemTree
+        @rtype: None
+        """
+        while folder is not None:
+            self._remaining[folder] -= 1
+            if self._remaining[folder] > 0:
+                return
+            del self._remaining[folder]
+            folder = folder.get_parent_tree()
+
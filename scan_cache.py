@@ -0,0 +1,201 @@
+"""
+=== Module Description ===
+This module contains a DirectoryScanner that keeps an on-disk cache of the
+folders it reads, so that scanning the same file system again is almost
+instant.
+
+For each folder, the cache stores its listing (the name, type and size of
+each entry) together with the folder's modification time and inode number.
+Adding, removing or renaming an entry changes the modification time of the
+folder, so on the next scan only folders whose modification time changed are
+read again; every other listing is loaded from the cache.
+
+The listings are cached after the scan rules are applied, so a cache is only
+used by a scanner with the same rules.
+
+In the 'allocated' size mode, the cache also stores which files have several
+hard links, so that each file is still counted once when some folders come
+from the cache and others from the file system.
+
+Note that writing to an existing file does not change the modification time
+of its folder, so the size of a file that grew in place is only updated once
+its folder changes for some other reason.
+"""
+import os
+import pickle
+import time
+
+from scanner import DirectoryScanner
+
+
+# Bump this when the layout of the cache file changes.
+CACHE_VERSION = 3
+
+
+class CachingScanner(DirectoryScanner):
+    """A DirectoryScanner that reuses the listings saved in a cache file.
+
+    === Public Attributes ===
+    @type cache_path: str
+        The file the cache is loaded from and saved to.
+    @type hits: int
+        The number of folders loaded from the cache.
+    @type misses: int
+        The number of folders read from the file system.
+
+    === Private Attributes ===
+    @type _old: dict[str, (int, int, list[(str, bool, int)],
+                           list[(int, int, int)], float)]
+        The cache loaded from <cache_path>. Each folder path is mapped to
+        the folder's modification time in nanoseconds, its inode number, its
+        listing of (name, is_dir, size) tuples, the hard links in the
+        listing (as returned by DirectoryScanner._read_dir), and the seconds
+        it took to read that listing from the file system.
+    @type _new: dict[str, (int, int, list[(str, bool, int)],
+                           list[(int, int, int)], float)]
+        The cache for the folders read by this scanner, in the same format.
+    @type _seconds_saved: float
+        The time saved by the hits so far.
+    """
+    def __init__(self, cache_path, size_mode='apparent', rules=None):
+        """Initialize a new CachingScanner using the cache file <cache_path>.
+
+        If <cache_path> does not exist, or was written by an incompatible
+        version of this module or with another <size_mode> or other
+        <rules>, the scanner starts with an empty cache.
+
+        @type self: CachingScanner
+        @type cache_path: str
+        @type size_mode: str
+        @type rules: ScanRules | None
+        @rtype: None
+        """
+        DirectoryScanner.__init__(self, size_mode, rules)
+        self.cache_path = cache_path
+        self.hits = 0
+        self.misses = 0
+        self._old = _load_cache(cache_path, size_mode, _rules_key(rules))
+        self._new = {}
+        self._seconds_saved = 0.0
+
+    def _read_dir(self, path, stats=None):
+        """Return the listing of the folder <path> and the hard links in
+        it, loading them from the cache if the folder has not changed since
+        it was cached.
+
+        The cache does not hold the owners and modification times of the
+        files, so if <stats> is given, the folder is always read from the
+        file system.
+
+        @type self: CachingScanner
+        @type path: str
+        @type stats: list[(int, float) | None] | None
+        @rtype: (list[(str, str, bool, int)], list[(int, int, int)])
+        """
+        start = time.perf_counter()
+        st = os.stat(path)
+        cached = self._old.get(path)
+
+        if stats is None and cached is not None and \
+                cached[0] == st.st_mtime_ns and cached[1] == st.st_ino:
+            listing = cached[2]
+            links = cached[3]
+            content = [(name, os.path.join(path, name), is_dir, size)
+                       for name, is_dir, size in listing]
+            seconds = cached[4]
+            with self._lock:
+                self.hits += 1
+                self.stats.entries += len(content)
+                self.stats.stat_calls += 1
+                self._seconds_saved += seconds - (time.perf_counter() - start)
+
+        else:
+            content, links = DirectoryScanner._read_dir(self, path, stats)
+            listing = [(name, is_dir, size)
+                       for name, _, is_dir, size in content]
+            seconds = time.perf_counter() - start
+            with self._lock:
+                self.misses += 1
+                self.stats.stat_calls += 1
+
+        self._new[path] = (st.st_mtime_ns, st.st_ino, listing, links,
+                           seconds)
+        return content, links
+
+    def save(self):
+        """Write the listings of every folder read by this scanner to the
+        cache file, replacing its previous contents.
+
+        Folders that were not part of this scan are dropped from the cache.
+
+        @type self: CachingScanner
+        @rtype: None
+        """
+        temp_path = self.cache_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            pickle.dump((CACHE_VERSION, self.size_mode,
+                         _rules_key(self.rules), self._new),
+                        f, pickle.HIGHEST_PROTOCOL)
+        # Replace the old cache in one step, so it is never half written.
+        os.replace(temp_path, self.cache_path)
+
+    def hit_rate(self):
+        """Return the fraction of folders that were loaded from the cache.
+
+        @type self: CachingScanner
+        @rtype: float
+        """
+        total = self.hits + self.misses
+        if total == 0:
+            return 0.0
+        return self.hits / total
+
+    def report(self):
+        """Return a one line summary of the size of the cache file, the hit
+        rate, and the time saved by the cache in this scan.
+
+        @type self: CachingScanner
+        @rtype: str
+        """
+        if os.path.exists(self.cache_path):
+            cache_size = os.path.getsize(self.cache_path)
+        else:
+            cache_size = 0
+        return 'scan cache: {} folders, {:.1f} KiB, {}/{} hits ' \
+               '({:.0%}), {:.3f}s saved'.format(
+                   len(self._new), cache_size / 1024, self.hits,
+                   self.hits + self.misses, self.hit_rate(),
+                   self._seconds_saved)
+
+
+def _load_cache(cache_path, size_mode, rules_key):
+    """Return the cached listings stored in <cache_path>, or an empty dict if
+    there is no usable cache for <size_mode> and the scan rules with the key
+    <rules_key> there.
+
+    @type cache_path: str
+    @type size_mode: str
+    @type rules_key: tuple | None
+    @rtype: dict[str, (int, int, list[(str, bool, int)],
+                       list[(int, int, int)], float)]
+    """
+    try:
+        with open(cache_path, 'rb') as f:
+            data = pickle.load(f)
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        return {}
+    if not isinstance(data, tuple) or len(data) != 4 or \
+            data[:3] != (CACHE_VERSION, size_mode, rules_key):
+        return {}
+    return data[3]
+
+
+def _rules_key(rules):
+    """Return the key of the scan rules <rules> stored in the cache file.
+
+    @type rules: ScanRules | None
+    @rtype: tuple | None
+    """
+    if rules is None:
+        return None
+    return rules.key()
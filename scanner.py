@@ -0,0 +1,835 @@
+"""
+=== Module Description ===
+This module contains the directory scanner used by FileSystemTree to read
+the file system.
+
+The scanner reads each directory once with os.scandir. The type of each
+entry comes from the directory entry itself, so the only extra system call
+made for an entry is the single stat needed to read the size of a file (or
+to follow a symbolic link). The scanner keeps count of the work it does in
+a ScanStats object, so the cost of a scan can be measured.
+
+By default the size of a file is its apparent size, as reported by
+os.path.getsize. In the 'allocated' size mode, the size of a file is the
+disk space allocated to it instead, and a file with several hard links is
+only counted the first time one of its links is seen.
+
+A scanner can also be given ScanRules, which leave files and folders out of
+the scan. The rules are checked while each folder is read, so a folder that
+is left out is never read, and a file that is left out by name is never
+stat'ed.
+"""
+import fnmatch
+import os
+import re
+import stat
+import threading
+from array import array
+
+
+# The ways the size of a file can be measured.
+SIZE_MODES = ('apparent', 'allocated')
+
+# The types of file systems whose files are generated by the kernel rather
+# than stored anywhere, as they appear in /proc/self/mounts.
+PSEUDO_FILESYSTEMS = frozenset([
+    'autofs', 'binfmt_misc', 'bpf', 'cgroup', 'cgroup2', 'configfs',
+    'debugfs', 'devpts', 'efivarfs', 'fusectl', 'hugetlbfs', 'mqueue',
+    'proc', 'pstore', 'securityfs', 'sysfs', 'tracefs'])
+# Where pseudo file systems are mounted when the mount table cannot be read.
+DEFAULT_PSEUDO_MOUNTS = frozenset(['/proc', '/sys'])
+
+
+class ScanStats:
+    """Counters describing the work done by a DirectoryScanner.
+
+    === Public Attributes ===
+    @type entries: int
+        The number of directory entries seen by the scanner.
+    @type listings: int
+        The number of directories read with os.scandir.
+    @type stat_calls: int
+        The number of stat system calls made by the scanner.
+    @type hardlinks: int
+        The number of files counted as size 0 because another link to the
+        same file was already counted.
+    @type excluded: int
+        The number of directory entries left out by the scan rules.
+    @type pruned: int
+        The number of folders that were not read because of the scan rules.
+    @type avoided_stats: int
+        The number of stat system calls the scan rules made unnecessary.
+    """
+    def __init__(self):
+        """Initialize a new ScanStats with every counter set to 0.
+
+        @type self: ScanStats
+        @rtype: None
+        """
+        self.entries = 0
+        self.listings = 0
+        self.stat_calls = 0
+        self.hardlinks = 0
+        self.excluded = 0
+        self.pruned = 0
+        self.avoided_stats = 0
+
+    def syscalls(self):
+        """Return the number of system calls made by the scanner.
+
+        Reading one directory is counted as a single system call.
+
+        @type self: ScanStats
+        @rtype: int
+
+        >>> stats = ScanStats()
+        >>> stats.listings = 2
+        >>> stats.stat_calls = 5
+        >>> stats.syscalls()
+        7
+        """
+        return self.listings + self.stat_calls
+
+    def merge(self, other):
+        """Add the counters of <other> to these counters.
+
+        @type self: ScanStats
+        @type other: ScanStats
+        @rtype: None
+
+        >>> stats = ScanStats()
+        >>> other = ScanStats()
+        >>> other.entries = 3
+        >>> stats.merge(other)
+        >>> stats.merge(other)
+        >>> stats.entries
+        6
+        """
+        self.entries += other.entries
+        self.listings += other.listings
+        self.stat_calls += other.stat_calls
+        self.hardlinks += other.hardlinks
+        self.excluded += other.excluded
+        self.pruned += other.pruned
+        self.avoided_stats += other.avoided_stats
+
+    def avoided_syscalls(self):
+        """Return the number of system calls the scan rules made
+        unnecessary.
+
+        This is a lower bound: each folder that was not read counts as a
+        single listing, although everything inside it was skipped too.
+
+        @type self: ScanStats
+        @rtype: int
+
+        >>> stats = ScanStats()
+        >>> stats.pruned = 2
+        >>> stats.avoided_stats = 3
+        >>> stats.avoided_syscalls()
+        5
+        """
+        return self.pruned + self.avoided_stats
+
+    def syscalls_per_entry(self):
+        """Return the average number of system calls made per entry.
+
+        @type self: ScanStats
+        @rtype: float
+
+        >>> stats = ScanStats()
+        >>> stats.syscalls_per_entry()
+        0.0
+        >>> stats.entries = 4
+        >>> stats.listings = 1
+        >>> stats.stat_calls = 3
+        >>> stats.syscalls_per_entry()
+        1.0
+        """
+        if self.entries == 0:
+            return 0.0
+        return self.syscalls() / self.entries
+
+    def __str__(self):
+        """Return a one line summary of these counters.
+
+        @type self: ScanStats
+        @rtype: str
+
+        >>> stats = ScanStats()
+        >>> stats.entries = 4
+        >>> stats.listings = 1
+        >>> stats.stat_calls = 3
+        >>> print(stats)
+        4 entries, 1 listings, 3 stats (1.00 syscalls per entry)
+        >>> stats.excluded = 2
+        >>> stats.pruned = 1
+        >>> str(stats).endswith('2 excluded, 1 folders pruned (at least 1 '
+        ...                     'syscalls avoided)')
+        True
+        """
+        summary = '{} entries, {} listings, {} stats ({:.2f} syscalls per ' \
+                  'entry)'.format(self.entries, self.listings,
+                                  self.stat_calls, self.syscalls_per_entry())
+        if self.excluded or self.pruned:
+            summary += ', {} excluded, {} folders pruned (at least {} ' \
+                       'syscalls avoided)'.format(self.excluded, self.pruned,
+                                                  self.avoided_syscalls())
+        return summary
+
+
+class ScanRules:
+    """Rules that leave files and folders out of a scan.
+
+    === Public Attributes ===
+    @type exclude: tuple[str]
+        Glob patterns (like '*.pyc' or '.git'); an entry whose name matches
+        one of them is left out.
+    @type exclude_regex: tuple[str]
+        Regular expressions; an entry whose path contains a match for one of
+        them is left out.
+    @type min_size: int
+        Files smaller than this many bytes are left out.
+    @type max_depth: int | None
+        The folders this many levels below the top of the scan are not
+        read, so they look empty. None for no limit.
+    @type one_file_system: bool
+        If True, folders on another file system than the top of the scan
+        (i.e. mount points) are not read.
+    @type skip_pseudo: bool
+        If True, the mount points of pseudo file systems such as /proc and
+        /sys are not read.
+
+    === Private Attributes ===
+    @type _pattern: re.Pattern | None
+        Matches the names of the entries left out by <exclude>.
+    @type _regex: re.Pattern | None
+        Searches the paths of the entries left out by <exclude_regex>.
+    @type _pseudo_mounts: frozenset[str]
+        The mount points skipped because of <skip_pseudo>.
+    """
+    def __init__(self, exclude=(), exclude_regex=(), min_size=0,
+                 max_depth=None, one_file_system=False, skip_pseudo=False):
+        """Initialize new ScanRules.
+
+        @type self: ScanRules
+        @type exclude: iterable[str]
+        @type exclude_regex: iterable[str]
+        @type min_size: int
+        @type max_depth: int | None
+        @type one_file_system: bool
+        @type skip_pseudo: bool
+        @rtype: None
+        """
+        self.exclude = tuple(exclude)
+        self.exclude_regex = tuple(exclude_regex)
+        self.min_size = min_size
+        self.max_depth = max_depth
+        self.one_file_system = one_file_system
+        self.skip_pseudo = skip_pseudo
+
+        # All the patterns are combined, so each name is matched once.
+        self._pattern = None
+        if self.exclude:
+            self._pattern = re.compile('|'.join(
+                fnmatch.translate(pattern) for pattern in self.exclude))
+        self._regex = None
+        if self.exclude_regex:
+            self._regex = re.compile('|'.join(
+                '(?:{})'.format(regex) for regex in self.exclude_regex))
+        self._pseudo_mounts = frozenset()
+        if skip_pseudo:
+            self._pseudo_mounts = _read_pseudo_mounts()
+
+    def key(self):
+        """Return a tuple that is equal for rules that leave out the same
+        entries, e.g. to tell whether a cached scan used these rules.
+
+        @type self: ScanRules
+        @rtype: tuple
+
+        >>> ScanRules(['*.pyc']).key() == ScanRules(['*.pyc']).key()
+        True
+        >>> ScanRules(['*.pyc']).key() == ScanRules(min_size=1).key()
+        False
+        """
+        return (self.exclude, self.exclude_regex, self.min_size,
+                self.max_depth, self.one_file_system, self.skip_pseudo)
+
+    def excludes_name(self, name, path):
+        """Return True if the entry <name>, whose path is <path>, is left out
+        by the exclude patterns.
+
+        @type self: ScanRules
+        @type name: str
+        @type path: str
+        @rtype: bool
+
+        >>> rules = ScanRules(['*.pyc', '.git'], ['/build/'])
+        >>> rules.excludes_name('a.pyc', 'src/a.pyc')
+        True
+        >>> rules.excludes_name('.git', 'src/.git')
+        True
+        >>> rules.excludes_name('a.py', 'src/build/a.py')
+        True
+        >>> rules.excludes_name('a.py', 'src/a.py')
+        False
+        """
+        if self._pattern is not None and self._pattern.match(name):
+            return True
+        return self._regex is not None and \
+            self._regex.search(path) is not None
+
+    def is_pseudo_mount(self, path):
+        """Return True if <path> is the mount point of a pseudo file system
+        that is skipped.
+
+        @type self: ScanRules
+        @type path: str
+        @rtype: bool
+        """
+        return path in self._pseudo_mounts
+
+
+class DirectoryScanner:
+    """Read files and folders from the file system for FileSystemTree.
+
+    Each entry of a directory is described by a tuple (name, path, is_dir,
+    size). <is_dir> and <size> follow symbolic links, exactly like
+    os.path.isdir and os.path.getsize do. The size of a folder is always 0.
+
+    A scanner may be shared by several threads reading different folders
+    at the same time.
+
+    === Public Attributes ===
+    @type stats: ScanStats
+        The work done by this scanner so far.
+    @type size_mode: str
+        One of SIZE_MODES: how the size of a file is measured.
+    @type inodes: InodeSet
+        The (device, inode) pairs of the files with several hard links seen
+        so far. Only used in the 'allocated' size mode.
+    @type rules: ScanRules | None
+        The rules leaving entries out of the scan, if any.
+
+    === Private Attributes ===
+    @type _lock: threading.Lock
+        Held while <stats> or <inodes> is updated.
+    @type _top: (int, int) | None
+        For the top of the scan (the first path given to stat_path): the
+        number of separators in its path, and its device. None until
+        stat_path is first called. The max_depth and one_file_system rules
+        are relative to it.
+    """
+    def __init__(self, size_mode='apparent', rules=None):
+        """Initialize a new DirectoryScanner measuring file sizes with
+        <size_mode>, and leaving out the entries excluded by <rules>.
+
+        @type self: DirectoryScanner
+        @type size_mode: str
+        @type rules: ScanRules | None
+        @rtype: None
+        """
+        if size_mode not in SIZE_MODES:
+            raise ValueError('unknown size mode: {!r}'.format(size_mode))
+        self.stats = ScanStats()
+        self.size_mode = size_mode
+        self.inodes = InodeSet()
+        self.rules = rules
+        self._lock = threading.Lock()
+        self._top = None
+
+    def stat_path(self, path):
+        """Return the (name, path, is_dir, size) tuple describing <path>.
+
+        This is used for the top-level path of a scan, which is not read
+        from any directory listing. The scan rules do not apply to it.
+
+        Precondition: <path> is a valid path for this computer.
+
+        @type self: DirectoryScanner
+        @type path: str
+        @rtype: (str, str, bool, int)
+        """
+        st = os.stat(path)
+        with self._lock:
+            self.stats.entries += 1
+            self.stats.stat_calls += 1
+            if self._top is None:
+                self._top = (_depth(path), st.st_dev)
+        name = os.path.basename(path)
+        if stat.S_ISDIR(st.st_mode):
+            return name, path, True, 0
+        content = [(name, path, False, self.file_size(st))]
+        if st.st_nlink > 1:
+            self._count_links(content, [(0, st.st_dev, st.st_ino)])
+        return content[0]
+
+    def list_dir(self, path):
+        """Return a list of (name, path, is_dir, size) tuples, one for each
+        entry of the folder <path>, in the order os.listdir would give them.
+        The entries left out by the scan rules are not included.
+
+        Precondition: <path> is a folder.
+
+        @type self: DirectoryScanner
+        @type path: str
+        @rtype: list[(str, str, bool, int)]
+        """
+        return self._list_dir(path)[0]
+
+    def list_dir_stats(self, path):
+        """Return the list_dir listing of the folder <path>, and for each of
+        its entries, the (owner, modification time) of the file as st_uid
+        and st_mtime, or None for a folder.
+
+        They come from the stat already made for the size of each file, so
+        this makes no more system calls than list_dir.
+
+        @type self: DirectoryScanner
+        @type path: str
+        @rtype: (list[(str, str, bool, int)], list[(int, float) | None])
+        """
+        stats = []
+        content = self._list_dir(path, stats)[0]
+        return content, stats
+
+    def _list_dir(self, path, stats=None):
+        """Return the list_dir listing of the folder <path>, and the hard
+        links in it that were counted, as (index, device, inode) tuples.
+
+        If <stats> is given, the (owner, modification time) of each entry
+        of the listing is appended to it, as for list_dir_stats.
+
+        @type self: DirectoryScanner
+        @type path: str
+        @type stats: list[(int, float) | None] | None
+        @rtype: (list[(str, str, bool, int)], list[(int, int, int)])
+        """
+        if self._beyond_max_depth(path):
+            with self._lock:
+                self.stats.pruned += 1
+            return [], []
+        content, links = self._read_dir(path, stats)
+        self._count_links(content, links)
+        if self.size_mode == 'allocated':
+            links = [link for link in links if content[link[0]][3] != 0]
+        return content, links
+
+    def accepts(self, path, st):
+        """Return True if the scan rules let the entry <path>, whose stat
+        result is <st>, be part of the scan.
+
+        This is for entries found outside of a scan (e.g. by a watcher);
+        list_dir applies the same rules more cheaply.
+
+        @type self: DirectoryScanner
+        @type path: str
+        @type st: os.stat_result
+        @rtype: bool
+        """
+        rules = self.rules
+        if rules is None:
+            return True
+        if rules.excludes_name(os.path.basename(path), path):
+            return False
+        if self._beyond_max_depth(os.path.dirname(path)):
+            return False
+        if stat.S_ISDIR(st.st_mode):
+            return not self._prunes_folder(path, st)
+        return self.file_size(st) >= rules.min_size
+
+    def folder_sizes(self, path):
+        """Return a dict mapping the folder <path>, and every folder inside
+        it, to the total size of the files it contains.
+
+        This reads the file system like a full scan does, but does not build
+        any tree, so it is much cheaper in time and memory.
+
+        In the 'allocated' size mode, the dict also maps each file with
+        several hard links that was counted here to its size: its inode is
+        now in <inodes>, so listing its folder again would give it a size
+        of 0.
+
+        Precondition: <path> is a folder.
+
+        @type self: DirectoryScanner
+        @type path: str
+        @rtype: dict[str, int]
+        """
+        sizes = {}
+        parents = {}
+        folders = []
+        # Every folder read, each one after the folder containing it.
+        stack = [path]
+        while stack:
+            folder_path = stack.pop()
+            folders.append(folder_path)
+            total = 0
+            content, links = self._list_dir(folder_path)
+            if self.size_mode == 'allocated':
+                for index, _, _ in links:
+                    sizes[content[index][1]] = content[index][3]
+            for _, subitem_path, is_dir, size in content:
+                if is_dir:
+                    parents[subitem_path] = folder_path
+                    stack.append(subitem_path)
+                else:
+                    total += size
+            sizes[folder_path] = total
+
+        for folder_path in reversed(folders[1:]):
+            sizes[parents[folder_path]] += sizes[folder_path]
+        return sizes
+
+    def _read_dir(self, path, stats=None):
+        """Return the listing of the folder <path>, before any hard link is
+        taken into account, and the hard links in it.
+
+        The hard links are given as (index, device, inode) tuples, for
+        each file of the listing that has several hard links. If <stats> is
+        given, the (owner, modification time) of each entry of the listing
+        is appended to it.
+
+        @type self: DirectoryScanner
+        @type path: str
+        @type stats: list[(int, float) | None] | None
+        @rtype: (list[(str, str, bool, int)], list[(int, int, int)])
+        """
+        rules = self.rules
+        stat_calls = 0
+        excluded = 0
+        pruned = 0
+        avoided_stats = 0
+        content = []
+        links = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if rules is not None and \
+                        rules.excludes_name(entry.name, entry.path):
+                    # Left out before anything is stat'ed; the type of
+                    # an entry that is not a link costs nothing.
+                    excluded += 1
+                    if entry.is_dir(follow_symlinks=False):
+                        pruned += 1
+                    else:
+                        avoided_stats += 1
+                    continue
+
+                if entry.is_dir():
+                    if entry.is_symlink():
+                        # The type of a link target is not part of the
+                        # directory entry, so is_dir() had to stat it.
+                        stat_calls += 1
+                    if rules is not None and self._needs_folder_stat():
+                        # Cached by the entry if is_dir() made it.
+                        if not entry.is_symlink():
+                            stat_calls += 1
+                        if self._prunes_folder(entry.path, entry.stat()):
+                            excluded += 1
+                            pruned += 1
+                            continue
+                    elif rules is not None and \
+                            rules.is_pseudo_mount(entry.path):
+                        excluded += 1
+                        pruned += 1
+                        continue
+                    content.append((entry.name, entry.path, True, 0))
+                    if stats is not None:
+                        stats.append(None)
+                else:
+                    # For a link, this reuses the stat made by is_dir().
+                    stat_calls += 1
+                    st = entry.stat()
+                    size = self.file_size(st)
+                    if rules is not None and size < rules.min_size:
+                        excluded += 1
+                        continue
+                    if st.st_nlink > 1:
+                        links.append((len(content), st.st_dev, st.st_ino))
+                    content.append((entry.name, entry.path, False, size))
+                    if stats is not None:
+                        stats.append((st.st_uid, st.st_mtime))
+
+        with self._lock:
+            self.stats.listings += 1
+            self.stats.entries += len(content) + excluded
+            self.stats.stat_calls += stat_calls
+            self.stats.excluded += excluded
+            self.stats.pruned += pruned
+            self.stats.avoided_stats += avoided_stats
+        return content, links
+
+    def _beyond_max_depth(self, path):
+        """Return True if the folder <path> is too deep to be read under the
+        max_depth rule.
+
+        @type self: DirectoryScanner
+        @type path: str
+        @rtype: bool
+        """
+        if self.rules is None or self.rules.max_depth is None or \
+                self._top is None:
+            return False
+        return _depth(path) - self._top[0] >= self.rules.max_depth
+
+    def _needs_folder_stat(self):
+        """Return True if the scan rules need the stat result of every
+        folder found.
+
+        @type self: DirectoryScanner
+        @rtype: bool
+        """
+        return self.rules.one_file_system and self._top is not None
+
+    def _prunes_folder(self, path, st):
+        """Return True if the folder <path>, whose stat result is <st>, is
+        left out by the file system rules.
+
+        @type self: DirectoryScanner
+        @type path: str
+        @type st: os.stat_result
+        @rtype: bool
+        """
+        rules = self.rules
+        if rules.is_pseudo_mount(path):
+            return True
+        return rules.one_file_system and self._top is not None and \
+            st.st_dev != self._top[1]
+
+    def file_size(self, st):
+        """Return the size of the file whose stat result is <st>, in this
+        scanner's size mode.
+
+        @type self: DirectoryScanner
+        @type st: os.stat_result
+        @rtype: int
+        """
+        if self.size_mode == 'allocated':
+            # st_blocks is always in 512-byte units. It does not exist on
+            # Windows, where the apparent size is the best we have.
+            blocks = getattr(st, 'st_blocks', None)
+            if blocks is not None:
+                return blocks * 512
+        return st.st_size
+
+    def counts_link(self, st):
+        """Return True if the file whose stat result is <st> should be given
+        its size: always, except in the 'allocated' size mode for a file
+        with several hard links, one of which was already counted.
+
+        The file is recorded as counted, like in a scan.
+
+        @type self: DirectoryScanner
+        @type st: os.stat_result
+        @rtype: bool
+        """
+        if self.size_mode != 'allocated' or st.st_nlink <= 1:
+            return True
+        with self._lock:
+            return self.inodes.add(st.st_dev, st.st_ino)
+
+    def _count_links(self, content, links):
+        """In the 'allocated' size mode, set the size of each file of
+        <content> listed in <links> to 0 if another link to the same file
+        was already counted.
+
+        @type self: DirectoryScanner
+        @type content: list[(str, str, bool, int)]
+        @type links: list[(int, int, int)]
+            The index in <content>, device and inode of each file with
+            several hard links.
+        @rtype: None
+        """
+        if self.size_mode != 'allocated' or not links:
+            return
+        with self._lock:
+            for index, dev, ino in links:
+                if not self.inodes.add(dev, ino):
+                    name, path, is_dir, _ = content[index]
+                    content[index] = (name, path, is_dir, 0)
+                    self.stats.hardlinks += 1
+
+
+class InodeSet:
+    """A set of (device, inode) pairs, using about 16 bytes per pair.
+
+    A Python set of tuples uses over 100 bytes per pair, which is too much
+    when millions of files are tracked. Instead, the inode numbers of each
+    device are kept in an open-addressing hash table stored in a flat array
+    of 64-bit integers, which is at most half full.
+
+    === Private Attributes ===
+    @type _tables: dict[int, array]
+        The hash table of inode numbers for each device. 0 marks an empty
+        slot.
+    @type _counts: dict[int, int]
+        The number of inode numbers in each table.
+    @type _has_zero: set[int]
+        The devices for which inode 0 was added (0 cannot be stored in the
+        tables).
+    """
+    def __init__(self):
+        """Initialize a new, empty InodeSet.
+
+        @type self: InodeSet
+        @rtype: None
+        """
+        self._tables = {}
+        self._counts = {}
+        self._has_zero = set()
+
+    def __len__(self):
+        """Return the number of pairs in this set.
+
+        @type self: InodeSet
+        @rtype: int
+
+        >>> inodes = InodeSet()
+        >>> len(inodes)
+        0
+        >>> inodes.add(1, 5)
+        True
+        >>> len(inodes)
+        1
+        """
+        return sum(self._counts.values()) + len(self._has_zero)
+
+    def __contains__(self, pair):
+        """Return True if the (device, inode) pair <pair> is in this set.
+
+        @type self: InodeSet
+        @type pair: (int, int)
+        @rtype: bool
+
+        >>> inodes = InodeSet()
+        >>> inodes.add(1, 5)
+        True
+        >>> (1, 5) in inodes
+        True
+        >>> (2, 5) in inodes
+        False
+        """
+        dev, ino = pair
+        if ino == 0:
+            return dev in self._has_zero
+        table = self._tables.get(dev)
+        if table is None:
+            return False
+        return table[_find_slot(table, ino)] == ino
+
+    def add(self, dev, ino):
+        """Add the pair (<dev>, <ino>) to this set.
+
+        Return True if it was added, or False if it was already in the set.
+
+        @type self: InodeSet
+        @type dev: int
+        @type ino: int
+        @rtype: bool
+
+        >>> inodes = InodeSet()
+        >>> inodes.add(1, 5)
+        True
+        >>> inodes.add(1, 5)
+        False
+        >>> all(inodes.add(1, i) for i in range(6, 1000))
+        True
+        >>> len(inodes)
+        995
+        >>> inodes.add(1, 999)
+        False
+        """
+        if ino == 0:
+            if dev in self._has_zero:
+                return False
+            self._has_zero.add(dev)
+            return True
+
+        table = self._tables.get(dev)
+        if table is None:
+            table = array('Q', bytes(8 * 16))
+            self._tables[dev] = table
+            self._counts[dev] = 0
+
+        slot = _find_slot(table, ino)
+        if table[slot] == ino:
+            return False
+        table[slot] = ino
+        self._counts[dev] += 1
+        if 2 * self._counts[dev] > len(table):
+            self._tables[dev] = _grow(table)
+        return True
+
+
+def _depth(path):
+    """Return the number of separators in <path>, ignoring any at its end.
+
+    The path of an entry found in the folder <path> has exactly one more.
+
+    @type path: str
+    @rtype: int
+
+    >>> _depth('a') + 1 == _depth(os.path.join('a', 'b'))
+    True
+    >>> _depth(os.sep) + 1 == _depth(os.path.join(os.sep, 'b'))
+    True
+    """
+    return path.rstrip(os.sep).count(os.sep)
+
+
+def _read_pseudo_mounts():
+    """Return the mount points of the pseudo file systems on this computer.
+
+    @rtype: frozenset[str]
+    """
+    mounts = set()
+    try:
+        with open('/proc/self/mounts') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 3 and fields[2] in PSEUDO_FILESYSTEMS:
+                    # Spaces and the like are escaped in octal.
+                    mounts.add(fields[1].encode().decode('unicode_escape'))
+    except OSError:
+        return DEFAULT_PSEUDO_MOUNTS
+    return frozenset(mounts)
+
+
+def _find_slot(table, ino):
+    """Return the index of <ino> in the hash table <table>, or of the empty
+    slot where it would go.
+
+    @type table: array
+    @type ino: int
+    @rtype: int
+    """
+    mask = len(table) - 1
+    # Fibonacci hashing spreads out inode numbers that are close together.
+    # The slot is taken from the top bits of the 64-bit product, which
+    # depend on every bit of the inode number: some file systems (XFS with
+    # inode64, overlayfs with xino) number inodes apart in their high bits.
+    slot = ((ino * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> \
+        (64 - mask.bit_length())
+    while table[slot] != 0 and table[slot] != ino:
+        slot = (slot + 1) & mask
+    return slot
+
+
+def _grow(table):
+    """Return a hash table twice the size of <table>, with the same inode
+    numbers in it.
+
+    @type table: array
+    @rtype: array
+    """
+    new_table = array('Q', bytes(16 * len(table)))
+    for ino in table:
+        if ino != 0:
+            new_table[_find_slot(new_table, ino)] = ino
+    return new_table
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
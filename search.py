@@ -0,0 +1,286 @@
+"""
+=== Module Description ===
+This module contains SearchIndex, which finds the files and folders of a
+tree by name without walking the tree or building their paths.
+
+The index maps each extension to the nodes with that extension, and each
+name to the nodes with that name. The distinct names are also kept sorted,
+so the names starting with some prefix are found by binary search. A query
+then only looks at the names that can match it:
+
+- 'name': one lookup in the map of names;
+- '*.ext': one lookup in the map of extensions (the part of each name
+  from its last '.', so that it finds exactly the names fnmatch would);
+- 'prefix*': a binary search for the first name starting with prefix;
+- any other glob pattern (e.g. '*cache*'): fnmatch on each distinct name,
+  which is usually far fewer than the files.
+
+Like a TopIndex, the index follows the changes made under the tree (see
+AbstractTree._observe): deleted trees are taken out of it, and added ones
+put in it, so an index created while the tree is still being scanned (e.g.
+by a ProgressiveScan) fills itself in as the folders are read.
+"""
+import bisect
+import fnmatch
+import os
+
+from compact_tree import CompactNode
+from tree_data import AbstractTree
+
+
+# The characters that make a pattern more than a plain name.
+_WILDCARDS = frozenset('*?[')
+
+
+class SearchIndex:
+    """An index of the names of the files and folders of a tree.
+
+    === Private Attributes ===
+    @type _tree: AbstractTree
+        The tree this is an index of.
+    @type _store: CompactTree | None
+        If <_tree> is a CompactNode, its CompactTree: the nodes are then
+        kept as their index in it, rather than as their view.
+    @type _by_name: dict[str, set[AbstractTree | int]]
+        The nodes with each name.
+    @type _by_extension: dict[str, set[AbstractTree | int]]
+        The nodes with each extension, as returned by _extension ('' for
+        none).
+    @type _sorted_names: list[str]
+        The names in <_by_name>, sorted. Names no longer in <_by_name> may
+        be left in it.
+    @type _sorted: bool
+        False if names were added to <_by_name> since <_sorted_names> was
+        sorted.
+    """
+    def __init__(self, tree):
+        """Initialize a new SearchIndex of the names in <tree>, which
+        follows the changes made to <tree> until it is closed or no longer
+        used.
+
+        @type self: SearchIndex
+        @type tree: AbstractTree
+        @rtype: None
+        """
+        self._tree = tree
+        self._store = tree._store if isinstance(tree, CompactNode) else None
+        self._by_name = {}
+        self._by_extension = {}
+        self._sorted_names = []
+        self._sorted = True
+        self._add(tree)
+        tree._observe(self)
+
+    def close(self):
+        """Stop following the changes made to the tree.
+
+        @type self: SearchIndex
+        @rtype: None
+        """
+        self._tree._unobserve(self)
+
+    def search(self, pattern, tree=None):
+        """Return the files and folders under <tree> (by default, the whole
+        tree, including itself) whose name matches the glob <pattern>.
+
+        @type self: SearchIndex
+        @type pattern: str
+        @type tree: AbstractTree | None
+        @rtype: list[AbstractTree]
+
+        >>> b = AbstractTree('b', [AbstractTree('c.PY', [], 4),
+        ...                        AbstractTree('ab', [], 1)])
+        >>> t = AbstractTree('x', [AbstractTree('a.py', [], 3), b])
+        >>> index = SearchIndex(t)
+        >>> sorted(match.get_root() for match in index.search('a.py'))
+        ['a.py']
+        >>> sorted(match.get_root() for match in index.search('a*'))
+        ['a.py', 'ab']
+        >>> sorted(match.get_root() for match in index.search('*b'))
+        ['ab', 'b']
+        >>> t.complete_leaf_deletion(t.get_subtrees()[0])
+        >>> [match.get_root() for match in index.search('a.py')]
+        []
+        """
+        keys = self._matching(pattern)
+        if tree is None:
+            tree = self._tree
+        matches = []
+        for key in keys:
+            match = key if self._store is None else self._store.node(key)
+            if tree is self._tree or tree._holds(match):
+                matches.append(match)
+        return matches
+
+    def _matching(self, pattern):
+        """Return the nodes whose name matches <pattern>.
+
+        @type self: SearchIndex
+        @type pattern: str
+        @rtype: list[AbstractTree | int]
+        """
+        wildcards = [i for i, char in enumerate(pattern)
+                     if char in _WILDCARDS]
+        if not wildcards:
+            return list(self._by_name.get(pattern, ()))
+        if wildcards == [0] and pattern.startswith('*.') and \
+                '.' not in pattern[2:]:
+            # The names ending with pattern[1:] are exactly the names with
+            # that extension.
+            return list(self._by_extension.get(_extension(pattern[1:]), ()))
+
+        if not self._sorted:
+            self._sorted_names = sorted(self._by_name)
+            self._sorted = True
+        names = self._sorted_names
+        if wildcards == [len(pattern) - 1] and pattern.endswith('*'):
+            prefix = pattern[:-1]
+            start = bisect.bisect_left(names, prefix)
+            end = start
+            while end < len(names) and names[end].startswith(prefix):
+                end += 1
+            names = names[start:end]
+        else:
+            names = fnmatch.filter(names, pattern)
+        keys = []
+        for name in names:
+            keys.extend(self._by_name.get(name, ()))
+        return keys
+
+    def tree_added(self, tree):
+        """Add <tree> and the trees under it.
+
+        @type self: SearchIndex
+        @type tree: AbstractTree
+        @rtype: None
+        """
+        self._add(tree)
+
+    def tree_removed(self, tree):
+        """Remove <tree> and the trees under it.
+
+        A tree that is not in the index (e.g. one added with
+        CompactTree.add_node, which tells no observer) is left alone.
+
+        @type self: SearchIndex
+        @type tree: AbstractTree
+        @rtype: None
+        """
+        key = self._key(tree)
+        name = self._name(key)
+        if key not in self._by_name.get(name, ()):
+            return
+        for key in self._under(key):
+            name = self._name(key)
+            _discard(self._by_name, name, key)
+            _discard(self._by_extension, _extension(name), key)
+
+    def tree_resized(self, tree):
+        """Sizes are not indexed.
+
+        @type self: SearchIndex
+        @type tree: AbstractTree
+        @rtype: None
+        """
+
+    def _add(self, tree):
+        """Add <tree> and the trees under it to the index.
+
+        @type self: SearchIndex
+        @type tree: AbstractTree
+        @rtype: None
+        """
+        by_name = self._by_name
+        by_extension = self._by_extension
+        for key in self._under(self._key(tree)):
+            name = self._name(key)
+            keys = by_name.get(name)
+            if keys is None:
+                keys = by_name[name] = set()
+                self._sorted = False
+            keys.add(key)
+            extension = _extension(name)
+            keys = by_extension.get(extension)
+            if keys is None:
+                keys = by_extension[extension] = set()
+            keys.add(key)
+
+    def _under(self, key):
+        """Yield the node <key> and every node under it.
+
+        @type self: SearchIndex
+        @type key: AbstractTree | int
+        @rtype: iterator[AbstractTree | int]
+        """
+        stack = [key]
+        if self._store is None:
+            while stack:
+                tree = stack.pop()
+                yield tree
+                stack.extend(tree._subtrees)
+        else:
+            first_child = self._store._first_child
+            next_sibling = self._store._next_sibling
+            while stack:
+                index = stack.pop()
+                yield index
+                child = first_child[index]
+                while child != -1:
+                    stack.append(child)
+                    child = next_sibling[child]
+
+    def _name(self, key):
+        """Return the name of the node <key>, as a string.
+
+        @type self: SearchIndex
+        @type key: AbstractTree | int
+        @rtype: str
+        """
+        if self._store is None:
+            return str(key._root)
+        return self._store.name(key)
+
+    def _key(self, tree):
+        """Return what <tree>, which is under the tree of this index, is
+        kept as in the index.
+
+        @type self: SearchIndex
+        @type tree: AbstractTree
+        @rtype: AbstractTree | int
+        """
+        if self._store is None:
+            return tree
+        return tree._index
+
+
+def _extension(name):
+    """Return the extension of <name>: the part of it from its last '.',
+    or '' if it has none. Its case is normalized like fnmatch does, so it
+    only ignores case where file names do.
+
+    @type name: str
+    @rtype: str
+
+    >>> _extension('a.tar.gz'), _extension('.py'), _extension('Makefile')
+    ('.gz', '.py', '')
+    """
+    dot = name.rfind('.')
+    if dot < 0:
+        return ''
+    return os.path.normcase(name[dot:])
+
+
+def _discard(index, name, key):
+    """Remove <key> from the set of <name> in <index>, and remove the set
+    if it is then empty.
+
+    @type index: dict[str, set[AbstractTree | int]]
+    @type name: str
+    @type key: AbstractTree | int
+    @rtype: None
+    """
+    keys = index.get(name)
+    if keys is not None:
+        keys.discard(key)
+        if not keys:
+            del index[name]
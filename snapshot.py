@@ -0,0 +1,255 @@
+"""
+=== Module Description ===
+This module saves a tree to a compact binary file, a snapshot, and opens
+snapshots without reading them into memory.
+
+A snapshot holds the arrays of a CompactTree: for each node, its parent,
+first child, last child and next sibling (as 32-bit indices), its data size
+(64 bits) and the offset of its name in a string table holding every name
+one after the other. Each array starts on an 8-byte boundary, so opening a
+snapshot only maps the file into memory and makes a typed view of each
+array: no node is read or created, whatever the size of the tree, and every
+process that opens the same snapshot shares the same pages of memory.
+
+The tree of a snapshot is a CompactTree, so the visualiser (and
+generate_treemap, leaves, get_separator...) work directly on the mapped
+file. A snapshot is opened read-only; opened as writable, changes are made
+to private copies of the pages they touch, and never reach the file.
+
+    save_snapshot(FileSystemTree(path), 'home.snapshot')
+    tree = open_snapshot('home.snapshot').root()
+"""
+import mmap
+import os
+import struct
+import sys
+import weakref
+
+from compact_tree import CompactNode, CompactTree
+
+
+# The first bytes of every snapshot.
+SNAPSHOT_MAGIC = b'TREESNAP'
+# Bump this when the layout of the snapshot file changes.
+SNAPSHOT_VERSION = 1
+
+# The header: the magic bytes, the version, the byte order of the arrays
+# (b'<' or b'>'), the number of nodes, the length of the string table and
+# the length of the separator, which follows the header.
+_HEADER = struct.Struct('<8sHc5xQQI4x')
+
+# The arrays of a CompactTree saved in a snapshot, in order, with their
+# type codes. _name_offset has one more entry than there are nodes.
+_COLUMNS = (('_parent', 'i'), ('_first_child', 'i'), ('_last_child', 'i'),
+            ('_next_sibling', 'i'), ('_size', 'q'), ('_name_offset', 'I'))
+_BYTE_ORDERS = {'little': b'<', 'big': b'>'}
+
+
+def save_snapshot(tree, path, separator=os.sep):
+    """Save the tree <tree> to the snapshot file <path>.
+
+    <tree> may be an AbstractTree, whose names are converted to strings and
+    joined by <separator> in get_separator, or a CompactTree or the root of
+    one, which is saved as it is.
+
+    The file is replaced in one step, so processes that have the old
+    snapshot open keep seeing it whole.
+
+    @type tree: AbstractTree | CompactTree
+    @type path: str
+    @type separator: str
+    @rtype: None
+    """
+    if isinstance(tree, CompactNode) and tree._index == 0:
+        store = tree._store
+    elif isinstance(tree, CompactNode):
+        store = CompactTree.from_tree(tree, tree._store.separator)
+    elif isinstance(tree, CompactTree):
+        store = tree
+    else:
+        store = CompactTree.from_tree(tree, separator)
+
+    encoded_separator = store.separator.encode('utf-8', 'surrogateescape')
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION,
+                             _BYTE_ORDERS[sys.byteorder], len(store),
+                             len(store._names), len(encoded_separator)))
+        f.write(encoded_separator)
+        _pad(f)
+        for name, _ in _COLUMNS:
+            f.write(getattr(store, name))
+            _pad(f)
+        f.write(store._names)
+    os.replace(temp_path, path)
+
+
+def open_snapshot(path, writable=False):
+    """Return the tree saved in the snapshot file <path>.
+
+    If <writable> is True, the tree can be changed (e.g. by deleting leaves
+    in the visualiser), but the changes are not saved to the file.
+
+    @type path: str
+    @type writable: bool
+    @rtype: SnapshotTree
+    """
+    return SnapshotTree(path, writable)
+
+
+class SnapshotTree(CompactTree):
+    """A CompactTree whose arrays are mapped from a snapshot file.
+
+    New nodes cannot be added. Unless the snapshot was opened as writable,
+    the tree cannot be changed at all: changing it raises TypeError.
+
+    === Private Attributes ===
+    @type _map: mmap.mmap
+        The memory map of the snapshot file.
+    @type _views: list[memoryview]
+        Every view of <_map> handed out to the arrays, which must be
+        released before the map is closed.
+    """
+    def __init__(self, path, writable=False):
+        """Open the snapshot file <path>.
+
+        @type self: SnapshotTree
+        @type path: str
+        @type writable: bool
+        @rtype: None
+        """
+        access = mmap.ACCESS_COPY if writable else mmap.ACCESS_READ
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < _HEADER.size:
+                raise ValueError('{} is not a tree snapshot'.format(path))
+            self._map = mmap.mmap(f.fileno(), 0, access=access)
+        self._views = [memoryview(self._map)]
+        self._nodes = weakref.WeakValueDictionary()
+        self._leaf_cache = None
+        try:
+            self._open(path)
+        except ValueError:
+            self.close()
+            raise
+
+    def _open(self, path):
+        """Check the header of the snapshot <path>, and make the view of
+        each array.
+
+        @type self: SnapshotTree
+        @type path: str
+        @rtype: None
+        """
+        magic, version, byte_order, count, names_length, separator_length = \
+            _HEADER.unpack_from(self._map)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError('{} is not a tree snapshot'.format(path))
+        if version != SNAPSHOT_VERSION:
+            raise ValueError('{} is a snapshot of version {}, not {}'.format(
+                path, version, SNAPSHOT_VERSION))
+        if byte_order != _BYTE_ORDERS[sys.byteorder]:
+            raise ValueError('{} was saved on a computer with another byte '
+                             'order'.format(path))
+
+        offset = _HEADER.size
+        self.separator = bytes(
+            self._view(offset, separator_length, 'B')).decode(
+                'utf-8', 'surrogateescape')
+        offset = _aligned(offset + separator_length)
+        for name, typecode in _COLUMNS:
+            length = count + 1 if name == '_name_offset' else count
+            column = self._view(offset, length, typecode)
+            setattr(self, name, column)
+            offset = _aligned(offset + column.nbytes)
+        self._names = self._view(offset, names_length, 'B')
+
+    def _view(self, offset, length, typecode):
+        """Return a view of the <length> values of type <typecode> stored
+        in the snapshot from <offset>.
+
+        @type self: SnapshotTree
+        @type offset: int
+        @type length: int
+        @type typecode: str
+        @rtype: memoryview
+        """
+        nbytes = length * struct.calcsize(typecode)
+        view = self._views[0][offset:offset + nbytes]
+        self._views.append(view)
+        if len(view) != nbytes:
+            raise ValueError('the snapshot is truncated')
+        view = view.cast(typecode)
+        self._views.append(view)
+        return view
+
+    def __enter__(self):
+        """Return this tree.
+
+        @type self: SnapshotTree
+        @rtype: SnapshotTree
+        """
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close the snapshot.
+
+        @type self: SnapshotTree
+        @rtype: bool
+        """
+        self.close()
+        return False
+
+    def close(self):
+        """Unmap the snapshot file. The tree, and the views of its nodes,
+        cannot be used afterwards.
+
+        @type self: SnapshotTree
+        @rtype: None
+        """
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._map.close()
+
+    def add_node(self, parent, name, size):
+        """Raise TypeError: nodes cannot be added to a snapshot.
+
+        @type self: SnapshotTree
+        @type parent: int
+        @type name: str
+        @type size: int
+        @rtype: int
+        """
+        raise TypeError('nodes cannot be added to a snapshot')
+
+    def add_nodes(self, parent, names, sizes):
+        """Raise TypeError: nodes cannot be added to a snapshot.
+
+        @type self: SnapshotTree
+        @type parent: int
+        @type names: list[str]
+        @type sizes: list[int] | array
+        @rtype: int
+        """
+        raise TypeError('nodes cannot be added to a snapshot')
+
+
+def _aligned(offset):
+    """Return <offset> rounded up to a multiple of 8.
+
+    @type offset: int
+    @rtype: int
+
+    >>> _aligned(8), _aligned(9)
+    (8, 16)
+    """
+    return (offset + 7) & ~7
+
+
+def _pad(f):
+    """Write zeros to the file <f> until its position is a multiple of 8.
+
+    @type f: io.BufferedWriter
+    @rtype: None
+    """
+    f.write(bytes(_aligned(f.tell()) - f.tell()))
@@ -1,10 +1,29 @@
+import fnmatch
 import os
+import pickle
+import sys
+import tempfile
+import time
+from array import array
 
 import unittest
 from hypothesis import given
 from hypothesis.strategies import integers
 
-from tree_data import FileSystemTree
+from compact_tree import CompactTree
+from diff import diff_trees
+from group_views import FileTable, GROUP_VIEWS
+from journal import TreeJournal
+from listings import load_listing
+from multi_scan import scan_roots
+from scan_cache import CACHE_VERSION, CachingScanner
+from progressive_scan import ProgressiveScan
+from scanner import DirectoryScanner, InodeSet, ScanRules, _find_slot
+from search import SearchIndex
+from snapshot import open_snapshot, save_snapshot
+from topk import TopIndex
+from tree_data import AbstractTree, FileSystemTree, colour_for
+from watcher import TreeWatcher
 
 
 # This should be the path to the "B" folder in the sample data.
@@ -171,6 +190,1224 @@ class TestGetSeparator(unittest.TestCase):
         self.assertEqual(t._subtrees[2]._subtrees[0].get_separator(), 'try_empty\\z\\cool.txt')
 
 
+class FolderTestCase(unittest.TestCase):
+    """Creates a folder laid out as <layout> (see _make_folder) in a
+    temporary folder before each test, as self.root, and deletes it after.
+
+    Subclasses set <layout>, or None to create the folders they need in
+    their own setUp.
+    """
+    layout = {'a.txt': 10, 'sub': {'b.txt': 20, 'deep': {'c.txt': 5}}}
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self._tmp.name, 'root')
+        if self.layout is not None:
+            _make_folder(self.root, self.layout)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+
+class ScannerTest(FolderTestCase):
+    layout = {'a.txt': 10,
+              'sub': {'b.txt': 20, 'c.txt': 5},
+              'empty': {}}
+
+    def test_same_tree_as_listdir(self):
+        tree = FileSystemTree(self.root)
+        self.assertEqual(_describe(tree), _describe_path(self.root))
+        self.assertEqual(tree.data_size, 35)
+
+    def test_one_stat_per_entry(self):
+        scanner = DirectoryScanner()
+        FileSystemTree(self.root, scanner)
+        # 6 entries including the root, 3 folders read, 4 stats for the
+        # root and the 3 files.
+        self.assertEqual(scanner.stats.entries, 6)
+        self.assertEqual(scanner.stats.listings, 3)
+        self.assertEqual(scanner.stats.stat_calls, 4)
+
+    def test_parallel_scan(self):
+        tree = FileSystemTree(self.root, workers=4)
+        self.assertEqual(_describe(tree), _describe_path(self.root))
+        for subtree in tree._subtrees:
+            self.assertIs(subtree._parent_tree, tree)
+            for leaf in subtree._subtrees:
+                self.assertIs(leaf._parent_tree, subtree)
+
+    def test_deeper_than_recursion_limit(self):
+        depth = 1500
+        # os.makedirs is recursive, so build the chain one folder at a time.
+        folder = self.root
+        for _ in range(depth):
+            folder = os.path.join(folder, 'd')
+            os.mkdir(folder)
+        with open(os.path.join(folder, 'f.txt'), 'wb') as f:
+            f.write(b'x' * 7)
+
+        tree = FileSystemTree(self.root)
+        self.assertEqual(tree.data_size, 42)
+        self.assertEqual(tree.compute_size(), 42)
+        self.assertEqual(len(tree.generate_treemap((0, 0, 100, 100))), 4)
+        leaf = [t for t in tree.leaves() if t._root == 'f.txt'][0]
+        self.assertEqual(leaf.get_separator(),
+                         os.path.join('root', *(['d'] * depth), 'f.txt'))
+
+        # shutil.rmtree is recursive too, so remove the chain by hand.
+        os.remove(os.path.join(folder, 'f.txt'))
+        while folder != self.root:
+            os.rmdir(folder)
+            folder = os.path.dirname(folder)
+
+
+class AllocatedSizeTest(FolderTestCase):
+    layout = {'a': {'big.bin': 10000}, 'b': {}}
+
+    def setUp(self):
+        super().setUp()
+        os.link(os.path.join(self.root, 'a', 'big.bin'),
+                os.path.join(self.root, 'b', 'link.bin'))
+
+    def test_apparent_counts_every_link(self):
+        tree = FileSystemTree(self.root)
+        self.assertEqual(tree.data_size, 20000)
+
+    def test_allocated_counts_each_inode_once(self):
+        scanner = DirectoryScanner('allocated')
+        tree = FileSystemTree(self.root, scanner)
+        blocks = os.stat(os.path.join(self.root, 'a', 'big.bin')).st_blocks
+        self.assertEqual(tree.data_size, blocks * 512)
+        self.assertEqual(scanner.stats.hardlinks, 1)
+        self.assertEqual(len(scanner.inodes), 1)
+
+    def test_allocated_with_eager_depth(self):
+        full = FileSystemTree(self.root, DirectoryScanner('allocated'))
+        tree = FileSystemTree(self.root, DirectoryScanner('allocated'),
+                              eager_depth=0)
+        self.assertEqual(tree.data_size, full.data_size)
+        while any(leaf.expand() for leaf in tree.leaves()):
+            pass
+        self.assertEqual(tree.data_size, full.data_size)
+        self.assertEqual(tree.data_size, tree.compute_size())
+
+    def test_allocated_with_cache(self):
+        cache_path = os.path.join(self._tmp.name, 'scan.cache')
+        for _ in range(2):
+            scanner = CachingScanner(cache_path, 'allocated')
+            tree = FileSystemTree(self.root, scanner)
+            scanner.save()
+            self.assertEqual(scanner.stats.hardlinks, 1)
+        self.assertEqual(scanner.hits, 3)
+        self.assertEqual(tree.data_size, scanner.file_size(
+            os.stat(os.path.join(self.root, 'a', 'big.bin'))))
+
+    def test_inode_set_spreads_high_bits(self):
+        # Inode numbers that differ only in their high bits, like those of
+        # overlayfs with xino, must not share one probe chain.
+        inodes = InodeSet()
+        numbers = [(i + 1) << 40 | 5 for i in range(5000)]
+        for ino in numbers:
+            self.assertTrue(inodes.add(1, ino))
+        self.assertTrue(all((1, ino) in inodes for ino in numbers))
+        table = inodes._tables[1]
+        empty = array('Q', bytes(8 * len(table)))
+        longest = max((slot - _find_slot(empty, ino)) % len(table)
+                      for slot, ino in enumerate(table) if ino != 0)
+        self.assertLess(longest, 100)
+
+
+class ScanRulesTest(FolderTestCase):
+    layout = {'a.txt': 10, 'b.pyc': 30, 'tiny.txt': 1,
+              '.git': {'x': 50, 'y': 50},
+              'sub': {'c.txt': 20, 'deep': {'d.txt': 5}}}
+
+    def test_excluded_entries_are_not_read(self):
+        scanner = DirectoryScanner(rules=ScanRules(['*.pyc', '.git']))
+        tree = FileSystemTree(self.root, scanner)
+        self.assertEqual(tree.data_size, 36)
+        self.assertEqual(scanner.stats.excluded, 2)
+        self.assertEqual(scanner.stats.pruned, 1)
+        # The .git folder is never listed, and b.pyc never stat'ed.
+        self.assertEqual(scanner.stats.listings, 3)
+        self.assertEqual(scanner.stats.avoided_syscalls(), 2)
+
+    def test_regex_and_min_size(self):
+        rules = ScanRules(exclude_regex=[r'deep$'], min_size=2)
+        tree = FileSystemTree(self.root, DirectoryScanner(rules=rules))
+        self.assertEqual(tree.data_size, 160)
+        names = {leaf._root for leaf in tree.leaves()}
+        self.assertNotIn('tiny.txt', names)
+        self.assertNotIn('d.txt', names)
+
+    def test_max_depth(self):
+        scanner = DirectoryScanner(rules=ScanRules(max_depth=1))
+        tree = FileSystemTree(self.root, scanner)
+        # Only the files directly in the root are counted.
+        self.assertEqual(tree.data_size, 41)
+        self.assertEqual(scanner.stats.listings, 1)
+
+    def test_one_file_system_keeps_same_device(self):
+        rules = ScanRules(one_file_system=True, skip_pseudo=True)
+        tree = FileSystemTree(self.root, DirectoryScanner(rules=rules))
+        self.assertEqual(_describe(tree), _describe_path(self.root))
+
+
+class MultiRootTest(FolderTestCase):
+    layout = None
+
+    def setUp(self):
+        super().setUp()
+        self.roots = [os.path.join(self._tmp.name, name)
+                      for name in ['one', 'two', 'three']]
+        _make_folder(self.roots[0], {'a.txt': 10, 'sub': {'b.txt': 20}})
+        _make_folder(self.roots[1], {'empty': {}, 'c.txt': 7})
+        _make_folder(self.roots[2], {'deep': {'deeper': {'d.txt': 3}}})
+
+    def test_merged_under_one_root(self):
+        tree, stats = scan_roots(self.roots, processes=2)
+        self.assertEqual(tree.data_size, 40)
+        self.assertFalse(hasattr(tree, '__dict__'))
+        self.assertEqual([subtree._root for subtree in tree._subtrees],
+                         self.roots)
+        for path, subtree in zip(self.roots, tree._subtrees):
+            self.assertIs(subtree._parent_tree, tree)
+            subtree._root = os.path.basename(path)
+            self.assertEqual(_describe(subtree), _describe_path(path))
+        self.assertEqual(stats.listings, 7)
+
+    def test_separator_starts_at_the_root_path(self):
+        tree, _ = scan_roots(self.roots[2:], processes=1)
+        leaf = tree.leaves()[0]
+        self.assertEqual(leaf.get_separator(),
+                         os.path.join(self.roots[2], 'deep', 'deeper',
+                                      'd.txt'))
+        self.assertEqual(tree.get_separator(), 'roots')
+
+    def test_hard_links_across_roots(self):
+        os.link(os.path.join(self.roots[0], 'a.txt'),
+                os.path.join(self.roots[1], 'link.txt'))
+        tree, stats = scan_roots(self.roots, 2, 'allocated')
+        self.assertEqual(stats.hardlinks, 1)
+        self.assertEqual(tree.data_size, tree.compute_size())
+
+
+class ListingTest(FolderTestCase):
+    layout = {'a.txt': 10, 'empty.txt': 0,
+              'sub': {'b.txt': 20, 'deep': {'c.txt': 5}}}
+
+    def _write(self, name, text):
+        path = os.path.join(self._tmp.name, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_find(self):
+        # Like find -printf '%s %p\n': every folder before its entries.
+        lines = []
+        for folder, _, files in os.walk(self.root):
+            lines.append('4096 {}\n'.format(folder))
+            for name in files:
+                path = os.path.join(folder, name)
+                lines.append('{} {}\n'.format(os.path.getsize(path), path))
+        tree = load_listing(self._write('listing.txt', ''.join(lines)))
+        self.assertEqual(tree._root, self.root)
+        tree._root = 'root'
+        self.assertEqual(_describe(tree), _describe_path(self.root))
+
+    def test_csv_in_any_order(self):
+        path = self._write('listing.csv', 'path,size\n'
+                                          'x/sub/deep/c.txt,5\n'
+                                          '"x/a, b.txt",10\n'
+                                          'x/sub,4096\n'
+                                          'x/sub/b.txt,20\n')
+        tree = load_listing(path)
+        self.assertEqual(_describe(tree), (
+            'x', 35, [('a, b.txt', 10, []),
+                      ('sub', 25, [('b.txt', 20, []),
+                                   ('deep', 5, [('c.txt', 5, [])])])]))
+
+    def test_csv_folder_before_other_folders(self):
+        # The row of sub is no longer the last one when its entries come.
+        path = self._write('listing.csv', 'x/sub,4096\n'
+                                          'y/z,1\n'
+                                          'x/sub/b.txt,20\n'
+                                          'x/c.txt,3\n'
+                                          'y/w/d.txt,2\n')
+        tree = load_listing(path)
+        self.assertEqual(_describe(tree), (
+            '.', 26, [('x', 23, [('c.txt', 3, []),
+                                 ('sub', 20, [('b.txt', 20, [])])]),
+                      ('y', 3, [('w', 2, [('d.txt', 2, [])]),
+                                ('z', 1, [])])]))
+
+    def test_ncdu(self):
+        path = self._write('export.json', """[1, 2, {"progname": "ncdu"},
+            [{"name": "/data", "asize": 4096, "dev": 7, "ino": 1},
+             {"name": "a.txt", "asize": 10, "dsize": 4096, "ino": 2},
+             [{"name": "s]{b", "asize": 4096, "ino": 3},
+              {"name": "b.txt", "asize": 20, "dsize": 4096, "ino": 4,
+               "hlnkc": true},
+              {"name": "c.txt", "asize": 20, "dsize": 4096, "ino": 4,
+               "hlnkc": true}],
+             {"name": "d.txt", "asize": 1, "dsize": 4096, "ino": 5}]]""")
+        tree = load_listing(path)
+        self.assertEqual(_describe(tree), (
+            '/data', 51, [('a.txt', 10, []), ('d.txt', 1, []),
+                          ('s]{b', 40, [('b.txt', 20, []),
+                                        ('c.txt', 20, [])])]))
+        tree = load_listing(path, size_mode='allocated')
+        self.assertEqual(tree.data_size, 3 * 4096)
+
+
+class NodeLayoutTest(FolderTestCase):
+    layout = {'one': {'__init__.py': 1},
+              'two': {'__init__.py': 2}}
+
+    def test_no_instance_dict(self):
+        tree = FileSystemTree(self.root)
+        self.assertFalse(hasattr(tree, '__dict__'))
+        self.assertFalse(hasattr(tree.leaves()[0], '__dict__'))
+
+    def test_repeated_names_are_shared(self):
+        first, second = FileSystemTree(self.root).leaves()
+        self.assertIs(first._root, second._root)
+
+    def test_leaves_get_their_own_subtrees(self):
+        tree = FileSystemTree(self.root)
+        first, second = tree.leaves()
+        first._add_subtree(FileSystemTree(os.path.join(self.root, 'two')))
+        self.assertEqual(len(first.get_subtrees()), 1)
+        self.assertEqual(second.get_subtrees(), [])
+        self.assertEqual(tree.data_size, 5)
+
+    def test_colour(self):
+        tree = FileSystemTree(self.root)
+        tree.colour = (255, 0, 17)
+        self.assertEqual(tree.colour, (255, 0, 17))
+        self.assertEqual(tree.generate_treemap((0, 0, 10, 10))[0][1],
+                         tree.leaves()[0].colour)
+
+
+class ColourTest(FolderTestCase):
+    layout = {'a.py': 10, 'b.py': 20, 'c.txt': 5}
+
+    def tearDown(self):
+        super().tearDown()
+        AbstractTree.colour_mode = 'name'
+
+    def test_same_on_every_run(self):
+        first = FileSystemTree(self.root).generate_treemap((0, 0, 80, 60))
+        second = FileSystemTree(self.root).generate_treemap((0, 0, 80, 60))
+        self.assertEqual(first, second)
+        self.assertIsNone(FileSystemTree(self.root).leaves()[0]._colour)
+
+    def test_by_extension(self):
+        AbstractTree.colour_mode = 'extension'
+        tree = FileSystemTree(self.root)
+        colours = {leaf.get_root(): leaf.colour for leaf in tree.leaves()}
+        self.assertEqual(colours['a.py'], colours['b.py'])
+        self.assertNotEqual(colours['a.py'], colours['c.txt'])
+        self.assertEqual(colour_for('x.unknown', 'extension'),
+                         colour_for('y.UNKNOWN', 'extension'))
+
+    def test_mode_change_redraws(self):
+        for tree in [FileSystemTree(self.root),
+                     CompactTree.from_path(self.root).root()]:
+            AbstractTree.colour_mode = 'name'
+            tree.generate_treemap((0, 0, 80, 60))
+            AbstractTree.colour_mode = 'extension'
+            colours = {tree.get_leaf((0, 0, 80, 60), rect).get_root(): colour
+                       for rect, colour
+                       in tree.generate_treemap((0, 0, 80, 60))}
+            self.assertEqual(colours['a.py'], colours['b.py'])
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            colour_for('a.py', 'random')
+
+
+class LeafIndexTest(FolderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.rect = (0, 0, 800, 600)
+
+    def _check(self, tree):
+        # The cached answers match a fresh walk of the tree.
+        treemap = tree.generate_treemap(self.rect)
+        self.assertEqual(treemap, [(r, t.colour) for t, r
+                                   in tree._layout(self.rect)
+                                   if not t.get_subtrees()])
+        for leaf, item in zip(tree.leaves(), treemap):
+            self.assertIs(tree.get_leaf(self.rect, item[0]), leaf)
+            self.assertEqual(tree.convert_to_rect(self.rect, leaf), item)
+
+    def test_resize(self):
+        tree = FileSystemTree(self.root)
+        self._check(tree)
+        tree.leaves()[0].increase_size()
+        self._check(tree)
+        tree.leaves()[-1].resize_leaf(100)
+        self._check(tree)
+
+    def test_delete(self):
+        tree = FileSystemTree(self.root)
+        self._check(tree)
+        leaf = tree.leaves()[1]
+        tree.complete_leaf_deletion(leaf)
+        self._check(tree)
+        self.assertNotIn(leaf, tree.leaves())
+        self.assertIsNone(tree.convert_to_rect(self.rect, leaf))
+
+    def test_expand(self):
+        tree = FileSystemTree(self.root, eager_depth=0)
+        self.assertEqual(len(tree.leaves()), 2)
+        # Too small to be expanded by the treemap.
+        tree.generate_treemap((0, 0, 10, 10))
+        sub = [subtree for subtree in tree.get_subtrees()
+               if subtree.get_root() == 'sub'][0]
+        sub.expand()
+        self.assertEqual(len(tree.generate_treemap((0, 0, 10, 10))), 3)
+        self._check(tree)
+
+
+class SeparatorTest(FolderTestCase):
+    def _find(self, tree, *names):
+        for name in names:
+            tree = [subtree for subtree in tree.get_subtrees()
+                    if subtree.get_root() == name][0]
+        return tree
+
+    def test_paths_are_kept(self):
+        tree = FileSystemTree(self.root)
+        c = self._find(tree, 'sub', 'deep', 'c.txt')
+        expected = os.path.join('root', 'sub', 'deep', 'c.txt')
+        self.assertEqual(c.get_separator(), expected)
+        self.assertEqual(c.get_separator(), expected)
+        # Only the folder of c.txt keeps its path.
+        self.assertEqual(self._find(tree, 'sub', 'deep')._path,
+                         os.path.join('root', 'sub', 'deep'))
+        self.assertIsNone(self._find(tree, 'sub')._path)
+        self.assertIsNone(c._path)
+
+    def test_moved_folder(self):
+        tree = FileSystemTree(self.root)
+        deep = self._find(tree, 'sub', 'deep')
+        c = self._find(deep, 'c.txt')
+        c.get_separator()
+        deep._remove_from_parent()
+        deep._root = 'moved'
+        tree._add_subtree(deep)
+        self.assertEqual(c.get_separator(),
+                         os.path.join('root', 'moved', 'c.txt'))
+
+    def test_get_separators(self):
+        tree = FileSystemTree(self.root)
+        leaves = tree.leaves()
+        self.assertEqual(tree.get_separators(leaves),
+                         [os.path.join(*_path_names(leaf))
+                          for leaf in leaves])
+
+
+class BatchTest(FolderTestCase):
+    layout = {'a.txt': 10, 'e.txt': 3,
+              'sub': {'b.txt': 20, 'deep': {'c.txt': 5, 'd.txt': 7}}}
+
+    def _changes(self, tree):
+        # Resize every leaf, then delete one leaf and the folder 'deep'.
+        leaves = {leaf.get_root(): leaf for leaf in tree.leaves()}
+        deep = leaves['c.txt'].get_parent_tree()
+        return ([('resize', leaf, leaf.data_size * 2)
+                 for leaf in leaves.values()] +
+                [('delete', leaves['e.txt'], None),
+                 ('resize', leaves['d.txt'], 1),
+                 ('delete', deep, None),
+                 ('resize', leaves['c.txt'], 100)])
+
+    def test_same_as_one_at_a_time(self):
+        expected = FileSystemTree(self.root)
+        for action, tree, size in self._changes(expected):
+            if _path_names(tree)[0] != 'root':
+                # Deleted by an earlier change.
+                continue
+            if action == 'resize':
+                tree.resize_leaf(size)
+            else:
+                expected.complete_leaf_deletion(tree)
+
+        tree = FileSystemTree(self.root)
+        with tree.batch() as batch:
+            for action, subtree, size in self._changes(tree):
+                if action == 'resize':
+                    batch.resize(subtree, size)
+                else:
+                    batch.delete(subtree)
+        self.assertEqual(_describe(tree), _describe(expected))
+        self.assertEqual(tree.data_size, tree.compute_size())
+        self.assertEqual([t.get_root() for t in batch.removed],
+                         [None, None])
+        self.assertEqual(sorted(t.get_root() for t in batch.changed),
+                         ['a.txt', 'b.txt', 'root', 'sub'])
+        self.assertIs(batch.changed[-1], tree)
+
+    def test_exception_leaves_tree_alone(self):
+        tree = FileSystemTree(self.root)
+        before = _describe(tree)
+        with self.assertRaises(KeyError):
+            with tree.batch() as batch:
+                batch.delete(tree.leaves()[0])
+                raise KeyError
+        self.assertEqual(_describe(tree), before)
+
+    def test_compact(self):
+        tree = CompactTree.from_path(self.root).root()
+        with tree.batch() as batch:
+            for action, subtree, size in self._changes(tree):
+                if action == 'resize':
+                    batch.resize(subtree, size)
+                else:
+                    batch.delete(subtree)
+        self.assertEqual(tree.data_size, 20 + 40)
+        self.assertEqual(tree.data_size, tree.compute_size())
+        self.assertEqual([t.get_root() for t in batch.removed],
+                         [None, None])
+        self.assertEqual(sorted(t.get_root() for t in batch.changed),
+                         ['a.txt', 'b.txt', 'root', 'sub'])
+        self.assertIs(batch.changed[-1], tree)
+        self.assertEqual(sorted(t.get_root() for t in tree.leaves()),
+                         ['a.txt', 'b.txt'])
+
+
+class DeletionTest(FolderTestCase):
+    def test_delete_folder(self):
+        tree = FileSystemTree(self.root)
+        sub = [subtree for subtree in tree.get_subtrees()
+               if subtree.get_root() == 'sub'][0]
+        deep = [subtree for subtree in sub.get_subtrees()
+                if subtree.get_root() == 'deep'][0]
+        tree.complete_leaf_deletion(deep)
+        self.assertEqual(sub.data_size, 20)
+        self.assertEqual(tree.data_size, 30)
+        self.assertIsNone(deep.get_parent_tree())
+        self.assertEqual(tree.data_size, tree.compute_size())
+
+    def test_not_in_tree(self):
+        tree = FileSystemTree(self.root)
+        other = FileSystemTree(self.root)
+        leaf = other.leaves()[0]
+        self.assertFalse(tree.delete_leaf(leaf))
+        tree.complete_leaf_deletion(leaf)
+        self.assertEqual(tree.data_size, 35)
+        self.assertEqual(other.data_size, 35)
+
+
+class JournalTest(FolderTestCase):
+    layout = {'a.txt': 10, 'e.txt': 3,
+              'sub': {'b.txt': 20, 'deep': {'c.txt': 5, 'd.txt': 7}}}
+
+    def _check_undo_redo(self, tree):
+        leaves = {leaf.get_root(): leaf for leaf in tree.leaves()}
+        deep = leaves['c.txt'].get_parent_tree()
+        sub = deep.get_parent_tree()
+        order = [subtree.get_root() for subtree in sub.get_subtrees()]
+        before = _describe(tree)
+        journal = TreeJournal(tree)
+        journal.increase(leaves['a.txt'])
+        journal.delete(leaves['d.txt'])
+        journal.resize(leaves['c.txt'], 100)
+        journal.delete(deep)
+        journal.decrease(leaves['b.txt'])
+        after = _describe(tree)
+        self.assertEqual(tree.data_size, 11 + 3 + 19)
+        self.assertEqual(tree.data_size, tree.compute_size())
+
+        while journal.undo() is not None:
+            pass
+        self.assertEqual(_describe(tree), before)
+        self.assertEqual([subtree.get_root() for subtree in sub.get_subtrees()],
+                         order)
+        self.assertIs(deep.get_parent_tree(), sub)
+        self.assertIn(leaves['d.txt'], tree.leaves())
+
+        while journal.redo() is not None:
+            pass
+        self.assertEqual(_describe(tree), after)
+        self.assertEqual(tree.data_size, tree.compute_size())
+        self.assertNotIn(leaves['c.txt'], tree.leaves())
+
+    def test_undo_redo(self):
+        self._check_undo_redo(FileSystemTree(self.root))
+
+    def test_compact(self):
+        self._check_undo_redo(CompactTree.from_path(self.root).root())
+
+    def test_undo_keeps_paths(self):
+        tree = FileSystemTree(self.root)
+        c = [leaf for leaf in tree.leaves() if leaf.get_root() == 'c.txt'][0]
+        path = c.get_separator()
+        deep = c.get_parent_tree()
+        journal = TreeJournal(tree)
+        journal.delete(deep.get_parent_tree())
+        journal.undo()
+        # Put back where it was: the paths kept under it are not cleared.
+        self.assertIsNotNone(deep._path)
+        self.assertEqual(c.get_separator(), path)
+
+    def test_history_is_bounded(self):
+        tree = FileSystemTree(self.root)
+        leaf = [leaf for leaf in tree.leaves()
+                if leaf.get_root() == 'a.txt'][0]
+        journal = TreeJournal(tree, history=3)
+        for size in range(11, 16):
+            journal.resize(leaf, size)
+        self.assertEqual(len(journal), 3)
+        while journal.undo() is not None:
+            pass
+        self.assertEqual(leaf.data_size, 12)
+        self.assertEqual(tree.data_size, tree.compute_size())
+
+    def test_new_change_clears_redo(self):
+        tree = FileSystemTree(self.root)
+        leaves = tree.leaves()
+        journal = TreeJournal(tree)
+        journal.delete(leaves[0])
+        journal.undo()
+        self.assertTrue(journal.can_redo())
+        journal.delete(leaves[1])
+        self.assertFalse(journal.can_redo())
+        self.assertIsNone(journal.redo())
+        self.assertFalse(journal.delete(tree))
+
+
+class CompactTreeTest(FolderTestCase):
+    layout = {'a.txt': 10, 'empty.txt': 0,
+              'sub': {'b.txt': 20, 'deep': {'c.txt': 5}}}
+
+    def test_same_tree_as_file_system_tree(self):
+        tree = CompactTree.from_path(self.root).root()
+        self.assertEqual(_describe(tree), _describe_path(self.root))
+
+    def test_same_treemap_and_leaves(self):
+        expected = FileSystemTree(self.root)
+        tree = CompactTree.from_path(self.root).root()
+        rect = (0, 0, 800, 600)
+        self.assertEqual([r for r, _ in tree.generate_treemap(rect)],
+                         [r for r, _ in expected.generate_treemap(rect)])
+        self.assertEqual([leaf.get_separator() for leaf in tree.leaves()],
+                         [leaf.get_separator()
+                          for leaf in expected.leaves()])
+
+    def test_one_view_per_node(self):
+        tree = CompactTree.from_path(self.root).root()
+        leaf = [leaf for leaf in tree.leaves()
+                if leaf.get_root() == 'a.txt'][0]
+        self.assertIn(leaf, tree.leaves())
+        self.assertIs(leaf.get_parent_tree(), tree)
+        rect = (0, 0, 800, 600)
+        self.assertIs(tree.get_leaf(rect, tree.convert_to_rect(rect, leaf)[0]),
+                      leaf)
+
+    def test_delete_and_resize(self):
+        tree = CompactTree.from_path(self.root).root()
+        b = [leaf for leaf in tree.leaves() if leaf.get_root() == 'b.txt'][0]
+        b.increase_size()
+        self.assertEqual(b.data_size, 21)
+        self.assertEqual(tree.data_size, 36)
+        b.resize_leaf(50)
+        b.resize_leaf(21)
+        self.assertEqual(tree.data_size, 36)
+        tree.complete_leaf_deletion(b)
+        self.assertEqual(tree.data_size, 15)
+        self.assertEqual(tree.data_size, tree.compute_size())
+        self.assertIsNone(b.get_root())
+        self.assertFalse(tree.delete_leaf(b))
+        self.assertEqual(sorted(leaf.get_root() for leaf in tree.leaves()),
+                         ['a.txt', 'c.txt'])
+
+    def test_treemap_cached_until_changed(self):
+        tree = CompactTree.from_path(self.root).root()
+        rect = (0, 0, 800, 600)
+        treemap = tree.generate_treemap(rect)
+        cached = tree._store._leaf_cache
+        self.assertEqual(tree.generate_treemap(rect), treemap)
+        self.assertIs(tree._store._leaf_cache, cached)
+        b = [leaf for leaf in tree.leaves() if leaf.get_root() == 'b.txt'][0]
+        b.resize_leaf(100)
+        self.assertNotEqual(tree.generate_treemap(rect), treemap)
+        tree.complete_leaf_deletion(b)
+        expected = FileSystemTree(self.root)
+        expected.complete_leaf_deletion(
+            [leaf for leaf in expected.leaves()
+             if leaf.get_root() == 'b.txt'][0])
+        self.assertEqual(tree.generate_treemap(rect),
+                         expected.generate_treemap(rect))
+        self.assertIsNone(tree.convert_to_rect(rect, b))
+
+
+class SnapshotTest(FolderTestCase):
+    layout = {'a.txt': 10, 'empty.txt': 0, 'caf\xe9.txt': 3,
+              'sub': {'b.txt': 20, 'deep': {'c.txt': 5}}}
+
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(self._tmp.name, 'tree.snapshot')
+
+    def test_same_as_file_system_tree(self):
+        expected = FileSystemTree(self.root)
+        save_snapshot(expected, self.path)
+        with open_snapshot(self.path) as snapshot:
+            tree = snapshot.root()
+            self.assertEqual(_describe(tree), _describe(expected))
+            rect = (0, 0, 800, 600)
+            self.assertEqual(tree.generate_treemap(rect),
+                             expected.generate_treemap(rect))
+            self.assertEqual([leaf.get_separator() for leaf in tree.leaves()],
+                             [leaf.get_separator()
+                              for leaf in expected.leaves()])
+
+    def test_compact_tree_saved_as_is(self):
+        compact = CompactTree.from_path(self.root)
+        leaf = compact.root().leaves()[0]
+        compact.root().complete_leaf_deletion(leaf)
+        save_snapshot(compact, self.path)
+        with open_snapshot(self.path) as snapshot:
+            self.assertEqual(_describe(snapshot.root()),
+                             _describe(compact.root()))
+            self.assertEqual(len(snapshot), len(compact))
+
+    def test_read_only(self):
+        save_snapshot(FileSystemTree(self.root), self.path)
+        with open_snapshot(self.path) as snapshot:
+            tree = snapshot.root()
+            with self.assertRaises(TypeError):
+                tree.leaves()[0].resize_leaf(1)
+            self.assertEqual(tree.data_size, 38)
+
+    def test_writable_does_not_change_file(self):
+        save_snapshot(FileSystemTree(self.root), self.path)
+        with open(self.path, 'rb') as f:
+            saved = f.read()
+        with open_snapshot(self.path, writable=True) as snapshot:
+            tree = snapshot.root()
+            tree.complete_leaf_deletion(tree.leaves()[0])
+            self.assertLess(tree.data_size, 38)
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), saved)
+
+    def test_not_a_snapshot(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a snapshot at all, but long enough for a header')
+        with self.assertRaises(ValueError):
+            open_snapshot(self.path)
+        save_snapshot(FileSystemTree(self.root), self.path)
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 4)
+        with self.assertRaises(ValueError):
+            open_snapshot(self.path)
+
+
+class DiffTest(FolderTestCase):
+    layout = None
+
+    def setUp(self):
+        super().setUp()
+        self.old = os.path.join(self._tmp.name, 'old', 'root')
+        self.new = os.path.join(self._tmp.name, 'new', 'root')
+        os.mkdir(os.path.dirname(self.old))
+        os.mkdir(os.path.dirname(self.new))
+        _make_folder(self.old, {'same.txt': 10, 'grows.txt': 10,
+                                'shrinks.txt': 10, 'gone.txt': 7,
+                                'was_file': 4,
+                                'sub': {'b.txt': 20, 'deep': {'c.txt': 5}},
+                                'old_dir': {'d.txt': 8}})
+        _make_folder(self.new, {'same.txt': 10, 'grows.txt': 15,
+                                'shrinks.txt': 2, 'added.txt': 3,
+                                'was_file': {'e.txt': 6},
+                                'sub': {'b.txt': 20, 'deep': {'c.txt': 9}},
+                                'new_dir': {'f.txt': 1}})
+
+    def test_grown(self):
+        diff = diff_trees(FileSystemTree(self.old), FileSystemTree(self.new))
+        self.assertEqual(_describe(diff),
+                         ('root', 19, [('added.txt', 3, []),
+                                       ('grows.txt', 5, []),
+                                       ('new_dir', 1, [('f.txt', 1, [])]),
+                                       ('sub', 4, [('deep', 4,
+                                                    [('c.txt', 4, [])])]),
+                                       ('was_file', 6, [('e.txt', 6, [])])]))
+        c = [leaf for leaf in diff.leaves() if leaf.get_root() == 'c.txt'][0]
+        self.assertEqual(c.get_separator(),
+                         os.path.join('root', 'sub', 'deep', 'c.txt'))
+        self.assertEqual((c.old_size, c.new_size), (5, 9))
+
+    def test_shrunk(self):
+        diff = diff_trees(FileSystemTree(self.old), FileSystemTree(self.new),
+                          'shrunk')
+        self.assertEqual(_describe(diff),
+                         ('root', 27, [('gone.txt', 7, []),
+                                       ('old_dir', 8, [('d.txt', 8, [])]),
+                                       ('shrinks.txt', 8, []),
+                                       ('was_file', 4, [])]))
+
+    def test_compact_and_snapshot(self):
+        expected = _describe(diff_trees(FileSystemTree(self.old),
+                                        FileSystemTree(self.new)))
+        path = os.path.join(self._tmp.name, 'old.snapshot')
+        save_snapshot(FileSystemTree(self.old), path)
+        with open_snapshot(path) as snapshot:
+            diff = diff_trees(snapshot.root(),
+                              CompactTree.from_path(self.new).root())
+        self.assertEqual(_describe(diff), expected)
+
+    def test_nothing_changed(self):
+        diff = diff_trees(FileSystemTree(self.old), FileSystemTree(self.old))
+        self.assertEqual(diff.data_size, 0)
+        self.assertEqual(diff.get_subtrees(), [])
+
+
+class TopIndexTest(FolderTestCase):
+    layout = {
+        'a.txt': 10, 'e.txt': 3, 'empty.txt': 0,
+        'sub': {'b.txt': 20, 'f.txt': 1,
+                'deep': {'c.txt': 5, 'd.txt': 7}},
+        'other': {'g.txt': 12, 'h.txt': 2}}
+
+    def _check(self, index, tree, under=None):
+        # Compare with sorting every leaf and folder under <under>.
+        under = tree if under is None else under
+        files = sorted((leaf.data_size for leaf in under.leaves()),
+                       reverse=True)
+        folders = []
+        stack = list(under.get_subtrees())
+        while stack:
+            subtree = stack.pop()
+            if subtree.get_subtrees() and subtree.data_size > 0:
+                folders.append(subtree.data_size)
+                stack.extend(subtree.get_subtrees())
+        folders.sort(reverse=True)
+        for k in (1, 3, 100):
+            self.assertEqual([leaf.data_size
+                              for leaf in index.largest_files(k, under)],
+                             files[:k])
+            self.assertEqual([folder.data_size
+                              for folder in index.largest_folders(k, under)],
+                             folders[:k])
+
+    def _check_changes(self, tree):
+        index = TopIndex(tree)
+        self._check(index, tree)
+        self.assertEqual(index.largest_files(1)[0].get_root(), 'b.txt')
+        self._check(index, tree, _named(tree, 'deep'))
+
+        _named(tree, 'c.txt').resize_leaf(100)
+        self.assertEqual(index.largest_files(1)[0].get_root(), 'c.txt')
+        self._check(index, tree)
+        journal = TreeJournal(tree)
+        journal.delete(_named(tree, 'other'))
+        journal.delete(_named(tree, 'b.txt'))
+        journal.increase(_named(tree, 'e.txt'))
+        self._check(index, tree)
+        self._check(index, tree, _named(tree, 'sub'))
+        journal.undo()
+        journal.undo()
+        self._check(index, tree)
+        journal.undo()
+        self.assertFalse(index._stale)
+        self._check(index, tree)
+        c = _named(tree, 'c.txt')
+        with tree.batch() as batch:
+            batch.delete(c)
+            batch.delete(_named(tree, 'deep'))
+            batch.resize(_named(tree, 'a.txt'), 50)
+        self._check(index, tree)
+        self.assertFalse(index._stale)
+        with self.assertRaises(ValueError):
+            index.largest_files(1, c)
+        index.close()
+
+    def test_file_system_tree(self):
+        self._check_changes(FileSystemTree(self.root))
+
+    def test_compact(self):
+        self._check_changes(CompactTree.from_path(self.root).root())
+
+    def test_new_tree_rebuilds(self):
+        tree = FileSystemTree(self.root)
+        index = TopIndex(tree)
+        # Changes to other trees are not followed.
+        other = FileSystemTree(self.root)
+        other.leaves()[0].resize_leaf(1000)
+        self.assertFalse(index._stale)
+        _named(tree, 'sub')._add_subtree(AbstractTree('new', [], 500))
+        self.assertEqual(index.largest_files(1)[0].get_root(), 'new')
+        self._check(index, tree)
+        self.assertEqual(index.largest_folders(1)[0].get_root(), 'sub')
+
+    def test_only_told_about_its_tree(self):
+        tree = FileSystemTree(self.root)
+        other = FileSystemTree(self.root)
+        index = TopIndex(tree)
+        resized = []
+        index.tree_resized = resized.append
+        other.leaves()[0].resize_leaf(100)
+        self.assertEqual(resized, [])
+        leaf = tree.leaves()[0]
+        leaf.resize_leaf(100)
+        self.assertEqual(resized, [leaf])
+        index.close()
+        leaf.resize_leaf(50)
+        self.assertEqual(resized, [leaf])
+
+
+class SearchTest(FolderTestCase):
+    layout = {
+        'a.txt': 10, '.log': 3, 'cache': {'a.txt': 2, 'c.log': 4},
+        'sub': {'cached.bin': 20, 'deep': {'d.txt': 5, 'cache2': {}}}}
+
+    def _check(self, index, tree, pattern, under=None):
+        # Compare with matching the name of every node under <under>.
+        under = tree if under is None else under
+        expected = []
+        stack = [under]
+        while stack:
+            subtree = stack.pop()
+            if fnmatch.fnmatch(subtree.get_root(), pattern):
+                expected.append(_path_names(subtree))
+            stack.extend(subtree.get_subtrees())
+        found = [_path_names(match)
+                 for match in index.search(pattern, under)]
+        self.assertEqual(sorted(found), sorted(expected))
+        return len(found)
+
+    def _check_all(self, index, tree):
+        for pattern in ('a.txt', '*.log', '*.txt', 'cache*', '*ach*',
+                        '?.txt', 'missing', '*'):
+            self._check(index, tree, pattern)
+
+    def test_extension_like_fnmatch(self):
+        names = ['.py', 'a.py', 'b.PY', 'c.tar.py', 'd.py.txt', 'py', 'e.']
+        tree = AbstractTree('x', [AbstractTree(name, [], 1)
+                                  for name in names])
+        index = SearchIndex(tree)
+        for pattern in ('*.py', '*.PY', '*.txt', '*.', '*.tar.py'):
+            found = [match.get_root() for match in index.search(pattern)]
+            self.assertEqual(sorted(found),
+                             sorted(fnmatch.filter(names, pattern)))
+
+    def _check_changes(self, tree):
+        index = SearchIndex(tree)
+        self._check_all(index, tree)
+        self.assertEqual(self._check(index, tree, '*.log'), 2)
+        self.assertEqual(self._check(index, tree, 'cache*'), 3)
+        self._check(index, tree, '*.txt', _named(tree, 'sub'))
+
+        journal = TreeJournal(tree)
+        journal.delete(_named(tree, 'cache'))
+        self._check_all(index, tree)
+        self.assertEqual(self._check(index, tree, '*.log'), 1)
+        journal.undo()
+        self._check_all(index, tree)
+        self.assertEqual(self._check(index, tree, '*.log'), 2)
+        deep = _named(tree, 'deep')
+        with tree.batch() as batch:
+            batch.delete(_named(deep, 'd.txt'))
+            batch.delete(_named(tree, '.log'))
+        self._check_all(index, tree)
+        self.assertEqual(self._check(index, tree, '*.log'), 1)
+        index.close()
+
+    def test_file_system_tree(self):
+        self._check_changes(FileSystemTree(self.root))
+
+    def test_compact(self):
+        self._check_changes(CompactTree.from_path(self.root).root())
+
+    def test_added_trees(self):
+        tree = FileSystemTree(self.root)
+        index = SearchIndex(tree)
+        _named(tree, 'sub')._add_subtree(
+            AbstractTree('new', [AbstractTree('new.log', [], 1)]))
+        self._check_all(index, tree)
+        self.assertEqual(self._check(index, tree, '*.log'), 3)
+        # Changes to other trees are not followed.
+        other = FileSystemTree(self.root)
+        other.complete_leaf_deletion(_named(other, '.log'))
+        self.assertEqual(self._check(index, tree, '*.log'), 3)
+
+    def test_progressive_scan(self):
+        scan = ProgressiveScan(self.root)
+        index = SearchIndex(scan.tree)
+        scan.wait()
+        while not scan.is_done():
+            scan.update(0)
+        self._check_all(index, scan.tree)
+        self.assertEqual(self._check(index, scan.tree, '*.log'), 2)
+
+
+class GroupViewTest(FolderTestCase):
+    layout = {
+        'a.py': 10, 'b.PY': 3, 'README': 4,
+        'sub': {'c.txt': 20, 'd.py': 1, 'deep': {'e.txt': 5}},
+        'empty': {}}
+
+    def setUp(self):
+        super().setUp()
+        # Modified 2 days ago and 2 years ago.
+        old = time.time() - 2 * 24 * 3600
+        os.utime(os.path.join(self.root, 'b.PY'), (old, old))
+        old = time.time() - 2 * 365 * 24 * 3600
+        os.utime(os.path.join(self.root, 'sub', 'c.txt'), (old, old))
+
+    def _groups(self, tree):
+        return {subtree.get_root(): sorted(leaf.get_root()
+                                           for leaf in subtree.leaves())
+                for subtree in tree.get_subtrees()}
+
+    def test_list_dir_stats(self):
+        scanner = DirectoryScanner()
+        content, stats = scanner.list_dir_stats(self.root)
+        self.assertEqual(content, DirectoryScanner().list_dir(self.root))
+        for (name, path, is_dir, _), st in zip(content, stats):
+            if is_dir:
+                self.assertIsNone(st)
+            else:
+                self.assertEqual(st, (os.stat(path).st_uid,
+                                      os.stat(path).st_mtime))
+        self.assertEqual(scanner.stats.stat_calls,
+                         sum(not entry[2] for entry in content))
+
+    def test_views(self):
+        scanner = DirectoryScanner()
+        table = FileTable.from_path(self.root, scanner)
+        listings = scanner.stats.listings
+        self.assertEqual(len(table), 6)
+        for kind in GROUP_VIEWS:
+            tree = table.view(kind)
+            self.assertEqual(tree.get_root(), 'root')
+            self.assertEqual(tree.data_size, 43)
+            self.assertEqual(tree.data_size, tree.compute_size())
+            self.assertIs(table.view(kind), tree)
+            self.assertEqual(table.kind_of(tree), kind)
+        # Switching views does not scan again.
+        self.assertEqual(scanner.stats.listings, listings)
+
+        self.assertEqual(self._groups(table.view('extension')), {
+            '.py': ['a.py', 'b.PY', 'd.py'], '.txt': ['c.txt', 'e.txt'],
+            'no extension': ['README']})
+        self.assertEqual(self._groups(table.view('folder')), {
+            '.': ['README', 'a.py', 'b.PY'], 'sub': ['c.txt', 'd.py'],
+            os.path.join('sub', 'deep'): ['e.txt']})
+        self.assertEqual(self._groups(table.view('age')), {
+            'last day': ['README', 'a.py', 'd.py', 'e.txt'],
+            'last week': ['b.PY'], 'older': ['c.txt']})
+        owners = table.view('owner').get_subtrees()
+        self.assertEqual(len(owners), 1)
+        self.assertEqual(self._groups(owners[0]),
+                         self._groups(table.view('folder')))
+        with self.assertRaises(ValueError):
+            table.view('size')
+
+    def test_views_are_independent(self):
+        table = FileTable.from_path(self.root)
+        tree = table.view('extension')
+        tree.complete_leaf_deletion(tree.leaves()[0])
+        self.assertEqual(tree.data_size, tree.compute_size())
+        self.assertEqual(table.view('age').data_size, 43)
+
+    def test_caching_scanner(self):
+        cache_path = os.path.join(self._tmp.name, 'cache')
+        scanner = CachingScanner(cache_path)
+        FileSystemTree(self.root, scanner)
+        scanner.save()
+        scanner = CachingScanner(cache_path)
+        table = FileTable.from_path(self.root, scanner)
+        self.assertEqual(self._groups(table.view('age'))['older'],
+                         ['c.txt'])
+
+
+class LazyExpansionTest(FolderTestCase):
+    def test_sizes_before_expansion(self):
+        tree = FileSystemTree(self.root, eager_depth=0)
+        self.assertEqual(tree.data_size, 35)
+        sub = [t for t in tree._subtrees if t._root == 'sub'][0]
+        self.assertEqual(sub._subtrees, [])
+        self.assertEqual(sub.data_size, 25)
+
+    def test_expand_matches_full_scan(self):
+        tree = FileSystemTree(self.root, eager_depth=0)
+        while any(leaf.expand() for leaf in tree.leaves()):
+            pass
+        self.assertEqual(_describe(tree), _describe_path(self.root))
+        self.assertFalse(tree.expand())
+
+    def test_treemap_expands_big_folders(self):
+        tree = FileSystemTree(self.root, eager_depth=0)
+        tree.generate_treemap((0, 0, 800, 1000))
+        self.assertEqual(_describe(tree), _describe_path(self.root))
+
+    def test_expand_after_change(self):
+        tree = FileSystemTree(self.root, eager_depth=0)
+        with open(os.path.join(self.root, 'sub', 'new.txt'), 'wb') as f:
+            f.write(b'x' * 7)
+        sub = [t for t in tree._subtrees if t._root == 'sub'][0]
+        self.assertTrue(sub.expand())
+        self.assertEqual(sub.data_size, 32)
+        self.assertEqual(tree.data_size, 42)
+
+
+class ProgressiveScanTest(FolderTestCase):
+    layout = {'a.txt': 10,
+              'sub': {'b.txt': 20, 'deep': {'c.txt': 5}},
+              'empty': {}}
+
+    def test_same_tree_when_done(self):
+        scan = ProgressiveScan(self.root)
+        scan.wait()
+        self.assertTrue(scan.is_done())
+        self.assertEqual(scan.unfinished(), set())
+        self.assertEqual(_describe(scan.tree), _describe_path(self.root))
+
+    def test_partial_tree_is_consistent(self):
+        scan = ProgressiveScan(self.root)
+        self.assertIn(scan.tree, scan.unfinished())
+        while not scan.is_done():
+            # Add at most one listing at a time.
+            scan.update(0)
+            self.assertEqual(scan.tree.data_size, scan.tree.compute_size())
+        self.assertEqual(scan.tree.data_size, 35)
+
+    def test_unreadable_folder_is_skipped(self):
+        deep = os.path.join(self.root, 'sub', 'deep')
+
+        class FailingScanner(DirectoryScanner):
+            def list_dir(self, path):
+                if path == deep:
+                    raise FileNotFoundError(path)
+                return DirectoryScanner.list_dir(self, path)
+
+        scan = ProgressiveScan(self.root, FailingScanner())
+        scan.wait()
+        self.assertTrue(scan.is_done())
+        self.assertEqual([path for path, _ in scan.skipped], [deep])
+        self.assertEqual(scan.tree.data_size, 30)
+
+
+class ScanCacheTest(FolderTestCase):
+    layout = {'a.txt': 10, 'sub': {'b.txt': 20}}
+
+    def setUp(self):
+        super().setUp()
+        self.cache_path = os.path.join(self._tmp.name, 'scan.cache')
+
+    def _scan(self):
+        scanner = CachingScanner(self.cache_path)
+        tree = FileSystemTree(self.root, scanner)
+        scanner.save()
+        return tree, scanner
+
+    def test_second_scan_hits(self):
+        self._scan()
+        tree, scanner = self._scan()
+        self.assertEqual((scanner.hits, scanner.misses), (2, 0))
+        self.assertEqual(scanner.stats.listings, 0)
+        self.assertEqual(_describe(tree), _describe_path(self.root))
+
+    def test_changed_folder_is_read_again(self):
+        self._scan()
+        with open(os.path.join(self.root, 'sub', 'new.txt'), 'wb') as f:
+            f.write(b'x' * 5)
+        tree, scanner = self._scan()
+        self.assertEqual((scanner.hits, scanner.misses), (1, 1))
+        self.assertEqual(tree.data_size, 35)
+        self.assertEqual(_describe(tree), _describe_path(self.root))
+
+    def test_unexpected_data_is_ignored(self):
+        for data in ({'a': 1}, (CACHE_VERSION, 'apparent', None), None):
+            with open(self.cache_path, 'wb') as f:
+                pickle.dump(data, f)
+            tree, scanner = self._scan()
+            self.assertEqual((scanner.hits, scanner.misses), (0, 2))
+            self.assertEqual(_describe(tree), _describe_path(self.root))
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), 'needs inotify')
+class TreeWatcherTest(FolderTestCase):
+    layout = {'a.txt': 10, 'sub': {'b.txt': 20}}
+
+    def setUp(self):
+        super().setUp()
+        self.tree = FileSystemTree(self.root)
+        self.watcher = TreeWatcher(self.tree, self.root, min_interval=0)
+
+    def tearDown(self):
+        self.watcher.close()
+        super().tearDown()
+
+    def _check(self):
+        self.assertTrue(self.watcher.poll())
+        self.assertEqual(_describe(self.tree), _describe_path(self.root))
+
+    def _named(self, name, folder=None):
+        folder = self.tree if folder is None else folder
+        return [subtree for subtree in folder.get_subtrees()
+                if subtree.get_root() == name][0]
+
+    def test_create_and_modify(self):
+        with open(os.path.join(self.root, 'sub', 'c.txt'), 'wb') as f:
+            f.write(b'x' * 5)
+        self._check()
+        with open(os.path.join(self.root, 'a.txt'), 'ab') as f:
+            f.write(b'x' * 5)
+        self._check()
+        self.assertEqual(self.tree.data_size, 40)
+
+    def test_modify_hard_link_in_allocated_mode(self):
+        self.watcher.close()
+        os.link(os.path.join(self.root, 'a.txt'),
+                os.path.join(self.root, 'sub', 'link.txt'))
+        scanner = DirectoryScanner('allocated')
+        self.tree = FileSystemTree(self.root, scanner)
+        self.watcher = TreeWatcher(self.tree, self.root, scanner=scanner,
+                                   min_interval=0)
+        sub = self._named('sub')
+        links = [self._named('a.txt'), self._named('link.txt', sub)]
+        counted = max(links, key=lambda leaf: leaf.data_size)
+        other = min(links, key=lambda leaf: leaf.data_size)
+        b_size = scanner.file_size(os.stat(os.path.join(self.root, 'sub',
+                                                        'b.txt')))
+        for leaf in [counted, other]:
+            with open(os.path.join(self._tmp.name, leaf.get_separator()),
+                      'ab') as f:
+                f.write(b'x' * 5000)
+            self.assertTrue(self.watcher.poll())
+            # Changing the file through the link that is not counted does
+            # not count it again.
+            self.assertEqual(other.data_size, 0)
+            self.assertEqual(self.tree.data_size,
+                             counted.data_size + b_size)
+        self.assertGreater(counted.data_size, 4096)
+
+    def test_new_folder_and_delete(self):
+        _make_folder(os.path.join(self.root, 'new'), {'d.txt': 3})
+        self._check()
+        with open(os.path.join(self.root, 'new', 'e.txt'), 'wb') as f:
+            f.write(b'x' * 4)
+        self._check()
+        os.remove(os.path.join(self.root, 'sub', 'b.txt'))
+        self._check()
+        self.assertEqual(self.tree.data_size, 17)
+
+    def test_rename_moves_subtree(self):
+        sub = self.tree.get_subtrees()[0]
+        if sub.get_root() != 'sub':
+            sub = self.tree.get_subtrees()[1]
+        os.rename(os.path.join(self.root, 'sub'),
+                  os.path.join(self.root, 'moved'))
+        self._check()
+        self.assertEqual(sub.get_root(), 'moved')
+        self.assertIs(sub.get_parent_tree(), self.tree)
+
+
 ##############################################################################
 # Helper to sort subtrees alphabetically
 ##############################################################################
@@ -189,5 +1426,83 @@ def _sort_subtrees(tree):
         tree._subtrees.sort(key=lambda t: t._root)
 
 
+def _make_folder(path, layout):
+    """Create the folder <path> with the contents described by <layout>.
+
+    Each key of <layout> is a name; an int value creates a file of that many
+    bytes, and a dict value creates a sub-folder.
+
+    @type path: str
+    @type layout: dict
+    @rtype: None
+    """
+    os.mkdir(path)
+    for name, value in layout.items():
+        item_path = os.path.join(path, name)
+        if isinstance(value, dict):
+            _make_folder(item_path, value)
+        else:
+            with open(item_path, 'wb') as f:
+                f.write(b'x' * value)
+
+
+def _path_names(tree):
+    """Return the names of the trees from the root of <tree> down to it.
+
+    @type tree: AbstractTree
+    @rtype: list[str]
+    """
+    names = []
+    while tree is not None:
+        names.append(tree.get_root())
+        tree = tree.get_parent_tree()
+    names.reverse()
+    return names
+
+
+def _describe(tree):
+    """Return a nested tuple of (name, data_size, subtrees) for <tree>,
+    with the subtrees in alphabetical order.
+
+    @type tree: AbstractTree
+    @rtype: tuple
+    """
+    subtrees = sorted(_describe(subtree) for subtree in tree._subtrees)
+    return tree._root, tree.data_size, subtrees
+
+
+def _named(tree, name):
+    """Return the first tree named <name> found under <tree> (or <tree>
+    itself), or None.
+
+    @type tree: AbstractTree
+    @type name: str
+    @rtype: AbstractTree | None
+    """
+    stack = [tree]
+    while stack:
+        subtree = stack.pop()
+        if subtree.get_root() == name:
+            return subtree
+        stack.extend(subtree.get_subtrees())
+    return None
+
+
+def _describe_path(path):
+    """Return the same description as _describe for the tree the original
+    FileSystemTree constructor built from <path>, using os.listdir and
+    os.path.getsize directly.
+
+    @type path: str
+    @rtype: tuple
+    """
+    name = os.path.basename(path)
+    if not os.path.isdir(path):
+        return name, os.path.getsize(path), []
+    subtrees = sorted(_describe_path(os.path.join(path, filename))
+                      for filename in os.listdir(path))
+    return name, sum(subtree[1] for subtree in subtrees), subtrees
+
+
 if __name__ == '__main__':
     unittest.main(exit=False)
@@ -0,0 +1,382 @@
+"""
+=== Module Description ===
+This module contains TopIndex, which finds the largest files and folders of
+a tree, or of any folder in it, without looking at every file.
+
+The nodes of the tree are numbered in preorder, so the nodes under any
+folder have consecutive numbers. The index keeps two segment trees over
+these numbers, one holding the size of each file and one the size of each
+folder: arrays where each element is the largest of the two elements below
+it. The largest sizes in a range of numbers are then found by following the
+largest elements down from the few elements covering the range, which takes
+O((k + log n) log n) time for the k largest of n nodes.
+
+The index follows the changes made under the tree (see AbstractTree._observe)
+instead of being built again: a change of size only updates the changed
+tree and its ancestors, a deleted tree is taken out of the segment trees,
+and a tree put back where it was (e.g. by undo) is put back in them. Only
+trees that are new to the index (e.g. files created while the tree is
+watched) make it build itself again, the next time it is used.
+"""
+import heapq
+
+from compact_tree import CompactNode
+from tree_data import AbstractTree
+
+
+class TopIndex:
+    """An index of the largest files and folders of a tree.
+
+    === Private Attributes ===
+    @type _tree: AbstractTree
+        The tree this is an index of.
+    @type _store: CompactTree | None
+        If <_tree> is a CompactNode, its CompactTree: the nodes are then
+        known by their index in it, rather than by their view.
+    @type _nodes: list[AbstractTree | int]
+        The nodes of <_tree>, in preorder.
+    @type _positions: dict[AbstractTree | int, int]
+        The position of each node in <_nodes>.
+    @type _ends: list[int]
+        The position after the last node under each node.
+    @type _parents: list[int]
+        The position of the parent of each node, or -1.
+    @type _width: int
+        The number of elements at the bottom of each segment tree: a power
+        of 2 at least len(_nodes).
+    @type _files: list[int]
+        The segment tree of the sizes of the files. The size of the node at
+        position i is in _files[_width + i], or is -1 if the node is a
+        folder, has a size of 0, or was deleted; _files[i] for i < _width is
+        the largest of _files[2 * i] and _files[2 * i + 1].
+    @type _folders: list[int]
+        The segment tree of the sizes of the folders, in the same way.
+    @type _stale: bool
+        True if the index must be built again before it is used.
+    """
+    def __init__(self, tree):
+        """Initialize a new TopIndex of <tree>, which follows the changes
+        made to <tree> until it is closed or no longer used.
+
+        @type self: TopIndex
+        @type tree: AbstractTree
+        @rtype: None
+        """
+        self._tree = tree
+        self._store = tree._store if isinstance(tree, CompactNode) else None
+        self._build()
+        tree._observe(self)
+
+    def close(self):
+        """Stop following the changes made to the tree.
+
+        @type self: TopIndex
+        @rtype: None
+        """
+        self._tree._unobserve(self)
+
+    def largest_files(self, k, tree=None):
+        """Return the <k> largest files under <tree> (by default, the whole
+        tree), largest first. Files with a data_size of 0 are left out, like
+        in leaves().
+
+        @type self: TopIndex
+        @type k: int
+        @type tree: AbstractTree | None
+        @rtype: list[AbstractTree]
+
+        >>> a = AbstractTree('a', [], 30)
+        >>> b = AbstractTree('b', [AbstractTree('c', [], 40),
+        ...                        AbstractTree('d', [], 5)])
+        >>> index = TopIndex(AbstractTree('x', [a, b]))
+        >>> [leaf.get_root() for leaf in index.largest_files(2)]
+        ['c', 'a']
+        >>> [leaf.get_root() for leaf in index.largest_files(5, b)]
+        ['c', 'd']
+        >>> a.resize_leaf(50)
+        >>> [leaf.get_root() for leaf in index.largest_files(2)]
+        ['a', 'c']
+        """
+        start, end = self._range(tree)
+        return self._largest(self._files, k, start, end)
+
+    def largest_folders(self, k, tree=None):
+        """Return the <k> largest folders under <tree> (by default, the
+        whole tree), largest first. <tree> itself is left out.
+
+        @type self: TopIndex
+        @type k: int
+        @type tree: AbstractTree | None
+        @rtype: list[AbstractTree]
+
+        >>> a = AbstractTree('a', [AbstractTree('c', [], 4)])
+        >>> b = AbstractTree('b', [AbstractTree('d', [], 5)])
+        >>> t = AbstractTree('x', [a, b])
+        >>> index = TopIndex(t)
+        >>> [folder.get_root() for folder in index.largest_folders(5)]
+        ['b', 'a']
+        >>> t.complete_leaf_deletion(b)
+        >>> [folder.get_root() for folder in index.largest_folders(5)]
+        ['a']
+        """
+        start, end = self._range(tree)
+        return self._largest(self._folders, k, start + 1, end)
+
+    def tree_added(self, tree):
+        """Follow the addition of <tree> to the subtrees of its parent.
+
+        @type self: TopIndex
+        @type tree: AbstractTree
+        @rtype: None
+        """
+        if self._stale:
+            return
+        parent = self._positions.get(self._key(tree._parent_tree))
+        if parent is None:
+            # Added to a folder that is new to the index.
+            self._stale = True
+            return
+        position = self._positions.get(self._key(tree))
+        if position is None or self._parents[position] != parent:
+            self._stale = True
+            return
+        # Put back where it was: the nodes still under it are restored.
+        stack = [tree]
+        while stack:
+            subtree = stack.pop()
+            position = self._positions.get(self._key(subtree))
+            if position is None:
+                self._stale = True
+                return
+            self._update(position)
+            stack.extend(subtree._subtrees)
+
+    def tree_removed(self, tree):
+        """Follow the removal of <tree> from the subtrees of its parent.
+
+        @type self: TopIndex
+        @type tree: AbstractTree
+        @rtype: None
+        """
+        position = self._positions.get(self._key(tree))
+        if self._stale or position is None:
+            return
+        for index in range(position, self._ends[position]):
+            _set(self._files, self._width + index, -1)
+            _set(self._folders, self._width + index, -1)
+
+    def tree_resized(self, tree):
+        """Follow the change of the data_size of <tree> and its ancestors.
+
+        @type self: TopIndex
+        @type tree: AbstractTree
+        @rtype: None
+        """
+        if self._stale:
+            return
+        positions = []
+        while tree is not None:
+            position = self._positions.get(self._key(tree))
+            if position is None:
+                # Not in this tree, or new to it; see tree_added.
+                return
+            positions.append(position)
+            if tree is self._tree:
+                break
+            tree = tree._parent_tree
+        for position in positions:
+            self._update(position)
+
+    def _build(self):
+        """Number the nodes of the tree, and build the segment trees.
+
+        @type self: TopIndex
+        @rtype: None
+        """
+        nodes = []
+        parents = []
+        if self._store is None:
+            stack = [(self._tree, -1)]
+            while stack:
+                tree, parent = stack.pop()
+                parents.append(parent)
+                position = len(nodes)
+                nodes.append(tree)
+                stack.extend((subtree, position)
+                             for subtree in reversed(tree._subtrees))
+        else:
+            first_child = self._store._first_child
+            next_sibling = self._store._next_sibling
+            stack = [(self._tree._index, -1)]
+            while stack:
+                index, parent = stack.pop()
+                parents.append(parent)
+                position = len(nodes)
+                nodes.append(index)
+                children = []
+                child = first_child[index]
+                while child != -1:
+                    children.append((child, position))
+                    child = next_sibling[child]
+                children.reverse()
+                stack.extend(children)
+
+        ends = list(range(1, len(nodes) + 1))
+        # Going backwards, every node is complete before its parent.
+        for position in range(len(nodes) - 1, 0, -1):
+            parent = parents[position]
+            if ends[position] > ends[parent]:
+                ends[parent] = ends[position]
+
+        width = 1
+        while width < len(nodes):
+            width *= 2
+        self._nodes = nodes
+        self._positions = {node: position
+                           for position, node in enumerate(nodes)}
+        self._ends = ends
+        self._parents = parents
+        self._width = width
+        self._files = [-1] * (2 * width)
+        self._folders = [-1] * (2 * width)
+        for position in range(len(nodes)):
+            size, is_folder = self._read(position)
+            if size > 0:
+                if is_folder:
+                    self._folders[width + position] = size
+                else:
+                    self._files[width + position] = size
+        for tree in (self._files, self._folders):
+            for index in range(width - 1, 0, -1):
+                tree[index] = max(tree[2 * index], tree[2 * index + 1])
+        self._stale = False
+
+    def _range(self, tree):
+        """Return the positions of the first node under <tree> and of the
+        node after the last one, building the index again first if needed.
+
+        @type self: TopIndex
+        @type tree: AbstractTree | None
+        @rtype: (int, int)
+        """
+        if self._stale:
+            self._build()
+        if tree is None:
+            tree = self._tree
+        position = self._positions.get(self._key(tree))
+        if position is None or not self._tree._holds(tree):
+            raise ValueError('{!r} is not in the tree'.format(tree._root))
+        return position, self._ends[position]
+
+    def _largest(self, segments, k, start, end):
+        """Return the nodes of the <k> largest elements of <segments>
+        between the positions <start> and <end>, largest first.
+
+        @type self: TopIndex
+        @type segments: list[int]
+        @type k: int
+        @type start: int
+        @type end: int
+        @rtype: list[AbstractTree]
+        """
+        width = self._width
+        # The elements covering the range: at most two per level.
+        covering = []
+        low = start + width
+        high = end + width
+        while low < high:
+            if low & 1:
+                covering.append(low)
+                low += 1
+            if high & 1:
+                high -= 1
+                covering.append(high)
+            low //= 2
+            high //= 2
+        # Between equal sizes, the deepest element (then the leftmost) comes
+        # first, so that the elements above many equal sizes are only
+        # followed down one at a time.
+        heap = [(-segments[index], -index.bit_length(), index)
+                for index in covering if segments[index] > 0]
+        heapq.heapify(heap)
+        found = []
+        while heap and len(found) < k:
+            index = heapq.heappop(heap)[2]
+            if index >= width:
+                found.append(self._tree_at(index - width))
+            else:
+                for child in (2 * index, 2 * index + 1):
+                    if segments[child] > 0:
+                        heapq.heappush(heap, (-segments[child],
+                                              -child.bit_length(), child))
+        return found
+
+    def _update(self, position):
+        """Read the data_size of the node at <position> again.
+
+        @type self: TopIndex
+        @type position: int
+        @rtype: None
+        """
+        size, is_folder = self._read(position)
+        if size <= 0:
+            size = -1
+        _set(self._files, self._width + position, -1 if is_folder else size)
+        _set(self._folders, self._width + position, size if is_folder else -1)
+
+    def _read(self, position):
+        """Return the data_size of the node at <position>, and whether it
+        has subtrees.
+
+        @type self: TopIndex
+        @type position: int
+        @rtype: (int, bool)
+        """
+        node = self._nodes[position]
+        if self._store is None:
+            return node.data_size, bool(node._subtrees)
+        return self._store._size[node], self._store._first_child[node] != -1
+
+    def _key(self, tree):
+        """Return what <tree> is known by in <_positions>, or None if it
+        cannot be part of the tree.
+
+        @type self: TopIndex
+        @type tree: AbstractTree | None
+        @rtype: AbstractTree | int | None
+        """
+        if self._store is None:
+            return tree
+        if isinstance(tree, CompactNode) and tree._store is self._store:
+            return tree._index
+        return None
+
+    def _tree_at(self, position):
+        """Return the tree of the node at <position>.
+
+        @type self: TopIndex
+        @type position: int
+        @rtype: AbstractTree
+        """
+        if self._store is None:
+            return self._nodes[position]
+        return self._store.node(self._nodes[position])
+
+
+def _set(segments, index, value):
+    """Set the element <index> at the bottom of the segment tree <segments>
+    to <value>, and update the elements above it.
+
+    @type segments: list[int]
+    @type index: int
+    @type value: int
+    @rtype: None
+    """
+    segments[index] = value
+    index //= 2
+    while index:
+        largest = max(segments[2 * index], segments[2 * index + 1])
+        if segments[index] == largest:
+            break
+        segments[index] = largest
+        index //= 2
@@ -6,8 +6,57 @@ concrete implementation of a subclass to represent files and folders on your
 computer's file system.
 """
 import os
-from random import randint
+import sys
 import math
+import weakref
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from scanner import DirectoryScanner
+
+
+# A folder whose contents have not been read yet (see FileSystemTree) is read
+# when the treemap gives it a rectangle of at least this many pixels.
+LAZY_EXPAND_AREA = 64 * 64
+
+# The _subtrees of every tree created with no subtrees. Most trees of a file
+# system are files, so they share this list instead of having one each; it
+# must never be changed, so subtrees are added with _add_subtree (or
+# FileSystemTree._add_scanned), which give the tree a list of its own.
+_NO_SUBTREES = []
+
+# The ways a colour can be picked for a tree (see colour_for): from its whole
+# name, or from the extension of its name, so that all the files of a kind
+# share a colour.
+COLOUR_MODES = ('name', 'extension')
+
+# The colours of the common kinds of files, for the 'extension' colour mode.
+# Other extensions get a colour from their hash.
+_KIND_COLOURS = {
+    'code': (0x35, 0x72, 0xa5),
+    'text': (0xe8, 0xd4, 0x4d),
+    'image': (0x4c, 0xaf, 0x50),
+    'audio': (0xab, 0x47, 0xbc),
+    'video': (0xe5, 0x39, 0x35),
+    'archive': (0x8d, 0x6e, 0x63),
+    'document': (0xff, 0x98, 0x00),
+    'binary': (0x78, 0x90, 0x9c),
+}
+EXTENSION_COLOURS = {
+    extension: _KIND_COLOURS[kind]
+    for kind, extensions in [
+        ('code', '.py .pyc .c .h .cpp .hpp .java .js .ts .go .rs .rb .sh '
+                 '.html .css .json .xml .yml .yaml'),
+        ('text', '.txt .md .rst .csv .log .ini .cfg .toml'),
+        ('image', '.png .jpg .jpeg .gif .bmp .svg .webp .tif .tiff .ico'),
+        ('audio', '.mp3 .wav .flac .ogg .m4a .aac'),
+        ('video', '.mp4 .mkv .avi .mov .webm .wmv'),
+        ('archive', '.zip .tar .gz .bz2 .xz .7z .rar .zst .jar .whl .deb '
+                    '.rpm .iso'),
+        ('document', '.pdf .doc .docx .xls .xlsx .ppt .pptx .odt .ods'),
+        ('binary', '.so .dll .dylib .exe .o .a .bin .dat .db .sqlite'),
+    ]
+    for extension in extensions.split()}
 
 
 class AbstractTree:
@@ -15,9 +64,10 @@ class AbstractTree:
 
     This is an abstract class that should not be instantiated directly.
 
-    You may NOT add any attributes, public or private, to this class.
-    However, part of this assignment will involve you adding and implementing
-    new public *methods* for this interface.
+    A tree only has the attributes named in __slots__ (see below), and
+    setting any other attribute raises AttributeError: a new attribute must
+    be added to __slots__, or to the __slots__ of the subclass that needs
+    it. New public *methods* can be added to this interface freely.
 
     === Public Attributes ===
     @type data_size: int
@@ -25,6 +75,8 @@ class AbstractTree:
     @type colour: (int, int, int)
         The RGB colour value of the root of this tree.
         Note: only the colours of leaves will influence what the user sees.
+        Unless it was set, it is computed from the root value when it is
+        needed; see colour_for.
 
     === Private Attributes ===
     @type _root: obj | None
@@ -34,6 +86,25 @@ class AbstractTree:
     @type _parent_tree: AbstractTree | None
         The parent tree of this tree; i.e., the tree that contains this tree
         as a subtree, or None if this tree is not part of a larger tree.
+    @type _lazy: object | None
+        Not None if the subtrees of this tree have not been loaded yet; see
+        expand(). Only subclasses that load subtrees on demand use this.
+    @type _colour: int | None
+        The colour this tree was given, packed as 0xRRGGBB, or None to use
+        the colour of its root value.
+    @type _leaf_cache: _LeafIndex | None
+        For a tree with no parent, the treemap and leaves last computed, or
+        None. Anything that changes the tree once it has been displayed must
+        clear it: _add_to_size (and so resize_leaf, _add_subtree and
+        _remove_from_parent) and delete_leaf do. It is only used for the
+        colour_mode it was computed in.
+    @type _path: str | None
+        For a tree with subtrees, the string get_separator returns for it,
+        if it was needed since the tree was last moved, or None. Only
+        folders keep their path, so that the path of a leaf is one join
+        away. See _build_path. _add_subtree clears the paths of the trees
+        it adds, unless they are put back where they were; trees that were
+        removed keep theirs.
 
     === Representation Invariants ===
     - data_size >= 0
@@ -48,7 +119,30 @@ class AbstractTree:
       a bit easier).
 
     - if _parent_tree is not empty, then self is in _parent_tree._subtrees
+
+    A file system can have millions of trees, so the attributes are kept in
+    slots rather than an instance dict, names are interned (the same file
+    names, e.g. __init__.py, come up in many folders), and the colour is
+    only kept if it was set. Trees with no subtrees share the same empty
+    _subtrees list. Subclasses should declare __slots__ too.
+
+    colour_mode is a class attribute, one of COLOUR_MODES: how the colours
+    of the trees that were not given one are picked.
+
+    _observers is a class attribute too: for each tree followed by some
+    objects (e.g. a TopIndex), those objects, which are told about every
+    tree added to or removed from a parent under it, and every change of
+    data_size under it, through their tree_added, tree_removed and
+    tree_resized methods (see _observe). Changes made to other trees reach
+    none of them. The objects are held by weak references, so one that is
+    no longer used stops being told.
     """
+    colour_mode = 'name'
+    _observers = {}
+
+    __slots__ = ('_root', '_subtrees', '_parent_tree', '_lazy', '_colour',
+                 '_leaf_cache', '_path', 'data_size')
+
     def __init__(self, root, subtrees, data_size=0):
         """Initialize a new AbstractTree.
 
@@ -60,7 +154,8 @@ class AbstractTree:
 
         This method sets the _parent_tree attribute for each subtree to self.
 
-        A random colour is chosen for this tree.
+        The colour of this tree is picked from <root> when it is first
+        needed; see colour_for.
 
         Precondition: if <root> is None, then <subtrees> is empty.
 
@@ -97,14 +192,19 @@ class AbstractTree:
         >>> t2._parent_tree is tx
         False
         """
+        if type(root) is str:
+            root = sys.intern(root)
         self._root = root
-        self._subtrees = subtrees
+        self._subtrees = subtrees if subtrees else _NO_SUBTREES
         self._parent_tree = None
+        self._lazy = None
+        self._leaf_cache = None
+        self._path = None
 
         # 1. Initialize self.colour and self.data_size。
         # 2. Properly set all _parent_tree attributes in self._subtrees
 
-        self.colour = (randint(0, 255), randint(0, 255), randint(0, 255))
+        self._colour = None
 
         if root is None:
             self.data_size = 0
@@ -119,6 +219,37 @@ class AbstractTree:
                 tree._parent_tree = self
             self.data_size = size
 
+    @property
+    def colour(self):
+        """The colour of this tree, as an (r, g, b) tuple.
+
+        @type self: AbstractTree
+        @rtype: (int, int, int)
+
+        >>> t = AbstractTree('a', [], 10)
+        >>> t.colour == AbstractTree('a', [], 20).colour
+        True
+        >>> t.colour = (1, 2, 3)
+        >>> t.colour
+        (1, 2, 3)
+        """
+        colour = self._colour
+        if colour is None:
+            return colour_for(self._root, self.colour_mode)
+        return colour >> 16, (colour >> 8) & 0xFF, colour & 0xFF
+
+    @colour.setter
+    def colour(self, value):
+        """Set the colour of this tree to the (r, g, b) tuple <value>.
+
+        @type self: AbstractTree
+        @type value: (int, int, int)
+        @rtype: None
+        """
+        r, g, b = value
+        self._colour = (r << 16) | (g << 8) | b
+        self._clear_leaf_cache()
+
     def is_empty(self):
         """Return True if this tree is empty.
 
@@ -140,68 +271,132 @@ class AbstractTree:
             Input is in the pygame format: (x, y, width, height)
         @rtype: list[((int, int, int, int), (int, int, int))]
         """
-        x, y, width, height = rect
+        return list(self._leaf_index(rect).treemap)
 
-        if self.data_size == 0:
-            # This represents an empty folder.
-            return []
+    def _leaf_index(self, rect):
+        """Return the treemap of this tree in <rect>, with the leaf each
+        rectangle belongs to.
 
-        elif len(self._subtrees) == 0:
-            # <self> is a leaf in this case (ie. represents a single file).
-            return [(rect, self.colour)]
+        A tree with no parent keeps the result in _leaf_cache, so the
+        visualiser can redraw and look up the clicked leaf without walking
+        the tree again until it changes.
 
-        else:
-            tree_map = []
-            x_tree = x
-            y_tree = y
+        @type self: AbstractTree
+        @type rect: (int, int, int, int)
+        @rtype: _LeafIndex
+        """
+        index = self._leaf_cache
+        if index is not None and index.rect == rect and \
+                index.colour_mode == self.colour_mode:
+            return index
+        treemap = []
+        leaves = []
+        for tree, tree_rect in self._layout(rect):
+            if len(tree._subtrees) == 0:
+                treemap.append((tree_rect, tree.colour))
+                leaves.append(tree)
+        index = _LeafIndex(rect, self.colour_mode, treemap, leaves)
+        if self._parent_tree is None:
+            # Laying the tree out may have expanded folders (and cleared the
+            # cache), so the index is only stored once it is complete.
+            self._leaf_cache = index
+        return index
 
-            for tree in self._subtrees:
-                portion = tree.data_size / self.data_size
+    def _clear_leaf_cache(self):
+        """Forget the treemap and leaves cached by the root of this tree,
+        because the tree changed.
 
-                if width > height and tree != self._subtrees[-1]:
-                    # <tree> is not the last tree in the list of subtree.
-                    subtree_width = math.floor(portion * width)
+        @type self: AbstractTree
+        @rtype: None
+        """
+        tree = self
+        while tree is not None:
+            tree._leaf_cache = None
+            tree = tree._parent_tree
 
-                    subtree_rect = (x_tree, y_tree, subtree_width, height)
+    def rects_of(self, rect, trees):
+        """Return the rectangles of the subtrees <trees> in the treemap of
+        this tree, in the order the treemap algorithm visits them.
 
-                    combine(tree.generate_treemap(subtree_rect), tree_map)
+        Unlike generate_treemap, this also finds the rectangles of
+        internal nodes (e.g., folders). Subtrees with a data_size of 0 have
+        no rectangle.
 
-                    x_tree += subtree_width
-
-                elif width > height and tree == self._subtrees[-1]:
-                    subtree_width = width - (x_tree - x)
-                    # NOTICE THAT, the meaning for (x_tree - x) is to change
-                    # the starting x coordinate of current rectangle to the x
-                    # coordinate with respect to the origin (0, 0).
-                    # This is extremely important and easy to ignore.
-                    # Since for the import rectangle <rect>, the top-left
-                    # coordinate of <rect> is not always starts at (0, 0).
+        @type self: AbstractTree
+        @type rect: (int, int, int, int)
+        @type trees: set[AbstractTree]
+        @rtype: list[(int, int, int, int)]
+
+        >>> t1 = AbstractTree('a', [], 30)
+        >>> t2 = AbstractTree('b', [], 10)
+        >>> t3 = AbstractTree('c', [t2])
+        >>> t = AbstractTree('x', [t1, t3])
+        >>> t.rects_of((0, 0, 80, 10), {t3})
+        [(60, 0, 20, 10)]
+        """
+        return [tree_rect for tree, tree_rect in self._layout(rect)
+                if tree in trees]
 
-                    subtree_rect = (x_tree, y_tree, subtree_width, height)
+    def _layout(self, rect):
+        """Yield a (tree, rect) pair for this tree and every subtree with a
+        non-zero data_size, in the order the treemap algorithm visits them.
 
-                    combine(tree.generate_treemap(subtree_rect), tree_map)
+        The rectangles are computed with an explicit stack rather than
+        recursion, so trees of any depth can be laid out.
 
+        @type self: AbstractTree
+        @type rect: (int, int, int, int)
+        @rtype: iterator[(AbstractTree, (int, int, int, int))]
+        """
+        stack = [(self, rect)]
+        while stack:
+            tree, rect = stack.pop()
+            if tree.data_size == 0:
+                # This represents an empty folder.
+                continue
+
+            x, y, width, height = rect
+            if tree._lazy is not None and width * height >= LAZY_EXPAND_AREA:
+                # Big enough on screen for its contents to be worth loading.
+                tree.expand()
+            yield tree, rect
+
+            subtrees = tree._subtrees
+            last = len(subtrees) - 1
+            x_tree = x
+            y_tree = y
+            subtree_rects = []
+
+            for i in range(len(subtrees)):
+                portion = subtrees[i].data_size / tree.data_size
+
+                if width > height:
+                    if i < last:
+                        subtree_width = math.floor(portion * width)
+                    else:
+                        # NOTICE THAT, the meaning for (x_tree - x) is to
+                        # change the starting x coordinate of current
+                        # rectangle to the x coordinate with respect to the
+                        # origin (0, 0). Since for the import rectangle
+                        # <rect>, the top-left coordinate of <rect> is not
+                        # always starts at (0, 0).
+                        subtree_width = width - (x_tree - x)
+                    subtree_rects.append(
+                        (subtrees[i], (x_tree, y_tree, subtree_width, height)))
                     x_tree += subtree_width
 
-                elif width <= height and tree != self._subtrees[-1]:
-                    subtree_height = math.floor(portion * height)
-
-                    subtree_rect = (x_tree, y_tree, width, subtree_height)
-
-                    combine(tree.generate_treemap(subtree_rect), tree_map)
-
-                    y_tree += subtree_height
-
-                elif width <= height and tree == self._subtrees[-1]:
-                    subtree_height = height - (y_tree - y)
-
-                    subtree_rect = (x_tree, y_tree, width, subtree_height)
-
-                    combine(tree.generate_treemap(subtree_rect), tree_map)
-
+                else:
+                    if i < last:
+                        subtree_height = math.floor(portion * height)
+                    else:
+                        subtree_height = height - (y_tree - y)
+                    subtree_rects.append(
+                        (subtrees[i], (x_tree, y_tree, width, subtree_height)))
                     y_tree += subtree_height
 
-            return tree_map
+            # Reversed, so that the first subtree is the next one popped.
+            subtree_rects.reverse()
+            stack.extend(subtree_rects)
 
     def get_separator(self):
         """Return the string used to separate nodes in the string
@@ -218,6 +413,72 @@ class AbstractTree:
         """
         raise NotImplementedError
 
+    def get_separators(self, trees):
+        """Return get_separator() for each tree in <trees>, e.g. to export
+        the paths of many leaves at once.
+
+        The paths of the folders are only built once, however many of the
+        trees are in them.
+
+        @type self: AbstractTree
+        @type trees: list[AbstractTree]
+        @rtype: list[str]
+        """
+        return [tree.get_separator() for tree in trees]
+
+    def _path_parent(self):
+        """Return the tree whose path starts the path of this tree in
+        get_separator, or None if the path is just the root of this tree.
+
+        @type self: AbstractTree
+        @rtype: AbstractTree | None
+        """
+        return self._parent_tree
+
+    def _build_path(self, join):
+        """Return the path of this tree, where join(parts) joins the path of
+        a tree to the names under it.
+
+        The folder this tree is in (or this tree, if it is a folder) keeps
+        its path, so the paths of the other trees in it are a single join.
+        Otherwise, the tree is walked up only as far as the first folder
+        whose path is known. Only that one folder keeps its path, so a
+        deep chain of folders does not keep a long path for each of them.
+
+        @type self: AbstractTree
+        @type join: list[str] -> str
+        @rtype: str
+        """
+        folder = self if self._subtrees else self._path_parent()
+        if folder is None:
+            return join([self._root])
+        if folder._path is None:
+            parts = []
+            tree = folder
+            while tree is not None and tree._path is None:
+                parts.append(tree._root)
+                tree = tree._path_parent()
+            if tree is not None:
+                parts.append(tree._path)
+            parts.reverse()
+            folder._path = join(parts)
+        if folder is self:
+            return folder._path
+        return join([folder._path, self._root])
+
+    def _forget_paths(self):
+        """Forget the paths kept by this tree and the folders under it,
+        because this tree moved.
+
+        @type self: AbstractTree
+        @rtype: None
+        """
+        stack = [self]
+        while stack:
+            tree = stack.pop()
+            tree._path = None
+            stack.extend(tree._subtrees)
+
     def leaves(self):
         """Return a list containing all leaves of the tree <self> and don't
         contain the leaf has <data_size> equal to 0.
@@ -239,23 +500,26 @@ class AbstractTree:
         >>> tx.leaves()[1]._root
         0
         """
-        leaves = []
-        if self.is_empty():
-            return []
-        elif len(self._subtrees) == 0:
+        if self.is_empty() or len(self._subtrees) == 0:
             return []
-        else:
-            for tree in self._subtrees:
-                # NOTICE THAT, the empty folder is the same as a single file
-                # from the view of regular leaves method. But here we need to
-                # let this method distinguish empty folded and a single file.
-                # The difference is an empty file has <data_size> equal to 0
-                # While a single file <data_size> is not 0.
-                if (len(tree.get_subtrees()) == 0) and (tree.data_size != 0):
+        if self._leaf_cache is not None:
+            return list(self._leaf_cache.leaves)
+
+        leaves = []
+        stack = self._subtrees[::-1]
+        while stack:
+            tree = stack.pop()
+            # NOTICE THAT, the empty folder is the same as a single file
+            # from the view of regular leaves method. But here we need to
+            # let this method distinguish empty folded and a single file.
+            # The difference is an empty file has <data_size> equal to 0
+            # While a single file <data_size> is not 0.
+            if len(tree._subtrees) == 0:
+                if tree.data_size != 0:
                     leaves.append(tree)
-                else:
-                    leaves += tree.leaves()
-            return leaves
+            elif not tree.is_empty():
+                stack.extend(tree._subtrees[::-1])
+        return leaves
 
     def get_leaf(self, rect, tree_rect):
         """Return a leaf(which is a AbstractTree object) according to its
@@ -293,14 +557,7 @@ class AbstractTree:
         >>> f4.generate_treemap((0, 0, 800, 1000))[0][0]
         (0, 0, 800, 1000)
         """
-        leaves = self.leaves()
-        # List of leaf (with <data_size> is not 0) of this tree <self>.
-        tree_map = self.generate_treemap(rect)
-        for item in tree_map:
-            # <item> is in format: ((x, y, width, height), colour).
-            if tree_rect == item[0]:
-                index = tree_map.index(item)
-                return leaves[index]
+        return self._leaf_index(rect).leaf_at(tree_rect)
 
     def convert_to_rect(self, rect, leaf):
         """Return the rectangle representation of a leaf.
@@ -326,14 +583,7 @@ class AbstractTree:
         >>> tree.convert_to_rect((0, 0, 800, 1000), f4)[0]
         (0, 750, 800, 250)
         """
-
-        leaf_lst = self.leaves()
-        treemap = self.generate_treemap(rect)
-        for item in leaf_lst:
-            # <item> is in format: ((x, y, width, height), colour).
-            if item == leaf:
-                index = leaf_lst.index(item)
-                return treemap[index]
+        return self._leaf_index(rect).rect_of(leaf)
 
     def delete_leaf(self, leaf):
         """Delete the leaf <leaf> from this tree.
@@ -341,9 +591,13 @@ class AbstractTree:
         Return True if <leaf> is deleted,
         return False (and do nothing else) if the item is not in this tree.
 
+        <leaf> may also be a folder, which is deleted with everything in it.
+        <leaf> is found by following its _parent_tree links up to <self>, so
+        this takes time proportional to the depth of <leaf>, not the size of
+        the tree. The data_size of its ancestors is not changed; see
+        complete_leaf_deletion.
 
-        Precondition: <self> is not empty, the tree has this <leaf> and the
-        <leaf> does not have any subtree.
+        Precondition: <self> is not empty.
 
         @type self: AbstractTree
         @type leaf: AbstractTree
@@ -375,21 +629,30 @@ class AbstractTree:
         '4'
         >>> f._subtrees[2]._subtrees
         []
+        >>> f.delete_leaf(f4)
+        True
+        >>> [t._root for t in f._subtrees]
+        [1, 2]
+        >>> f.delete_leaf(f4)
+        False
         """
-        if len(self._subtrees) == 0:
-            if self is leaf:
-                self._root = None
-                return True
-            else:
+        tree = leaf
+        while tree is not self:
+            if tree is None:
                 return False
-
-        else:
-            for subtree in self._subtrees:
-                if subtree.delete_leaf(leaf):
-                    if subtree.is_empty():
-                        self._subtrees.remove(subtree)
-                    return True
-            return False
+            tree = tree._parent_tree
+
+        self._clear_leaf_cache()
+        if leaf is not self:
+            # An empty tree is not kept in its parent's subtrees.
+            parent = leaf._parent_tree
+            parent._subtrees.remove(leaf)
+            leaf._parent_tree = None
+            if self._observers:
+                parent._notify('tree_removed', leaf)
+        leaf._root = None
+        leaf._subtrees = _NO_SUBTREES
+        return True
 
     def compute_size(self):
         """Return the <data_size> attribute of this tree <self>.
@@ -413,28 +676,34 @@ class AbstractTree:
         >>> t0.compute_size()
         0
         """
-        if self.is_empty():
-            return 0
-        elif len(self._subtrees) == 0:
-            # This is the case for a single file or a single empty folder.
-            return self.data_size
-        else:
-            count = 0
-            for subtree in self._subtrees:
-                count += subtree.compute_size()
-            return count
+        count = 0
+        stack = [self]
+        while stack:
+            tree = stack.pop()
+            if tree.is_empty():
+                continue
+            elif len(tree._subtrees) == 0:
+                # This is the case for a single file or a single empty folder.
+                count += tree.data_size
+            else:
+                stack.extend(tree._subtrees)
+        return count
 
     def complete_leaf_deletion(self, leaf):
         """The complete leaf deletion operation, it delete the <leaf> from this
         tree <self> and change the <data_size> attribute of <self> and its
         subtree.
 
+        Only the ancestors of <leaf> change size, so like delete_leaf this
+        takes time proportional to the depth of <leaf>. <leaf> may also be a
+        folder.
+
         @type self: AbstractTree
         @type leaf: AbstractTree
         @rtype: None
 
-        Precondition: <leaf> is some leaf of <self>. Otherwise, this method
-        will do nothing.
+        Precondition: <leaf> is some leaf (or folder) of <self>. Otherwise,
+        this method will do nothing.
 
         >>> t1 = AbstractTree('a', [], 10)
         >>> t2 = AbstractTree('b', [], 100)
@@ -470,17 +739,17 @@ class AbstractTree:
         0
         >>> folder1.get_subtrees()
         []
+        >>> big_t.complete_leaf_deletion(t4)
+        >>> big_t.data_size, len(big_t.get_subtrees())
+        (100, 2)
         """
-        leaf.get_parent_tree().data_size -= leaf.data_size
+        parent = leaf._parent_tree
         if self.delete_leaf(leaf):
-            if len(self._subtrees) == 0:
-                # This is the case that after deletion, <self> becomes a tree
-                # with no subtree(ie.an empty folder).
-                self.data_size = 0
+            if leaf is self:
+                # <self> is now empty, so its data_size is 0.
+                self._add_to_size(-self.data_size)
             else:
-                for subtree in self._subtrees:
-                    subtree.data_size = subtree.compute_size()
-                self.data_size = self.compute_size()
+                parent._add_to_size(-leaf.data_size)
 
     def get_subtrees(self):
         """Return the <_subtrees> attribute of <self>.
@@ -545,20 +814,7 @@ class AbstractTree:
         >>> folder_big.data_size
         1112
         """
-        # First, we increase <data_size> of this leaf <self>.
-        increase = math.ceil(self.data_size * 0.01)
-        self.data_size += increase
-
-        # Next, we change the <data_size> of all ancestors of this leaf <self>.
-        parent = self
-        # type parent: AbstractTree | None
-        while parent.get_parent_tree() is not None:
-            parent = parent.get_parent_tree()
-            count = 0
-            for subtree in parent.get_subtrees():
-                count += subtree.data_size
-            parent.data_size = count
-            # or do: parent.data_size = parent.compute_size() directly.
+        self.resize_leaf(self.data_size + math.ceil(self.data_size * 0.01))
 
     def decrease_size(self):
         """Decrease the <data_size> attribute of <self> by 1% of its current
@@ -595,21 +851,168 @@ class AbstractTree:
         1
         """
         decrease = math.ceil(self.data_size * 0.01)
-        self.data_size -= decrease
-
-        if self.data_size < 1:
-            # This prevents the case when <data_size> of this leaf goes below 1.
-            self.data_size = 1
-
-        # Next, we change the <data_size> of all ancestors of this leaf <self>.
-        parent = self
-        # type parent: AbstractTree | None
-        while parent.get_parent_tree() is not None:
-            parent = parent.get_parent_tree()
-            count = 0
-            for subtree in parent.get_subtrees():
-                count += subtree.data_size
-            parent.data_size = count
+        # This prevents the case when <data_size> of this leaf goes below 1.
+        self.resize_leaf(max(self.data_size - decrease, 1))
+
+    def resize_leaf(self, new_size):
+        """Set the <data_size> of this leaf <self> to <new_size>, and update
+        the <data_size> of all <self>'s ancestors.
+
+        Only the difference is added to each ancestor, so this takes time
+        proportional to the depth of <self>, whatever the number of files in
+        its folders.
+
+        Pre-condition: <self> is a leaf. (ie.it has no subtree)
+
+        @type self: AbstractTree
+        @type new_size: int
+        @rtype: None
+
+        >>> f1 = AbstractTree('f1', [], 10)
+        >>> f2 = AbstractTree('f2', [], 100)
+        >>> folder1 = AbstractTree('F1', [f1, f2])
+        >>> folder_big = AbstractTree('big', [folder1])
+        >>> f1.resize_leaf(50)
+        >>> f1.data_size, folder1.data_size, folder_big.data_size
+        (50, 150, 150)
+        >>> f2.resize_leaf(-1)
+        Traceback (most recent call last):
+        ...
+        ValueError: size cannot be negative: -1
+        """
+        if new_size < 0:
+            raise ValueError('size cannot be negative: {}'.format(new_size))
+        self._add_to_size(new_size - self.data_size)
+
+    def batch(self):
+        """Return a TreeBatch to delete and resize many trees under this
+        tree at once.
+
+        @type self: AbstractTree
+        @rtype: TreeBatch
+
+        >>> t1 = AbstractTree('a', [], 10)
+        >>> t2 = AbstractTree('b', [], 100)
+        >>> t3 = AbstractTree('c', [t1, t2])
+        >>> big_t = AbstractTree('big', [t3, AbstractTree('d', [], 5)])
+        >>> with big_t.batch() as batch:
+        ...     batch.resize(t1, 20)
+        ...     batch.delete(t2)
+        >>> big_t.data_size, t3.data_size
+        (25, 20)
+        >>> [tree.get_root() for tree in batch.changed]
+        ['a', 'c', 'big']
+        >>> [tree is t2 for tree in batch.removed]
+        [True]
+        """
+        return TreeBatch(self)
+
+    def _apply_batch(self, operations):
+        """Apply the queued TreeBatch <operations> to this tree, with each
+        ancestor's data_size updated once at the end. Return the trees
+        whose data_size changed, deepest first, and the trees deleted.
+
+        @type self: AbstractTree
+        @type operations: list[(str, AbstractTree, int | None)]
+        @rtype: (list[AbstractTree], list[AbstractTree])
+        """
+        deltas = {}
+        resized = set()
+        removed = []
+        # The trees to take out of each parent's subtrees, by parent.
+        unlinked = {}
+        for action, tree, size in operations:
+            if not self._holds(tree):
+                # Deleted earlier in this batch, or never in this tree.
+                continue
+            parent = tree._parent_tree
+            if action == 'resize':
+                delta = size - tree.data_size
+                tree.data_size = size
+                if delta != 0:
+                    resized.add(tree)
+                    deltas.setdefault(tree, 0)
+                    if parent is not None:
+                        deltas[parent] = deltas.get(parent, 0) + delta
+            elif tree is self:
+                deltas[self] = deltas.get(self, 0) - self.data_size
+                if self._observers:
+                    self._notify('tree_removed')
+                self._root = None
+                self._subtrees = _NO_SUBTREES
+                removed.append(self)
+            else:
+                # The tree is cut off from its parent straight away, so that
+                # the changes queued under it stay with it.
+                deltas[parent] = deltas.get(parent, 0) - tree.data_size
+                unlinked.setdefault(parent, set()).add(tree)
+                tree._parent_tree = None
+                if self._observers:
+                    parent._notify('tree_removed', tree)
+                tree._root = None
+                tree._subtrees = _NO_SUBTREES
+                removed.append(tree)
+
+        for parent, trees in unlinked.items():
+            parent._subtrees = [subtree for subtree in parent._subtrees
+                                if subtree not in trees]
+
+        # Every ancestor of a changed tree is visited once, however many
+        # trees under it changed.
+        for tree in list(deltas):
+            parent = tree._parent_tree
+            while parent is not None and parent not in deltas:
+                deltas[parent] = 0
+                parent = parent._parent_tree
+
+        # Each tree is updated after every tree under it, so its delta is
+        # complete when it is added to its own size and passed up.
+        depths = {tree: tree._depth() for tree in deltas}
+        order = sorted(deltas, key=depths.get, reverse=True)
+        changed = []
+        for tree in order:
+            delta = deltas[tree]
+            tree._leaf_cache = None
+            if tree in resized or delta != 0:
+                changed.append(tree)
+            tree.data_size += delta
+            if tree._parent_tree is not None:
+                deltas[tree._parent_tree] += delta
+        top = self
+        while top._parent_tree is not None:
+            top = top._parent_tree
+        changed = [tree for tree in changed
+                   if tree._root is not None and top._holds(tree)]
+        if self._observers:
+            for tree in changed:
+                tree._notify('tree_resized')
+        return changed, removed
+
+    def _holds(self, tree):
+        """Return True if <tree> is this tree or is under it.
+
+        @type self: AbstractTree
+        @type tree: AbstractTree
+        @rtype: bool
+        """
+        while tree is not None:
+            if tree is self:
+                return True
+            tree = tree._parent_tree
+        return False
+
+    def _depth(self):
+        """Return the number of ancestors of this tree.
+
+        @type self: AbstractTree
+        @rtype: int
+        """
+        depth = 0
+        tree = self._parent_tree
+        while tree is not None:
+            depth += 1
+            tree = tree._parent_tree
+        return depth
 
     def get_root(self):
         """Return the root value of <self>
@@ -619,6 +1022,185 @@ class AbstractTree:
         """
         return self._root
 
+    def expand(self):
+        """Load the subtrees of this tree, if they have not been loaded yet.
+
+        Return True if this tree changed. Trees that load their subtrees on
+        demand override this; by default every subtree is already loaded.
+
+        @type self: AbstractTree
+        @rtype: bool
+
+        >>> AbstractTree('a', [], 10).expand()
+        False
+        """
+        return False
+
+    def _add_to_size(self, delta):
+        """Add <delta> to the data_size of this tree and of every ancestor
+        of this tree.
+
+        @type self: AbstractTree
+        @type delta: int
+        @rtype: None
+
+        >>> t1 = AbstractTree('a', [], 10)
+        >>> t2 = AbstractTree('b', [t1])
+        >>> t3 = AbstractTree('c', [t2])
+        >>> t1._add_to_size(5)
+        >>> t1.data_size, t2.data_size, t3.data_size
+        (15, 15, 15)
+        """
+        tree = self
+        while tree is not None:
+            tree.data_size += delta
+            tree._leaf_cache = None
+            tree = tree._parent_tree
+        if self._observers:
+            self._notify('tree_resized')
+
+    def _observe(self, observer):
+        """Tell <observer> about the changes made under this tree (see
+        _notify), until _unobserve is called or <observer> is no longer
+        used.
+
+        @type self: AbstractTree
+        @type observer: object
+        @rtype: None
+        """
+        observers = AbstractTree._observers.get(self)
+        if observers is None:
+            observers = AbstractTree._observers[self] = weakref.WeakSet()
+        observers.add(observer)
+
+    def _unobserve(self, observer):
+        """Stop telling <observer> about the changes made under this tree.
+
+        @type self: AbstractTree
+        @type observer: object
+        @rtype: None
+        """
+        observers = AbstractTree._observers.get(self)
+        if observers is not None:
+            observers.discard(observer)
+            if not observers:
+                del AbstractTree._observers[self]
+
+    def _notify(self, event, tree=None):
+        """Call the method <event> with <tree> (by default, this tree) of
+        every observer of this tree or of one of its ancestors:
+        'tree_added' once <tree> was added to the subtrees of its parent,
+        'tree_removed' once it was removed from the subtrees of this tree
+        (but before a deleted tree loses its root and subtrees), and
+        'tree_resized' once the data_size of it and its ancestors changed.
+
+        @type self: AbstractTree
+        @type event: str
+        @type tree: AbstractTree | None
+        @rtype: None
+
+        >>> class Printer:
+        ...     def tree_resized(self, tree):
+        ...         print(tree.get_root())
+        >>> a = AbstractTree('a', [], 10)
+        >>> t = AbstractTree('t', [AbstractTree('b', [a])])
+        >>> printer = Printer()
+        >>> t._observe(printer)
+        >>> a.resize_leaf(5)
+        a
+        >>> AbstractTree('other', [], 1).resize_leaf(2)
+        >>> t._unobserve(printer)
+        """
+        if tree is None:
+            tree = self
+        followed = self
+        while followed is not None:
+            observers = self._observers.get(followed)
+            if observers is not None:
+                if not observers:
+                    # Its observers are no longer used.
+                    del AbstractTree._observers[followed]
+                for observer in list(observers):
+                    getattr(observer, event)(tree)
+            followed = followed._parent_tree
+
+    def _add_subtree(self, subtree, position=None, restore=False):
+        """Add <subtree> to the end of the subtrees of this tree (or at
+        <position> in them), and add its data_size to this tree and every
+        ancestor of this tree.
+
+        If <restore> is True, <subtree> is being put back under this tree,
+        which it was removed from (e.g. to undo its deletion): the paths
+        kept by the folders under it are still right, so they are not
+        cleared, and the time taken does not depend on the size of
+        <subtree>.
+
+        Precondition: <subtree> is not part of a larger tree.
+
+        @type self: AbstractTree
+        @type subtree: AbstractTree
+        @type position: int | None
+        @type restore: bool
+        @rtype: None
+
+        >>> t1 = AbstractTree('a', [], 10)
+        >>> t2 = AbstractTree('b', [t1])
+        >>> t3 = AbstractTree('c', [t2])
+        >>> t2._add_subtree(AbstractTree('d', [], 5))
+        >>> t3.data_size
+        15
+        >>> t2.get_subtrees()[1].get_parent_tree() is t2
+        True
+        """
+        if not restore:
+            subtree._forget_paths()
+        subtree._parent_tree = self
+        if self._subtrees is _NO_SUBTREES:
+            self._subtrees = [subtree]
+        elif position is None:
+            self._subtrees.append(subtree)
+        else:
+            self._subtrees.insert(position, subtree)
+        if self._observers:
+            subtree._notify('tree_added')
+        self._add_to_size(subtree.data_size)
+
+    def _remove_from_parent(self, position=None):
+        """Remove this tree from the subtrees of its parent, and subtract its
+        data_size from every ancestor of this tree. Return the position this
+        tree had in the subtrees of its parent; if it is already known, it
+        can be given as <position> to save searching for it.
+
+        Afterwards, this tree is no longer part of a larger tree.
+
+        Precondition: this tree has a parent tree.
+
+        @type self: AbstractTree
+        @type position: int | None
+        @rtype: int
+
+        >>> t1 = AbstractTree('a', [], 10)
+        >>> t2 = AbstractTree('b', [t1, AbstractTree('d', [], 5)])
+        >>> t3 = AbstractTree('c', [t2])
+        >>> t1._remove_from_parent()
+        0
+        >>> t3.data_size
+        5
+        >>> len(t2.get_subtrees())
+        1
+        >>> t1.get_parent_tree() is None
+        True
+        """
+        parent = self._parent_tree
+        if position is None:
+            position = parent._subtrees.index(self)
+        del parent._subtrees[position]
+        self._parent_tree = None
+        if self._observers:
+            parent._notify('tree_removed', self)
+        parent._add_to_size(-self.data_size)
+        return position
+
 
 class FileSystemTree(AbstractTree):
     """A tree representation of files and folders in a file system.
@@ -631,15 +1213,43 @@ class FileSystemTree(AbstractTree):
 
     The data_size attribute for regular files as simply the size of the file,
     as reported by os.path.getsize.
+
+    A tree can be built lazily, by only reading the folders near the top of
+    the file system. A folder that has not been read yet has no subtrees,
+    but its data_size is already the total size of its contents. It is
+    read when expand() is called, which the treemap does once the folder is
+    big enough on screen. For such a folder, _lazy is a tuple (path,
+    scanner, sizes): the path of the folder, the DirectoryScanner to read it
+    with, and the sizes of the folders inside it (and of the hard-linked
+    files, see DirectoryScanner.folder_sizes) that have not been given to a
+    tree yet, by path.
     """
+    __slots__ = ()
 
-    def __init__(self, path):
+    def __init__(self, path, scanner=None, workers=1, eager_depth=None):
         """Store the file tree structure contained in the given file or folder.
 
+        The file system is read by <scanner>, which reads each folder once
+        and makes at most one stat call for each entry. Pass in a scanner to
+        inspect its stats after the tree is built.
+
+        If <workers> is greater than 1, that many threads read sibling
+        folders at the same time. This is much faster on network and FUSE
+        file systems, where most of the scan is spent waiting on the server.
+        The tree built is the same either way.
+
+        If <eager_depth> is given, the folders more than <eager_depth> levels
+        below <path> are not read into trees until they are expanded; only
+        the total size of their contents is computed. This cannot be
+        combined with <workers>.
+
         Precondition: <path> is a valid path for this computer.
 
         @type self: FileSystemTree
         @type path: str
+        @type scanner: DirectoryScanner | None
+        @type workers: int
+        @type eager_depth: int | None
         @rtype: None
 
         >>> path1 = 'C:/Users/User/Desktop/csc148/assignments/a1'
@@ -651,20 +1261,147 @@ class FileSystemTree(AbstractTree):
         >>> t._subtrees[0]._subtrees[1]._parent_tree is t._subtrees[0]
         True
         """
-        if not os.path.isdir(path):
-            # <path> is pointing at a file(ie .py, .txt)
-            size = os.path.getsize(path)
-            name = os.path.basename(path)
-            AbstractTree.__init__(self, name, [], size)
+        if scanner is None:
+            scanner = DirectoryScanner()
+        if workers > 1 and eager_depth is not None:
+            raise ValueError('eager_depth cannot be used with workers')
+
+        name, path, is_dir, size = scanner.stat_path(path)
+        # <path> is pointing at a file(ie .py, .txt) if <is_dir> is False.
+        AbstractTree.__init__(self, name, [], size)
+        if is_dir:
+            if workers > 1:
+                folders = self._scan_folder_parallel(path, scanner, workers)
+            else:
+                folders = self._scan_folder(path, scanner, eager_depth)
+            _compute_folder_sizes(folders)
+
+    def _scan_folder(self, path, scanner, eager_depth=None):
+        """Fill in this empty tree with the contents of the folder <path>,
+        and return the trees of all the folders read.
+
+        The folders are read with an explicit stack rather than recursion,
+        so a file system of any depth can be scanned. The new trees are
+        built from the information returned by <scanner>, so no entry is
+        read from the file system twice.
+
+        The data_size of the folders is left at 0; the returned list has
+        each folder after its parent folder, ready for
+        _compute_folder_sizes.
+
+        If <eager_depth> is given, the folders more than <eager_depth> levels
+        below <path> are left unread (and are not returned).
+
+        @type self: FileSystemTree
+        @type path: str
+        @type scanner: DirectoryScanner
+        @type eager_depth: int | None
+        @rtype: list[FileSystemTree]
+        """
+        folders = []
+        stack = [(self, path, 0)]
+        while stack:
+            folder, folder_path, depth = stack.pop()
+            folders.append(folder)
+            for name, subitem_path, is_dir, size in \
+                    scanner.list_dir(folder_path):
+                subitem = folder._add_scanned(name, size)
+                if not is_dir:
+                    continue
+                if eager_depth is None or depth < eager_depth:
+                    stack.append((subitem, subitem_path, depth + 1))
+                else:
+                    sizes = scanner.folder_sizes(subitem_path)
+                    subitem.data_size = sizes.pop(subitem_path)
+                    subitem._lazy = (subitem_path, scanner, sizes)
+        return folders
+
+    def _scan_folder_parallel(self, path, scanner, workers):
+        """Fill in this empty tree with the contents of the folder <path>,
+        reading up to <workers> folders at the same time, and return the
+        trees of all the folders read.
+
+        Folders are read by a thread pool, and the trees are put together
+        by this thread as each listing arrives. As for _scan_folder, the
+        data_size of the folders is left at 0.
+
+        @type self: FileSystemTree
+        @type path: str
+        @type scanner: DirectoryScanner
+        @type workers: int
+        @rtype: list[FileSystemTree]
+        """
+        folders = []
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            running = {pool.submit(scanner.list_dir, path): self}
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    folder = running.pop(future)
+                    folders.append(folder)
+                    for name, subitem_path, is_dir, size in future.result():
+                        subitem = folder._add_scanned(name, size)
+                        if is_dir:
+                            listing = pool.submit(scanner.list_dir,
+                                                  subitem_path)
+                            running[listing] = subitem
+        return folders
+
+    def expand(self):
+        """Read the contents of this folder, if they have not been read yet.
+
+        The sub-folders of this folder are not read yet themselves. If the
+        contents changed since the size of this folder was computed, the
+        data_size of this tree and its ancestors is corrected.
+
+        Return True if this tree changed.
+
+        @type self: FileSystemTree
+        @rtype: bool
+        """
+        if self._lazy is None:
+            return False
+        path, scanner, sizes = self._lazy
+        self._lazy = None
+
+        total = 0
+        for name, subitem_path, is_dir, size in scanner.list_dir(path):
+            if not is_dir and subitem_path in sizes:
+                # A hard link counted when this folder was sized, which
+                # the listing above now takes for a duplicate.
+                size = sizes.pop(subitem_path)
+            subitem = self._add_scanned(name, size)
+            if is_dir:
+                if subitem_path not in sizes:
+                    # Created since this folder was sized.
+                    sizes.update(scanner.folder_sizes(subitem_path))
+                subitem.data_size = sizes.pop(subitem_path)
+                subitem._lazy = (subitem_path, scanner, sizes)
+            total += subitem.data_size
+
+        # Even if the size is the same, the treemap now shows the contents.
+        self._add_to_size(total - self.data_size)
+        return True
+
+    def _add_scanned(self, name, size):
+        """Add a new tree for the scanned file or folder <name> to the end
+        of the subtrees of this folder, and return it.
 
+        @type self: FileSystemTree
+        @type name: str
+        @type size: int
+        @rtype: FileSystemTree
+        """
+        subitem = type(self).__new__(type(self))
+        AbstractTree.__init__(subitem, name, [], size)
+        subitem._parent_tree = self
+        if self._subtrees is _NO_SUBTREES:
+            self._subtrees = [subitem]
         else:
-            name = os.path.basename(path)
-            content = []
-            for filename in os.listdir(path):
-                subitem_path = os.path.join(path, filename)
-                subitem = FileSystemTree(subitem_path)
-                content.append(subitem)
-            AbstractTree.__init__(self, name, content)
+            self._subtrees.append(subitem)
+        if self._observers:
+            subitem._notify('tree_added')
+        return subitem
 
     def get_separator(self):
         """Return the string used to separate nodes in the string
@@ -673,18 +1410,205 @@ class FileSystemTree(AbstractTree):
         Used by the treemap visualiser to generate a string displaying
         the items from the root of the tree to the currently selected leaf.
 
+        The path starts at the top FileSystemTree, so a tree that was
+        merged with others under some other kind of tree (see multi_scan)
+        still shows its own path. The paths of the folders are kept, so this
+        is usually a single os.path.join.
+
         @type self: AbstractTree
         @rtype: str
         """
+        return self._build_path(_join_path)
 
-        # This is the case that this object is just an single file or an
-        # empty folder. (ie. it does not have parent tree)
-        if self._parent_tree is None:
-            return self._root
+    def _path_parent(self):
+        """Return the parent of this tree if it is a FileSystemTree, or None.
+
+        @type self: FileSystemTree
+        @rtype: FileSystemTree | None
+        """
+        parent = self._parent_tree
+        return parent if isinstance(parent, FileSystemTree) else None
+
+
+class TreeBatch:
+    """Deletions and resizes queued for a tree, applied together.
+
+    Use it as a context manager: the queued changes are applied when the
+    with block ends, unless it ends with an exception, in which case the
+    tree is left as it was. Then, every ancestor of the changed trees has
+    its data_size updated once, rather than once per change.
+
+    === Public Attributes ===
+    @type changed: list[AbstractTree]
+        After the batch is committed, the trees still in the tree whose
+        data_size changed, deepest first: the parts of the treemap to
+        redraw.
+    @type removed: list[AbstractTree]
+        After the batch is committed, the trees that were deleted.
+
+    === Private Attributes ===
+    @type _tree: AbstractTree
+        The tree the changes are made to.
+    @type _operations: list[(str, AbstractTree, int | None)]
+        The queued changes, in order: ('delete', tree, None) or
+        ('resize', leaf, new_size).
+    """
+    def __init__(self, tree):
+        """Initialize a new TreeBatch of changes to <tree>.
+
+        @type self: TreeBatch
+        @type tree: AbstractTree
+        @rtype: None
+        """
+        self._tree = tree
+        self._operations = []
+        self.changed = []
+        self.removed = []
+
+    def __enter__(self):
+        """Return this batch.
+
+        @type self: TreeBatch
+        @rtype: TreeBatch
+        """
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Commit the queued changes, unless an exception was raised.
 
+        @type self: TreeBatch
+        @rtype: bool
+        """
+        if exc_type is None:
+            self.commit()
         else:
-            parent_path = self._parent_tree.get_separator()
-            return os.path.join(parent_path, self._root)
+            self._operations = []
+        return False
+
+    def delete(self, tree):
+        """Queue the deletion of the leaf or folder <tree>, like
+        complete_leaf_deletion. Trees that are not in the tree when the
+        batch is committed are left alone.
+
+        @type self: TreeBatch
+        @type tree: AbstractTree
+        @rtype: None
+        """
+        self._operations.append(('delete', tree, None))
+
+    def resize(self, leaf, new_size):
+        """Queue setting the data_size of <leaf> to <new_size>, like
+        resize_leaf.
+
+        Pre-condition: <leaf> is a leaf. (ie.it has no subtree)
+
+        @type self: TreeBatch
+        @type leaf: AbstractTree
+        @type new_size: int
+        @rtype: None
+        """
+        if new_size < 0:
+            raise ValueError('size cannot be negative: {}'.format(new_size))
+        self._operations.append(('resize', leaf, new_size))
+
+    def increase(self, leaf):
+        """Queue increase_size for <leaf>.
+
+        The size is worked out now, from the data_size <leaf> has before
+        the batch is committed.
+
+        @type self: TreeBatch
+        @type leaf: AbstractTree
+        @rtype: None
+        """
+        self.resize(leaf, leaf.data_size + math.ceil(leaf.data_size * 0.01))
+
+    def decrease(self, leaf):
+        """Queue decrease_size for <leaf>, like increase.
+
+        @type self: TreeBatch
+        @type leaf: AbstractTree
+        @rtype: None
+        """
+        decrease = math.ceil(leaf.data_size * 0.01)
+        self.resize(leaf, max(leaf.data_size - decrease, 1))
+
+    def commit(self):
+        """Apply the queued changes, and fill in <changed> and <removed>.
+
+        @type self: TreeBatch
+        @rtype: None
+        """
+        operations = self._operations
+        self._operations = []
+        self.changed, self.removed = self._tree._apply_batch(operations)
+
+
+class _LeafIndex:
+    """The treemap of a tree in some rectangle, with the leaf drawn in each
+    rectangle of the treemap.
+
+    === Public Attributes ===
+    @type rect: (int, int, int, int)
+        The rectangle the treemap fills.
+    @type colour_mode: str
+        The colour mode the treemap is coloured in.
+    @type treemap: list[((int, int, int, int), (int, int, int))]
+        The treemap, as returned by generate_treemap.
+    @type leaves: list[AbstractTree]
+        The leaf drawn by each element of <treemap>.
+
+    === Private Attributes ===
+    @type _positions: dict[AbstractTree, int] | None
+        The position of each leaf in <leaves>, once needed.
+    @type _by_rect: dict[(int, int, int, int), int] | None
+        The position of the first leaf drawn in each rectangle, once needed.
+    """
+    __slots__ = ('rect', 'colour_mode', 'treemap', 'leaves', '_positions',
+                 '_by_rect')
+
+    def __init__(self, rect, colour_mode, treemap, leaves):
+        """Initialize a new _LeafIndex.
+
+        @type self: _LeafIndex
+        @type rect: (int, int, int, int)
+        @type colour_mode: str
+        @type treemap: list[((int, int, int, int), (int, int, int))]
+        @type leaves: list[AbstractTree]
+        @rtype: None
+        """
+        self.rect = rect
+        self.colour_mode = colour_mode
+        self.treemap = treemap
+        self.leaves = leaves
+        self._positions = None
+        self._by_rect = None
+
+    def leaf_at(self, tree_rect):
+        """Return the leaf drawn in the rectangle <tree_rect>, or None.
+
+        @type self: _LeafIndex
+        @type tree_rect: (int, int, int, int)
+        @rtype: AbstractTree | None
+        """
+        if self._by_rect is None:
+            # Reversed, so that the first of several equal rectangles wins.
+            self._by_rect = {item[0]: i for i, item
+                             in reversed(list(enumerate(self.treemap)))}
+        i = self._by_rect.get(tree_rect)
+        return None if i is None else self.leaves[i]
+
+    def rect_of(self, leaf):
+        """Return the element of the treemap for <leaf>, or None.
+
+        @type self: _LeafIndex
+        @type leaf: AbstractTree
+        @rtype: ((int, int, int, int), (int, int, int)) | None
+        """
+        if self._positions is None:
+            self._positions = {tree: i for i, tree in enumerate(self.leaves)}
+        i = self._positions.get(leaf)
+        return None if i is None else self.treemap[i]
 
 
 ##############################################################################
@@ -692,6 +1616,62 @@ class FileSystemTree(AbstractTree):
 ##############################################################################
 
 
+def colour_for(name, mode='name'):
+    """Return the colour for a tree whose root value is <name>.
+
+    The colour only depends on <name>, so it is the same on every run. In
+    the 'extension' mode, it only depends on the extension of <name>, and
+    the usual kinds of files have a colour from EXTENSION_COLOURS.
+
+    @type name: object
+    @type mode: str
+    @rtype: (int, int, int)
+
+    >>> colour_for('a.py') == colour_for('a.py')
+    True
+    >>> colour_for('a.py', 'extension') == colour_for('b.PY', 'extension')
+    True
+    """
+    name = str(name)
+    if mode == 'extension':
+        name = os.path.splitext(name)[1].lower()
+        colour = EXTENSION_COLOURS.get(name)
+        if colour is not None:
+            return colour
+    elif mode != 'name':
+        raise ValueError('unknown colour mode: {!r}'.format(mode))
+    colour = zlib.crc32(name.encode('utf-8', 'surrogateescape'))
+    return (colour >> 16) & 0xFF, (colour >> 8) & 0xFF, colour & 0xFF
+
+
+def _join_path(parts):
+    """Return the file system path made of <parts>.
+
+    @type parts: list[str]
+    @rtype: str
+    """
+    return os.path.join(*parts)
+
+
+def _compute_folder_sizes(folders):
+    """Set the data_size of each tree in <folders> to the sum of the
+    data_size of its subtrees.
+
+    Precondition: every folder in <folders> comes after its parent folder,
+    and the data_size of every file has already been set.
+
+    @type folders: list[AbstractTree]
+    @rtype: None
+    """
+    # Going backwards computes every sub-folder before the folder that
+    # contains it.
+    for folder in reversed(folders):
+        size = 0
+        for subtree in folder._subtrees:
+            size += subtree.data_size
+        folder.data_size = size
+
+
 def combine(subtree_map, tree_map):
     """
     Mutate the <tree_map>, put all tuples in <subtree_map> into <tree_map>.
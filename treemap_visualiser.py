@@ -6,8 +6,24 @@ concrete subclass, of course), rendering it to the user using pygame,
 and detecting user events like mouse clicks and key presses and responding
 to them.
 """
+import os
+import time
+
 import pygame
-from tree_data import FileSystemTree
+from tree_data import AbstractTree, FileSystemTree, COLOUR_MODES
+from compact_tree import CompactTree
+from diff import diff_trees
+from group_views import FileTable, GROUP_VIEWS
+from journal import TreeJournal
+from listings import load_listing
+from multi_scan import scan_roots
+from progressive_scan import ProgressiveScan
+from scan_cache import CachingScanner
+from scanner import DirectoryScanner
+from search import SearchIndex
+from snapshot import open_snapshot
+from topk import TopIndex
+from watcher import TreeWatcher
 from population import PopulationTree
 
 
@@ -21,13 +37,45 @@ TREEMAP_HEIGHT = HEIGHT - FONT_HEIGHT  # The height of the treemap display.
 # Font to use for the treemap program.
 FONT_FAMILY = 'Consolas'
 
-
-def run_visualisation(tree):
+# While a progressive scan is running, the display is refreshed every
+# FRAME_INTERVAL seconds, and at most SCAN_BUDGET seconds of each frame are
+# spent adding newly scanned folders to the tree.
+FRAME_INTERVAL = 0.1
+SCAN_BUDGET = 0.05
+# The outline drawn around folders that are not completely scanned yet.
+UNFINISHED_COLOUR = (128, 128, 128)
+# The number of largest files or folders highlighted by the F and G keys,
+# and the outline drawn around them.
+TOP_COUNT = 10
+HIGHLIGHT_COLOUR = (255, 255, 255)
+
+
+def run_visualisation(tree, watcher=None, scan=None, colour_mode='name',
+                      table=None):
     """Display an interactive graphical display of the given tree's treemap.
 
+    If <watcher> is given, the display is updated whenever it changes the
+    tree. If <scan> is given, <tree> is still being built by it, and the
+    display is refreshed as the scan goes. If <table> is given, <tree> is
+    one of its views, and the V key switches to the next one.
+
+    <colour_mode> is one of tree_data.COLOUR_MODES: 'name' gives each file
+    a colour of its own (the same on every run), and 'extension' gives all
+    the files of a kind the same colour.
+
     @type tree: AbstractTree
+    @type watcher: TreeWatcher | None
+    @type scan: ProgressiveScan | None
+    @type colour_mode: str
+    @type table: FileTable | None
     @rtype: None
     """
+    if colour_mode not in COLOUR_MODES:
+        raise ValueError('unknown colour mode: {!r}'.format(colour_mode))
+    # The treemaps cached by the trees are keyed on the mode, so a tree
+    # drawn before in another mode is coloured again.
+    AbstractTree.colour_mode = colour_mode
+
     # Setup pygame
     pygame.init()
     screen = pygame.display.set_mode((WIDTH, HEIGHT))
@@ -36,10 +84,10 @@ def run_visualisation(tree):
     render_display(screen, tree, '')
 
     # Start an event loop to respond to events.
-    event_loop(screen, tree)
+    event_loop(screen, tree, watcher, scan, table)
 
 
-def render_display(screen, tree, text):
+def render_display(screen, tree, text, unfinished=None, highlighted=None):
     """Render a treemap and text display to the given screen.
 
     Use the constants TREEMAP_HEIGHT and FONT_HEIGHT to divide the
@@ -49,6 +97,10 @@ def render_display(screen, tree, text):
     @type tree: AbstractTree
     @type text: str
         The text to render.
+    @type unfinished: set[AbstractTree] | None
+        The folders that are still being scanned, which are outlined.
+    @type highlighted: list[AbstractTree] | None
+        The files or folders to outline, e.g. the largest ones.
     @rtype: None
     """
     # First, clear the screen
@@ -62,6 +114,16 @@ def render_display(screen, tree, text):
         # tree_rect[1] has format (int, int, int) which refers to colour.
         pygame.draw.rect(screen, tree_rect[1], tree_rect[0])
 
+    if unfinished:
+        for folder_rect in tree.rects_of((0, 0, WIDTH, TREEMAP_HEIGHT),
+                                         unfinished):
+            pygame.draw.rect(screen, UNFINISHED_COLOUR, folder_rect, 1)
+
+    if highlighted:
+        for tree_rect in tree.rects_of((0, 0, WIDTH, TREEMAP_HEIGHT),
+                                       set(highlighted)):
+            pygame.draw.rect(screen, HIGHLIGHT_COLOUR, tree_rect, 2)
+
     _render_text(screen, text)
 
     # This must be called *after* all other pygame functions have run.
@@ -84,7 +146,7 @@ def _render_text(screen, text):
     screen.blit(text_surface, text_pos)
 
 
-def event_loop(screen, tree):
+def event_loop(screen, tree, watcher=None, scan=None, table=None):
     """Respond to events (mouse clicks, key presses) and update the display.
 
     Note that the event loop is an *infinite loop*: it continually waits for
@@ -92,8 +154,36 @@ def event_loop(screen, tree):
     of the visualisation or the tree itself, updating the display if necessary.
     This loop ends when the user closes the window.
 
+    If <watcher> is given, it is polled on every pass of the loop, and the
+    display is updated whenever it changes the tree.
+
+    If <scan> is given, it is building <tree>: every FRAME_INTERVAL seconds,
+    the folders it has read are added to the tree and the display is
+    refreshed, until the scan is done.
+
+    Deletions and resizes are recorded in a TreeJournal: Ctrl+Z undoes the
+    last one, and Ctrl+Y redoes it. The journal is cleared whenever the
+    watcher changes the tree.
+
+    The F key outlines the TOP_COUNT largest files, and the G key the
+    largest folders: in the folder of the selected leaf, or in the whole
+    tree if no leaf is selected. They are found with a TopIndex, built the
+    first time one of the keys is pressed.
+
+    The / key starts a search: the keys typed next make up a glob pattern
+    (e.g. *.log or cache*), Enter outlines the files and folders whose name
+    matches it, and Escape cancels the search. They are found with a
+    SearchIndex, built the first time a search is made.
+
+    If <table> is given, <tree> is one of its views, and the V key shows
+    the next view of GROUP_VIEWS instead: the selection, the recorded
+    changes and the indexes start again for the new view.
+
     @type screen: pygame.Surface
     @type tree: AbstractTree
+    @type watcher: TreeWatcher | None
+    @type scan: ProgressiveScan | None
+    @type table: FileTable | None
     @rtype: None
     """
     # We strongly recommend using a variable to keep track of the currently-
@@ -105,21 +195,106 @@ def event_loop(screen, tree):
     curr_rect = (0, 0, 0, 0)
     # type of <curr_rect> is (int, int, int, int).
     text = ''
+    next_frame = 0
+    journal = TreeJournal(tree)
+    top_index = None
+    search_index = None
+    # The pattern being typed after the / key, or None if not searching.
+    pattern = None
+    # The view of <table> shown, if any.
+    view = None if table is None else table.kind_of(tree)
 
     while True:
+        if scan is not None and time.monotonic() >= next_frame:
+            next_frame = time.monotonic() + FRAME_INTERVAL
+            if scan.update(SCAN_BUDGET):
+                if scan.is_done():
+                    scan = None
+                    render_display(screen, tree, text)
+                else:
+                    render_display(screen, tree, text, scan.unfinished())
+
+        if watcher is not None and watcher.poll():
+            # The file system changed; the selected file may be gone, and
+            # the recorded changes may no longer apply.
+            journal.clear()
+            if selected_leaf is not None and not tree._holds(selected_leaf):
+                selected_leaf = None
+                text = ''
+            elif selected_leaf is not None:
+                text = generate_text(selected_leaf)
+            render_display(screen, tree, text)
+
         treemap = tree.generate_treemap(rect0)  # Update the treemap.
         # Wait for an event
         event = pygame.event.poll()
         if event.type == pygame.QUIT:
             return
 
+        if pattern is not None and event.type in (pygame.KEYDOWN,
+                                                  pygame.KEYUP):
+            # Every key goes to the search pattern until it is done.
+            if event.type == pygame.KEYUP:
+                continue
+            if event.key == pygame.K_RETURN:
+                if search_index is None:
+                    search_index = SearchIndex(tree)
+                show_matches(screen, tree, search_index, pattern)
+                pattern = None
+                continue
+            if event.key == pygame.K_ESCAPE:
+                pattern = None
+                render_display(screen, tree, text)
+                continue
+            if event.key == pygame.K_BACKSPACE:
+                pattern = pattern[:-1]
+            elif event.unicode and event.unicode.isprintable():
+                pattern += event.unicode
+            render_display(screen, tree, '/' + pattern)
+            continue
+
+        if (event.type == pygame.KEYDOWN) and (event.key == pygame.K_SLASH):
+            pattern = ''
+            render_display(screen, tree, '/')
+            continue
+
+        if (event.type == pygame.KEYUP) and (event.key == pygame.K_v) and \
+                (table is not None):
+            # Show the next view of the same scan.
+            for index in (top_index, search_index):
+                if index is not None:
+                    index.close()
+            if view is None:
+                view = GROUP_VIEWS[0]
+            else:
+                view = GROUP_VIEWS[(GROUP_VIEWS.index(view) + 1) %
+                                   len(GROUP_VIEWS)]
+            tree = table.view(view)
+            selected_leaf = None
+            journal = TreeJournal(tree)
+            top_index = None
+            search_index = None
+            text = 'files by ' + view
+            render_display(screen, tree, text)
+            continue
+
         if (event.type == pygame.MOUSEBUTTONUP) and (event.button == 1):
             # This is the left click mouse event.
             x, y = event.pos
+            if expand_at(tree, rect0, treemap, x, y):
+                # An unread folder was clicked: show its contents instead.
+                render_display(screen, tree, text)
+                continue
             if selected_leaf is not None:
                 # Convert the <selected_leaf> to its rectangle representation.
                 # curr_rect has format: (x, y, width, height).
-                curr_rect = tree.convert_to_rect(rect0, selected_leaf)[0]
+                curr_rect = selected_rect(tree, rect0, selected_leaf)
+                if curr_rect is None:
+                    # Still in the tree, but no longer drawn: e.g. a file
+                    # truncated to 0 bytes, or a folder that was expanded.
+                    selected_leaf = None
+                    text = ''
+                    curr_rect = (0, 0, 0, 0)
 
             for t_rect in treemap:
                 # <t_rect> is the rectangle representation of leaf in <tree>.
@@ -167,7 +342,13 @@ def event_loop(screen, tree):
             if selected_leaf is not None:
                 # Convert the <selected_leaf> to its rectangle representation.
                 # curr_rect has format: (x, y, width, height).
-                curr_rect = tree.convert_to_rect(rect0, selected_leaf)[0]
+                curr_rect = selected_rect(tree, rect0, selected_leaf)
+                if curr_rect is None:
+                    # Still in the tree, but no longer drawn: e.g. a file
+                    # truncated to 0 bytes, or a folder that was expanded.
+                    selected_leaf = None
+                    text = ''
+                    curr_rect = (0, 0, 0, 0)
 
             for t_rect in treemap:
                 # <t_rect> is the rectangle representation of leaf in <tree>.
@@ -181,7 +362,7 @@ def event_loop(screen, tree):
 
                     # <tree.get_leaf(rect0, t_rect[0])> is the leaf
                     # we want to delele.
-                    tree.complete_leaf_deletion(tree.get_leaf(rect0, t_rect[0]))
+                    journal.delete(tree.get_leaf(rect0, t_rect[0]))
                     # We mutate the tree here.
                     render_display(screen, tree, text)
 
@@ -190,25 +371,251 @@ def event_loop(screen, tree):
                     # <selected_leaf> to None and no text is shown.
                     selected_leaf = None
                     text = ''
-                    tree.complete_leaf_deletion(tree.get_leaf(rect0, t_rect[0]))
+                    journal.delete(tree.get_leaf(rect0, t_rect[0]))
                     render_display(screen, tree, text)
 
-        if (event.type == pygame.KEYUP) and (selected_leaf is not None):
+        if (event.type == pygame.KEYUP) and \
+                (event.key in (pygame.K_z, pygame.K_y)) and \
+                (event.mod & pygame.KMOD_CTRL):
+            # Undo (Ctrl+Z) or redo (Ctrl+Y) the last deletion or resize.
+            if event.key == pygame.K_z:
+                changed = journal.undo()
+            else:
+                changed = journal.redo()
+            if changed is not None:
+                if selected_leaf is not None and \
+                        not tree._holds(selected_leaf):
+                    selected_leaf = None
+                    text = ''
+                elif selected_leaf is not None:
+                    text = generate_text(selected_leaf)
+                render_display(screen, tree, text)
+
+        elif (event.type == pygame.KEYUP) and \
+                (event.key in (pygame.K_f, pygame.K_g)):
+            if top_index is None:
+                top_index = TopIndex(tree)
+            show_largest(screen, tree, top_index, selected_leaf,
+                         event.key == pygame.K_g)
+
+        elif (event.type == pygame.KEYUP) and (selected_leaf is not None):
             # Perform the relative operation when the user releases a 'Up arrow'
             # or 'Down arrow' key.
-            key_up(event, screen, tree, selected_leaf)
+            key_up(event, screen, tree, selected_leaf, journal)
 
 
-def run_treemap_file_system(path):
+def run_treemap_file_system(path, workers=1, cache_path=None, watch=False,
+                            progressive=False, size_mode='apparent',
+                            eager_depth=None, rules=None, colour_mode='name'):
     """Run a treemap visualisation for the given path's file structure.
 
+    If <workers> is greater than 1, the file system is scanned by that many
+    threads, which is faster on network file systems.
+
+    If <cache_path> is given, the scan is saved to that file, and the next
+    run only reads the folders that changed since then. A summary of the
+    cache is printed after the scan.
+
+    If <watch> is True, the treemap is kept up to date with the changes made
+    to the folder while it is displayed (Linux only).
+
+    If <progressive> is True, the treemap is displayed straight away and
+    filled in while the folder is scanned, one thread reading the file
+    system. This cannot be combined with <watch>; with <cache_path>, the
+    cache is saved when the window is closed, if the scan was finished. The
+    folders that could not be read are printed then too.
+
+    <size_mode> is one of scanner.SIZE_MODES. Use 'allocated' to show the
+    disk space used by each file, counting hard-linked files only once.
+
+    If <eager_depth> is given, only the folders up to that many levels below
+    <path> are read into the tree at first; deeper folders are read when
+    they become big enough on screen, or when they are clicked. This cannot
+    be combined with <workers>, <watch> or <progressive>.
+
+    If <rules> is given, the files and folders it excludes are left out of
+    the scan (and never read from the file system). A summary of the work
+    saved is printed after the scan.
+
+    <colour_mode> is used like in run_visualisation.
+
     Precondition: <path> is a valid path to a file or folder.
 
     @type path: str
+    @type workers: int
+    @type cache_path: str | None
+    @type watch: bool
+    @type progressive: bool
+    @type size_mode: str
+    @type eager_depth: int | None
+    @type rules: ScanRules | None
+    @type colour_mode: str
+    @rtype: None
+    """
+    if eager_depth is not None and (watch or progressive):
+        raise ValueError('eager_depth needs a tree that is scanned up front')
+    if cache_path is None:
+        scanner = DirectoryScanner(size_mode, rules)
+    else:
+        scanner = CachingScanner(cache_path, size_mode, rules)
+
+    if progressive:
+        if watch:
+            raise ValueError('watch needs a complete scan to start from')
+        scan = ProgressiveScan(path, scanner)
+        run_visualisation(scan.tree, scan=scan, colour_mode=colour_mode)
+        for folder_path, error in scan.skipped:
+            print('skipped {}: {}'.format(folder_path, error))
+        if cache_path is not None and scan.is_done():
+            scanner.save()
+            print(scanner.report())
+        return
+
+    file_tree = FileSystemTree(path, scanner, workers, eager_depth)
+    if rules is not None:
+        print('scan: {}'.format(scanner.stats))
+    if cache_path is not None:
+        scanner.save()
+        print(scanner.report())
+
+    if watch:
+        watcher = TreeWatcher(file_tree, path, scanner=scanner)
+        try:
+            run_visualisation(file_tree, watcher, colour_mode=colour_mode)
+        finally:
+            watcher.close()
+    else:
+        run_visualisation(file_tree, colour_mode=colour_mode)
+
+
+def run_treemap_multi_root(paths, processes=None, size_mode='apparent',
+                           rules=None, colour_mode='name'):
+    """Run a treemap visualisation of several files or folders at once, such
+    as the mount points of a computer.
+
+    Each path is scanned in its own process, at most <processes> at a time
+    (by default, one per CPU). <size_mode>, <rules> and <colour_mode> are
+    used like in run_treemap_file_system. A summary of the scans is printed.
+
+    Precondition: every path in <paths> is a valid path to a file or folder.
+
+    @type paths: list[str]
+    @type processes: int | None
+    @type size_mode: str
+    @type rules: ScanRules | None
+    @type colour_mode: str
+    @rtype: None
+    """
+    tree, stats = scan_roots(paths, processes, size_mode, rules)
+    print('scan: {}'.format(stats))
+    run_visualisation(tree, colour_mode=colour_mode)
+
+
+def run_treemap_listing(path, listing_format=None, size_mode='apparent',
+                        colour_mode='name'):
+    """Run a treemap visualisation of a file system listing saved in the
+    file <path>, without reading the file system itself.
+
+    <listing_format> is one of listings.LISTING_FORMATS ('find' for the
+    output of find -printf '%s %p\\n', 'ncdu' for an ncdu JSON export, or
+    'csv'); if it is None, it is guessed from the extension of <path>.
+    <size_mode> is used like in run_treemap_file_system, for ncdu exports,
+    and so is <colour_mode>.
+
+    @type path: str
+    @type listing_format: str | None
+    @type size_mode: str
+    @type colour_mode: str
     @rtype: None
     """
-    file_tree = FileSystemTree(path)
-    run_visualisation(file_tree)
+    run_visualisation(load_listing(path, listing_format, size_mode),
+                      colour_mode=colour_mode)
+
+
+def run_treemap_compact(path, size_mode='apparent', rules=None,
+                        colour_mode='name'):
+    """Run a treemap visualisation for the given path's file structure,
+    stored in a CompactTree rather than one FileSystemTree per file, which
+    uses much less memory on large file systems.
+
+    <size_mode>, <rules> and <colour_mode> are used like in
+    run_treemap_file_system.
+
+    Precondition: <path> is a valid path to a file or folder.
+
+    @type path: str
+    @type size_mode: str
+    @type rules: ScanRules | None
+    @type colour_mode: str
+    @rtype: None
+    """
+    tree = CompactTree.from_path(path, DirectoryScanner(size_mode, rules))
+    run_visualisation(tree.root(), colour_mode=colour_mode)
+
+
+def run_treemap_snapshot(path, colour_mode='name'):
+    """Run a treemap visualisation for the tree saved in the snapshot file
+    <path> (see snapshot.save_snapshot), which is mapped into memory rather
+    than loaded.
+
+    Leaves can still be deleted and resized, but the snapshot file is not
+    changed.
+
+    @type path: str
+    @type colour_mode: str
+    @rtype: None
+    """
+    with open_snapshot(path, writable=True) as tree:
+        run_visualisation(tree.root(), colour_mode=colour_mode)
+
+
+def run_treemap_diff(old_path, new_path, mode='grown', colour_mode='name'):
+    """Run a treemap visualisation of the files that grew (or, if <mode> is
+    'shrunk', that shrank) between two scans of the same file system.
+
+    Each of <old_path> and <new_path> is either a folder, which is scanned,
+    or a snapshot file saved earlier (see snapshot.save_snapshot).
+
+    @type old_path: str
+    @type new_path: str
+    @type mode: str
+    @type colour_mode: str
+    @rtype: None
+    """
+    trees = []
+    snapshots = []
+    for path in (old_path, new_path):
+        if os.path.isdir(path):
+            trees.append(FileSystemTree(path))
+        else:
+            snapshots.append(open_snapshot(path))
+            trees.append(snapshots[-1].root())
+    diff = diff_trees(trees[0], trees[1], mode)
+    for snapshot in snapshots:
+        snapshot.close()
+    run_visualisation(diff, colour_mode=colour_mode)
+
+
+def run_treemap_groups(path, view='extension', size_mode='apparent',
+                       rules=None, colour_mode='name'):
+    """Run a treemap visualisation of the files in <path> grouped by
+    <view>, one of group_views.GROUP_VIEWS. The V key switches to the next
+    view, without scanning <path> again.
+
+    <size_mode>, <rules> and <colour_mode> are used like in
+    run_treemap_file_system.
+
+    Precondition: <path> is a valid path to a file or folder.
+
+    @type path: str
+    @type view: str
+    @type size_mode: str
+    @type rules: ScanRules | None
+    @type colour_mode: str
+    @rtype: None
+    """
+    table = FileTable.from_path(path, DirectoryScanner(size_mode, rules))
+    run_visualisation(table.view(view), colour_mode=colour_mode, table=table)
 
 
 def run_treemap_population():
@@ -238,6 +645,40 @@ def locate_rect(x, y, t_rect):
     return marker1 and marker2
 
 
+def expand_at(tree, rect0, treemap, x, y):
+    """Expand the unread folder drawn at the point (<x>, <y>) of <treemap>,
+    the treemap of <tree> in <rect0>.
+
+    Return True if a folder was expanded.
+
+    @type tree: AbstractTree
+    @type rect0: (int, int, int, int)
+    @type treemap: list[((int, int, int, int), (int, int, int))]
+    @type x: int
+    @type y: int
+    @rtype: bool
+    """
+    for t_rect in treemap:
+        if locate_rect(x, y, t_rect):
+            return tree.get_leaf(rect0, t_rect[0]).expand()
+    return False
+
+
+def selected_rect(tree, rect0, selected_leaf):
+    """Return the rectangle of <selected_leaf> in the treemap of <tree> in
+    <rect0>, or None if it is not drawn in it.
+
+    @type tree: AbstractTree
+    @type rect0: (int, int, int, int)
+    @type selected_leaf: AbstractTree
+    @rtype: (int, int, int, int) | None
+    """
+    element = tree.convert_to_rect(rect0, selected_leaf)
+    if element is None:
+        return None
+    return element[0]
+
+
 def generate_text(selected_leaf):
     """Return the text which should be displayed along the bottom of the window.
     Showing the name and data_size of the currently selected rectangle.
@@ -249,22 +690,64 @@ def generate_text(selected_leaf):
     return selected_leaf.get_separator() + ' ' + data_size
 
 
-def key_up(event, screen, tree, selected_leaf):
+def show_largest(screen, tree, top_index, selected_leaf, folders):
+    """Outline the TOP_COUNT largest files (or, if <folders> is True,
+    folders) in the folder of <selected_leaf>, or in <tree> if no leaf is
+    selected, and say which ones they are in the text display.
+
+    @type screen: pygame.Surface
+    @type tree: AbstractTree
+    @type top_index: TopIndex
+    @type selected_leaf: AbstractTree | None
+    @type folders: bool
+    @rtype: None
+    """
+    under = tree
+    if selected_leaf is not None and \
+            selected_leaf.get_parent_tree() is not None:
+        under = selected_leaf.get_parent_tree()
+    if folders:
+        largest = top_index.largest_folders(TOP_COUNT, under)
+    else:
+        largest = top_index.largest_files(TOP_COUNT, under)
+    text = '{} largest {} in {}'.format(len(largest),
+                                        'folders' if folders else 'files',
+                                        under.get_separator())
+    render_display(screen, tree, text, highlighted=largest)
+
+
+def show_matches(screen, tree, search_index, pattern):
+    """Outline the files and folders of <tree> whose name matches the glob
+    <pattern>, and say how many there are in the text display.
+
+    @type screen: pygame.Surface
+    @type tree: AbstractTree
+    @type search_index: SearchIndex
+    @type pattern: str
+    @rtype: None
+    """
+    matches = search_index.search(pattern)
+    text = '{} matches for {}'.format(len(matches), pattern)
+    render_display(screen, tree, text, highlighted=matches)
+
+
+def key_up(event, screen, tree, selected_leaf, journal):
     """Perform the relative operation when the user releases a 'Up arrow'
-    or 'Down arrow' key.
+    or 'Down arrow' key. The change is recorded in <journal>.
 
     @type event: pygame.event.EventType
     @type screen: pygame.Surface
     @type tree: AbstractTree
     @type selected_leaf: AbstractTree
+    @type journal: TreeJournal
     """
     if event.key == pygame.K_UP:
-        selected_leaf.increase_size()
+        journal.increase(selected_leaf)
         text = generate_text(selected_leaf)
         render_display(screen, tree, text)
 
     elif event.key == pygame.K_DOWN:
-        selected_leaf.decrease_size()
+        journal.decrease(selected_leaf)
         text = generate_text(selected_leaf)
         render_display(screen, tree, text)
 
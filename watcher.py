@@ -0,0 +1,435 @@
+"""
+=== Module Description ===
+This module keeps a FileSystemTree up to date with the file system it was
+built from, using the Linux inotify API.
+
+A TreeWatcher asks the kernel to report every change made inside each
+folder of the tree. Files and folders that are created, deleted, modified or
+renamed are then applied to the tree as node insertions, removals and size
+changes, without scanning the file system again.
+
+Events arrive in bursts (a build writes thousands of files), so they are
+not applied one at a time: the watcher only records which entries changed,
+and applies all of them at most once every <min_interval> seconds. The
+visualiser can then re-render at most that often.
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import stat
+import struct
+import sys
+import time
+
+from scanner import DirectoryScanner
+from tree_data import FileSystemTree
+
+
+# Constants from <sys/inotify.h>.
+IN_MODIFY = 0x00000002
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_ONLYDIR = 0x01000000
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+# The events a folder is watched for.
+WATCH_MASK = IN_MODIFY | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | \
+             IN_DELETE | IN_ONLYDIR
+
+# struct inotify_event {int wd; uint32_t mask, cookie, len; char name[];}
+_EVENT = struct.Struct('iIII')
+
+
+class TreeWatcher:
+    """Apply the changes made to a folder on disk to its FileSystemTree.
+
+    Call poll() regularly (e.g. from the visualiser's event loop); it
+    returns True whenever the tree was changed.
+
+    === Public Attributes ===
+    @type tree: FileSystemTree
+        The tree being kept up to date.
+    @type min_interval: float
+        The minimum number of seconds between two updates of the tree.
+
+    === Private Attributes ===
+    @type _path: str
+        The path of the folder <tree> was built from.
+    @type _scanner: DirectoryScanner
+        Used to scan folders that are created or moved into the tree.
+    @type _fd: int
+        The inotify file descriptor.
+    @type _folders: dict[int, FileSystemTree]
+        The folder tree for each watch descriptor.
+    @type _watches: dict[FileSystemTree, int]
+        The watch descriptor of each watched folder tree.
+    @type _children: dict[FileSystemTree, dict[str, FileSystemTree]]
+        The subtrees of some folders by name, built when first needed.
+    @type _dirty: dict[int, set[str]]
+        The names that changed in each watched folder since the last update.
+    @type _moves: dict[int, (int, str, int, str)]
+        Rename events seen since the last update, by cookie: the watch
+        descriptor and name moved from, and those moved to (-1 and '' until
+        the second half of the rename arrives).
+    @type _overflowed: bool
+        True if the kernel dropped events since the last update.
+    @type _last_update: float
+        The time of the last update.
+    """
+    def __init__(self, tree, path, min_interval=0.25, scanner=None):
+        """Initialize a new TreeWatcher for <tree>, which was built from the
+        folder <path>, and start watching every folder in it.
+
+        Precondition: <tree> is a FileSystemTree for the folder <path>.
+
+        @type self: TreeWatcher
+        @type tree: FileSystemTree
+        @type path: str
+        @type min_interval: float
+        @type scanner: DirectoryScanner | None
+        @rtype: None
+        """
+        if not sys.platform.startswith('linux') or _libc is None:
+            raise OSError('TreeWatcher needs the Linux inotify API')
+        if scanner is None:
+            scanner = DirectoryScanner()
+
+        self.tree = tree
+        self.min_interval = min_interval
+        self._path = path
+        self._scanner = scanner
+        self._folders = {}
+        self._watches = {}
+        self._children = {}
+        self._dirty = {}
+        self._moves = {}
+        self._overflowed = False
+        self._last_update = 0.0
+
+        self._fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            _raise_errno()
+        self._watch_tree(tree, path)
+
+    def close(self):
+        """Stop watching the file system.
+
+        @type self: TreeWatcher
+        @rtype: None
+        """
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def poll(self):
+        """Read the events reported by the kernel, and update the tree if
+        anything changed and at least <min_interval> seconds have passed
+        since the last update.
+
+        Return True if the tree was changed.
+
+        @type self: TreeWatcher
+        @rtype: bool
+        """
+        self._read_events()
+        if not (self._dirty or self._moves or self._overflowed):
+            return False
+        now = time.monotonic()
+        if now - self._last_update < self.min_interval:
+            return False
+        self._last_update = now
+        self._apply()
+        return True
+
+    def _read_events(self):
+        """Read every event waiting on the inotify file descriptor, and
+        record which entries they changed.
+
+        @type self: TreeWatcher
+        @rtype: None
+        """
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                self._record(wd, mask, cookie, name)
+
+    def _record(self, wd, mask, cookie, name):
+        """Record the event <mask> for the entry <name> of the folder
+        watched by <wd>.
+
+        @type self: TreeWatcher
+        @type wd: int
+        @type mask: int
+        @type cookie: int
+        @type name: str
+        @rtype: None
+        """
+        if mask & IN_Q_OVERFLOW:
+            self._overflowed = True
+        elif mask & IN_IGNORED:
+            # The folder was deleted (or moved out of the file system).
+            folder = self._folders.pop(wd, None)
+            if folder is not None:
+                del self._watches[folder]
+                self._children.pop(folder, None)
+        elif mask & IN_MOVED_FROM:
+            self._moves[cookie] = (wd, name, -1, '')
+        elif mask & IN_MOVED_TO and cookie in self._moves:
+            from_wd, from_name, _, _ = self._moves[cookie]
+            self._moves[cookie] = (from_wd, from_name, wd, name)
+        elif name:
+            self._dirty.setdefault(wd, set()).add(name)
+
+    def _apply(self):
+        """Update the tree with every change recorded since the last update.
+
+        Renames whose both halves were seen move the existing subtree.
+        Every other changed entry is compared with the file system, and
+        inserted, removed or resized to match it.
+
+        @type self: TreeWatcher
+        @rtype: None
+        """
+        moves = self._moves
+        dirty = self._dirty
+        self._moves = {}
+        self._dirty = {}
+
+        for from_wd, from_name, to_wd, to_name in moves.values():
+            if to_wd == -1 or not self._move(from_wd, from_name, to_wd,
+                                             to_name):
+                # Moved out of the tree, or not known: check both names.
+                dirty.setdefault(from_wd, set()).add(from_name)
+                if to_wd != -1:
+                    dirty.setdefault(to_wd, set()).add(to_name)
+
+        if self._overflowed:
+            # Some events were lost, so every watched folder is checked.
+            self._overflowed = False
+            for wd, folder in list(self._folders.items()):
+                names = dirty.setdefault(wd, set())
+                names.update(self._children_of(folder))
+                try:
+                    names.update(os.listdir(self._folder_path(folder)))
+                except OSError:
+                    pass
+
+        for wd, names in dirty.items():
+            for name in names:
+                if wd in self._folders:
+                    self._sync(self._folders[wd], name)
+
+    def _move(self, from_wd, from_name, to_wd, to_name):
+        """Move the subtree <from_name> of the folder watched by <from_wd>
+        to the folder watched by <to_wd>, renaming it to <to_name>.
+
+        Return False if either folder or the subtree is not in the tree.
+
+        @type self: TreeWatcher
+        @type from_wd: int
+        @type from_name: str
+        @type to_wd: int
+        @type to_name: str
+        @rtype: bool
+        """
+        if from_wd not in self._folders or to_wd not in self._folders:
+            return False
+        old_parent = self._folders[from_wd]
+        new_parent = self._folders[to_wd]
+        subtree = self._children_of(old_parent).get(from_name)
+        if subtree is None:
+            return False
+
+        replaced = self._children_of(new_parent).get(to_name)
+        if replaced is not None:
+            self._remove(new_parent, replaced)
+        self._remove(old_parent, subtree, unwatch=False)
+        subtree._root = to_name
+        self._insert(new_parent, subtree)
+        return True
+
+    def _sync(self, folder, name):
+        """Make the subtree <name> of <folder> match the file system.
+
+        @type self: TreeWatcher
+        @type folder: FileSystemTree
+        @type name: str
+        @rtype: None
+        """
+        path = os.path.join(self._folder_path(folder), name)
+        subtree = self._children_of(folder).get(name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            st = None
+        if st is not None and not self._scanner.accepts(path, st):
+            # Left out by the scan rules, like it would be by a new scan.
+            st = None
+
+        if st is None:
+            if subtree is not None:
+                self._remove(folder, subtree)
+            return
+
+        is_dir = stat.S_ISDIR(st.st_mode)
+        if subtree is not None and is_dir != (subtree in self._watches):
+            # A file was replaced by a folder, or the other way around.
+            self._remove(folder, subtree)
+            subtree = None
+
+        if subtree is None:
+            subtree = FileSystemTree(path, self._scanner)
+            self._insert(folder, subtree)
+            if is_dir:
+                self._watch_tree(subtree, path)
+        elif not is_dir:
+            size = self._scanner.file_size(st)
+            if not self._scanner.counts_link(st) and subtree.data_size == 0:
+                # Another hard link to the same file is the one counted, as
+                # in a scan. (The one counted has a size, unless the file
+                # was empty when it was scanned.)
+                size = 0
+            if size != subtree.data_size:
+                subtree._add_to_size(size - subtree.data_size)
+
+    def _insert(self, folder, subtree):
+        """Add <subtree> to the subtrees of <folder>.
+
+        @type self: TreeWatcher
+        @type folder: FileSystemTree
+        @type subtree: FileSystemTree
+        @rtype: None
+        """
+        folder._add_subtree(subtree)
+        if folder in self._children:
+            self._children[folder][subtree._root] = subtree
+
+    def _remove(self, folder, subtree, unwatch=True):
+        """Remove <subtree> from the subtrees of <folder>.
+
+        If <unwatch> is True, the folders inside <subtree> stop being
+        watched (the kernel drops the watch of a deleted folder by itself,
+        but not of one replaced by a rename).
+
+        @type self: TreeWatcher
+        @type folder: FileSystemTree
+        @type subtree: FileSystemTree
+        @type unwatch: bool
+        @rtype: None
+        """
+        subtree._remove_from_parent()
+        if folder in self._children:
+            self._children[folder].pop(subtree._root, None)
+        if unwatch:
+            stack = [subtree]
+            while stack:
+                tree = stack.pop()
+                stack.extend(tree.get_subtrees())
+                wd = self._watches.pop(tree, None)
+                if wd is not None:
+                    del self._folders[wd]
+                    self._children.pop(tree, None)
+                    _libc.inotify_rm_watch(self._fd, wd)
+
+    def _children_of(self, folder):
+        """Return a dict mapping the name of each subtree of <folder> to that
+        subtree.
+
+        @type self: TreeWatcher
+        @type folder: FileSystemTree
+        @rtype: dict[str, FileSystemTree]
+        """
+        children = self._children.get(folder)
+        if children is None or len(children) != len(folder.get_subtrees()):
+            # Not built yet, or the tree was changed by someone else (e.g. a
+            # deletion in the visualiser).
+            children = {subtree.get_root(): subtree
+                        for subtree in folder.get_subtrees()}
+            self._children[folder] = children
+        return children
+
+    def _folder_path(self, folder):
+        """Return the path on disk of the folder tree <folder>.
+
+        @type self: TreeWatcher
+        @type folder: FileSystemTree
+        @rtype: str
+        """
+        names = []
+        tree = folder
+        while tree is not self.tree:
+            names.append(tree.get_root())
+            tree = tree.get_parent_tree()
+        names.reverse()
+        return os.path.join(self._path, *names)
+
+    def _watch_tree(self, tree, path):
+        """Start watching every folder in <tree>, which was built from
+        <path>.
+
+        @type self: TreeWatcher
+        @type tree: FileSystemTree
+        @type path: str
+        @rtype: None
+        """
+        stack = [(tree, path)]
+        while stack:
+            folder, folder_path = stack.pop()
+            if not folder.get_subtrees() and folder.data_size != 0:
+                # A file that is not empty.
+                continue
+            wd = _libc.inotify_add_watch(self._fd, os.fsencode(folder_path),
+                                         WATCH_MASK)
+            if wd < 0:
+                if ctypes.get_errno() in (errno.ENOTDIR, errno.ENOENT):
+                    # An empty file, or gone since it was scanned.
+                    continue
+                _raise_errno()
+            self._folders[wd] = folder
+            self._watches[folder] = wd
+            for subtree in folder.get_subtrees():
+                stack.append((subtree,
+                              os.path.join(folder_path, subtree.get_root())))
+
+
+def _load_libc():
+    """Return the C library with the inotify functions declared, or None
+    if it cannot be loaded.
+
+    @rtype: ctypes.CDLL | None
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                           ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+def _raise_errno():
+    """Raise the OSError for the current value of the C errno.
+
+    @rtype: None
+    """
+    code = ctypes.get_errno()
+    raise OSError(code, os.strerror(code))
+
+
+_libc = _load_libc()